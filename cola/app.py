@@ -42,6 +42,7 @@ from . import icons
 from . import i18n
 from . import qtcompat
 from . import qtutils
+from . import refresh
 from . import resources
 from . import version
 
@@ -152,7 +153,10 @@ class ColaApplication(object):
         qtutils.install()
         icons.install(icon_themes or get_icon_themes())
 
-        fsmonitor.current().files_changed.connect(self._update_files)
+        monitor = fsmonitor.current()
+        monitor.files_changed.connect(self._update_files)
+        monitor.paths_changed.connect(self._update_paths)
+        monitor.git_dir_changed.connect(self._update_scopes)
 
         if gui:
             self._app = current(tuple(argv))
@@ -247,7 +251,15 @@ class ColaApplication(object):
 
     def _update_files(self):
         # Respond to file system updates
-        cmds.do(cmds.Refresh)
+        cmds.do(cmds.RefreshScopes, main.MainModel.scopes_all, monitor=True)
+
+    def _update_paths(self, paths):
+        # Respond to file system updates limited to specific paths
+        cmds.do(cmds.RefreshPaths, paths, monitor=True)
+
+    def _update_scopes(self, scopes):
+        # Respond to changes inside the .git directory
+        cmds.do(cmds.RefreshScopes, scopes, monitor=True)
 
 
 @memoize
@@ -265,7 +277,7 @@ class ColaQApplication(QtWidgets.QApplication):
         if e.type() == QtCore.QEvent.ApplicationActivate:
             cfg = gitcfg.current()
             if cfg.get('cola.refreshonfocus', False):
-                cmds.do(cmds.Refresh)
+                refresh.current().refresh(priority=refresh.BACKGROUND)
         return super(ColaQApplication, self).event(e)
 
     def commitData(self, session_mgr):
@@ -338,11 +350,13 @@ def application_start(context, view):
     view.raise_()
 
     # Scan for the first time
-    runtask = qtutils.RunTask(parent=view)
-    init_update_task(view, runtask, context.model)
+    init_update_task()
 
     # Start the filesystem monitor thread
-    fsmonitor.current().start()
+    monitor = fsmonitor.current()
+    monitor.start()
+    # Refresh only the parts of the index that the monitor saw change
+    context.model.worktree_changes = monitor.changes_since
 
     QtCore.QTimer.singleShot(0, _send_msg)
 
@@ -411,18 +425,17 @@ def new_model(app, repo, prompt=False, settings=None):
     return model
 
 
-def init_update_task(parent, runtask, model):
+def init_update_task():
     """Update the model in the background
 
-    git-cola should startup as quickly as possible.
+    git-cola should startup as quickly as possible, so the status saved
+    by the previous session is shown until the refresh finishes.
 
     """
-
-    def update_status():
-        model.update_status(update_index=True)
-
-    task = qtutils.SimpleTask(parent, update_status)
-    runtask.start(task)
+    model = main.model()
+    if not model.generation:
+        model.load_snapshot()
+    refresh.current().refresh(update_index=True)
 
 
 def _send_msg():
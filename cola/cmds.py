@@ -16,9 +16,11 @@ from . import fsmonitor
 from . import gitcfg
 from . import gitcmds
 from . import icons
+from . import refresh
 from . import utils
 from . import resources
 from .diffparse import DiffParser
+from .git import GIT_COLA_TRACE
 from .git import STDOUT
 from .i18n import N_
 from .interaction import Interaction
@@ -239,7 +241,8 @@ class ApplyDiffSelection(Command):
             core.unlink(tmp_file)
 
         Interaction.log_status(status, out, err)
-        self.model.update_file_status(update_index=True)
+        self.model.update_paths_status([self.model.filename],
+                                       update_index=True)
 
 
 class ApplyPatches(Command):
@@ -269,7 +272,8 @@ class ApplyPatches(Command):
 
         # Display a diffstat
         self.model.set_diff_text(diff_text)
-        self.model.update_file_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
 
         basenames = '\n'.join([os.path.basename(p) for p in self.patches])
         Interaction.information(
@@ -320,7 +324,12 @@ class Checkout(Command):
         status, out, err = self.model.git.checkout(*self.argv)
         Interaction.log_status(status, out, err)
         if self.checkout_branch:
-            self.model.update_status()
+            # "checkout -b" creates a branch
+            self.model.update_scopes([self.model.scope_head,
+                                      self.model.scope_local_branches])
+        elif '--' in self.argv:
+            paths = self.argv[self.argv.index('--') + 1:]
+            self.model.update_paths_status(paths)
         else:
             self.model.update_file_status()
 
@@ -361,7 +370,8 @@ class CherryPick(Command):
 
     def do(self):
         self.model.cherry_pick_list(self.commits)
-        self.model.update_file_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
 
 
 class ResetMode(Command):
@@ -388,7 +398,7 @@ class ResetCommand(ConfirmAction):
         return status, out, err
 
     def success(self):
-        self.model.update_file_status()
+        self.model.update_scopes([self.model.scope_head])
 
     def confirm(self):
         raise NotImplemented('confirm() must be overridden')
@@ -439,6 +449,9 @@ class Commit(ResetMode):
         self.new_commitmsg = ''
 
     def do(self):
+        # Only the staged paths change unless HEAD^ was being compared
+        amending = self.amend or self.old_mode == self.model.mode_amend
+        paths = list(self.model.staged)
         # Create the commit message file
         comment_char = prefs.comment_char()
         msg = self.strip_comments(self.msg, comment_char=comment_char)
@@ -447,16 +460,23 @@ class Commit(ResetMode):
             core.write(tmp_file, msg)
 
             # Run 'git commit'
-            status, out, err = self.model.git.commit(F=tmp_file,
-                                                     v=True,
-                                                     gpg_sign=self.sign,
-                                                     amend=self.amend,
-                                                     no_verify=self.no_verify)
+            with self.model.index_write():
+                status, out, err = self.model.git.commit(
+                    F=tmp_file, v=True, gpg_sign=self.sign,
+                    amend=self.amend, no_verify=self.no_verify)
         finally:
             core.unlink(tmp_file)
 
         if status == 0:
-            ResetMode.do(self)
+            Command.do(self)
+            if amending:
+                self.model.update_scopes([self.model.scope_head,
+                                          self.model.scope_state])
+            else:
+                # The first commit creates the branch
+                self.model.update_scopes([self.model.scope_local_branches,
+                                          self.model.scope_state],
+                                         paths=paths)
             self.model.set_commitmsg(self.new_commitmsg)
             msg = N_('Created commit: %s') % out
         else:
@@ -623,14 +643,14 @@ class RemoveFiles(Command):
         if not files:
             return
 
-        rescan = False
+        removed = []
         bad_filenames = []
         remove = self.remover
         for filename in files:
             if filename:
                 try:
                     remove(filename)
-                    rescan = True
+                    removed.append(filename)
                 except:
                     bad_filenames.append(filename)
 
@@ -639,8 +659,8 @@ class RemoveFiles(Command):
                     N_('Error'),
                     N_('Deleting "%s" failed') % file_summary(files))
 
-        if rescan:
-            self.model.update_file_status()
+        if removed:
+            self.model.update_paths_status(removed)
 
 
 class Delete(RemoveFiles):
@@ -714,7 +734,7 @@ class DeleteRemoteBranch(Command):
         status, out, err = self.model.git.push(self.remote, self.branch,
                                                delete=True)
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_remote_branches])
 
         if status == 0:
             Interaction.information(
@@ -1052,7 +1072,8 @@ class Merge(Command):
                                                 no_commit=no_commit,
                                                 squash=squash)
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
 
 
 class OpenDefaultApp(BaseCommand):
@@ -1117,6 +1138,7 @@ class OpenRepo(Command):
     def do(self):
         git = self.model.git
         old_repo = git.getcwd()
+        self.model.save_snapshot()
         if self.model.set_worktree(self.repo_path):
             fsmonitor.current().stop()
             fsmonitor.current().start()
@@ -1245,7 +1267,8 @@ class Rebase(Command):
                 # as much effort.
                 status, out, err = self.model.git.rebase(*args, _no_win32_startupinfo=True, **kwargs)
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
         return status, out, err
 
 
@@ -1258,7 +1281,7 @@ class RebaseEditTodo(Command):
                 GIT_XBASE_ACTION=N_('Save')):
             status, out, err = self.model.git.rebase(edit_todo=True)
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_state])
         return status, out, err
 
 
@@ -1271,7 +1294,8 @@ class RebaseContinue(Command):
                 GIT_XBASE_ACTION=N_('Rebase')):
             status, out, err = self.model.git.rebase('--continue')
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
         return status, out, err
 
 
@@ -1284,7 +1308,8 @@ class RebaseSkip(Command):
                 GIT_XBASE_ACTION=N_('Rebase')):
             status, out, err = self.model.git.rebase(skip=True)
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
         return status, out, err
 
 
@@ -1293,14 +1318,15 @@ class RebaseAbort(Command):
     def do(self):
         status, out, err = self.model.git.rebase(abort=True)
         Interaction.log_status(status, out, err)
-        self.model.update_status()
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_state])
 
 
 class Rescan(Command):
     """Rescan for changes"""
 
     def do(self):
-        self.model.update_status()
+        refresh.current().refresh(update_index=False)
 
 
 class Refresh(Command):
@@ -1311,8 +1337,33 @@ class Refresh(Command):
         return N_('Refresh')
 
     def do(self):
-        self.model.update_status(update_index=True)
-        fsmonitor.current().refresh()
+        refresh.current().refresh(update_index=True)
+
+
+class RefreshPaths(Command):
+    """Refresh the status of specific paths, e.g. from the fsmonitor"""
+
+    def __init__(self, paths, monitor=False):
+        Command.__init__(self)
+        self.paths = paths
+        self.monitor = monitor
+
+    def do(self):
+        refresh.current().request(paths=self.paths, update_index=True,
+                                  monitor=self.monitor)
+
+
+class RefreshScopes(Command):
+    """Refresh the parts of the model affected by .git directory changes"""
+
+    def __init__(self, scopes, monitor=False):
+        Command.__init__(self)
+        self.scopes = scopes
+        self.monitor = monitor
+
+    def do(self):
+        refresh.current().request(scopes=self.scopes, update_index=True,
+                                  monitor=self.monitor)
 
 
 class RevertEditsCommand(ConfirmAction):
@@ -1321,6 +1372,7 @@ class RevertEditsCommand(ConfirmAction):
         ConfirmAction.__init__(self)
         self.model = main.model()
         self.icon = icons.undo()
+        self.paths = []
 
     def ok_to_run(self):
         return self.model.undoable()
@@ -1346,10 +1398,11 @@ class RevertEditsCommand(ConfirmAction):
     def action(self):
         git = self.model.git
         checkout_args = self.checkout_args()
+        self.paths = checkout_args[checkout_args.index('--') + 1:]
         return git.checkout(*checkout_args)
 
     def success(self):
-        self.model.update_file_status()
+        self.model.update_paths_status(self.paths)
 
 
 class RevertUnstagedEdits(RevertEditsCommand):
@@ -1737,7 +1790,7 @@ class Tag(Command):
 
         Interaction.log_status(status, log_msg, err)
         if status == 0:
-            self.model.update_status()
+            self.model.update_scopes([self.model.scope_tags])
         return (status, output, err)
 
 
@@ -1911,12 +1964,38 @@ def do(cls, *args, **opts):
 def do_cmd(cmd):
     if hasattr(cmd, 'DISABLED') and cmd.DISABLED:
         return None
+    # Model updates batch their own notifications, see apply_update()
+    observables = (main.model(), selection.selection_model())
+    if GIT_COLA_TRACE:
+        counts = notification_counts(observables)
     try:
         return cmd.do()
     except Exception as e:
         msg, details = utils.format_exception(e)
         Interaction.critical(N_('Error'), message=msg, details=details)
         return None
+    finally:
+        if GIT_COLA_TRACE:
+            trace_notifications(cmd, counts,
+                                notification_counts(observables))
+
+
+def notification_counts(observables):
+    """Return the combined notification counts of several observables"""
+    counts = {}
+    for observable in observables:
+        for message, count in observable.notification_counts.items():
+            counts[message] = counts.get(message, 0) + count
+    return counts
+
+
+def trace_notifications(cmd, before, after):
+    """Report the notifications that a command caused"""
+    delivered = ['%s=%d' % (message, count - before.get(message, 0))
+                 for message, count in sorted(after.items())
+                 if count != before.get(message, 0)]
+    if delivered:
+        core.stderr('%s: %s' % (cmd.__class__.__name__, ' '.join(delivered)))
 
 
 def difftool_run():
@@ -192,20 +192,23 @@ def prep_for_subprocess(cmd, shell=False):
 
 
 @interruptable
-def communicate(proc):
-    return proc.communicate()
+def communicate(proc, input=None):
+    return proc.communicate(input)
 
 
-def run_command(cmd, encoding=None, *args, **kwargs):
+def run_command(cmd, encoding=None, input=None, *args, **kwargs):
     """Run the given command to completion, and return its results.
 
     This provides a simpler interface to the subprocess module.
     The results are formatted as a 3-tuple: (exit_code, output, errors)
+    `input` is written to the command's stdin when specified.
     The other arguments are passed on to start_command().
 
     """
     process = start_command(cmd, *args, **kwargs)
-    (output, errors) = communicate(process)
+    if input is not None:
+        input = encode(input, encoding=encoding)
+    (output, errors) = communicate(process, input)
     output = decode(output, encoding=encoding)
     errors = decode(errors, encoding=encoding)
     exit_code = process.returncode
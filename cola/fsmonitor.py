@@ -1,14 +1,18 @@
 # Copyright (c) 2008 David Aguilar
 # Copyright (c) 2015 Daniel Harding
 """Provides an filesystem monitoring for Linux (via inotify) and for Windows
-(via pywin32 and the ReadDirectoryChanges function)"""
+(via pywin32 and the ReadDirectoryChanges function), and a portable polling
+monitor for file systems that do not deliver change events"""
 from __future__ import division, absolute_import, unicode_literals
 
 import errno
 import os
 import os.path
 import select
-from threading import Lock
+import stat
+import time
+from multiprocessing.pool import ThreadPool
+from threading import Event, Lock
 
 from . import utils
 from . import version
@@ -44,16 +48,34 @@ from .compat import bchr
 from .git import git
 from .i18n import N_
 from .interaction import Interaction
+from .models.main import MainModel
 
 
 class _Monitor(QtCore.QObject):
 
+    #: Emitted when the whole repository should be rescanned.
     files_changed = Signal()
+    #: Emitted with a set of worktree-relative paths that have changed.
+    paths_changed = Signal(object)
+    #: Emitted with the set of MainModel scopes affected by changes
+    #: inside the .git directory.
+    git_dir_changed = Signal(object)
+
+    #: The number of changed paths that changes_since() remembers.  Older
+    #: changes are forgotten and reported as unknown.
+    MAX_CHANGES = 1000
 
     def __init__(self, thread_class):
         QtCore.QObject.__init__(self)
         self._thread_class = thread_class
         self._thread = None
+        #: Incremented for every batch of worktree changes
+        self.generation = 0
+        self._changes_lock = Lock()
+        self._changes = []  # (generation, paths) batches
+        self._change_count = 0
+        # Changes up to and including this generation are unknown
+        self._horizon = 0
 
     def start(self):
         if self._thread_class is not None:
@@ -72,57 +94,310 @@ class _Monitor(QtCore.QObject):
         if self._thread is not None:
             self._thread.refresh()
 
+    def watch_count(self):
+        """Return the number of directories being watched"""
+        if self._thread is None:
+            return 0
+        return self._thread.watch_count()
+
+    def refresh_finished(self, elapsed, count=1):
+        """Report that the refresh for `count` signals took elapsed seconds"""
+        if self._thread is not None:
+            self._thread.refresh_finished(elapsed, count=count)
+
+    def record_changes(self, paths):
+        """Record a batch of changed worktree paths
+
+        `paths` is None when the changes are not known, e.g. after an event
+        queue overflow.
+
+        """
+        with self._changes_lock:
+            self.generation += 1
+            if paths is None:
+                self._forget(self.generation)
+                return
+            if not paths:
+                return
+            self._changes.append((self.generation, paths))
+            self._change_count += len(paths)
+            while self._change_count > self.MAX_CHANGES:
+                generation, old_paths = self._changes.pop(0)
+                self._change_count -= len(old_paths)
+                self._horizon = generation
+
+    def _forget(self, generation):
+        self._changes = []
+        self._change_count = 0
+        self._horizon = generation
+
+    def changes_since(self, generation):
+        """Return (generation, paths) for the worktree changes since then
+
+        The returned generation is passed to the next call.  The paths are
+        None when the changes are not known, e.g. for the first call, when
+        the monitor is not running, when it cannot watch every tracked
+        directory or when it has seen changes that are still waiting to be
+        reported.
+
+        """
+        with self._changes_lock:
+            current = self.generation
+            thread = self._thread
+            if (generation is None or generation < self._horizon or
+                    thread is None or not thread.ready or
+                    not thread.complete or thread.has_pending_changes()):
+                return (current, None)
+            paths = set()
+            for batch_generation, batch in self._changes:
+                if batch_generation > generation:
+                    paths.update(batch)
+            return (current, paths)
+
 
 class _BaseThread(QtCore.QThread):
-    #: The delay, in milliseconds, between detecting file system modification
-    #: and triggering the 'files_changed' signal, to coalesce multiple
-    #: modifications into a single signal.
-    _NOTIFICATION_DELAY = 888
+    #: The shortest quiet period, in milliseconds, between the last detected
+    #: modification and notifying observers.  Isolated changes, e.g. saving
+    #: a single file, are reported after this delay.
+    _MIN_DELAY = 100
+    #: The longest quiet period, in milliseconds, used during event storms.
+    _MAX_DELAY = 2000
+    #: The quiet period grows by _MIN_DELAY for every _RATE_STEP events per
+    #: second, so that bursts such as "make" or "git checkout" coalesce.
+    _RATE_STEP = 50
+    #: Observers are notified at most this many milliseconds after the first
+    #: pending modification even if modifications keep arriving.
+    _MAX_LATENCY = 5000
+    #: How long, in milliseconds, to wait for an observer to report that a
+    #: refresh has finished before assuming that the report was lost.
+    _IN_FLIGHT_TIMEOUT = 30000
+
+    #: The maximum number of changed paths reported through 'paths_changed'.
+    #: Larger change sets trigger a full rescan through 'files_changed'
+    #: because pathspec-limited queries stop paying off.
+    _MAX_CHANGED_PATHS = 128
 
     def __init__(self, monitor):
         QtCore.QThread.__init__(self)
         self._monitor = monitor
         self._running = True
+        self._worktree = None
         self._use_check_ignore = version.check('check-ignore',
                                                version.git_version())
+        #: True once the initial watches are in place
+        self.ready = False
+        #: False when some tracked directories are not being watched
+        self.complete = True
         self._force_notify = False
         self._file_paths = set()
+        self._git_dir_paths = set()
+        # Event rate statistics for the pending modifications
+        self._first_event_time = None
+        self._last_event_time = None
+        self._event_count = 0
+        # Refreshes that were triggered by our signals and have not finished
+        self._flight_lock = Lock()
+        self._refreshes_in_flight = 0
+        self._in_flight_since = 0.0
+        self._in_flight_duration = 0.0
+        self._refresh_duration = 0.0
+        self._refresh_end_time = 0.0
 
     @property
     def _pending(self):
-        return self._force_notify or self._file_paths
+        return self._force_notify or self._file_paths or self._git_dir_paths
+
+    def has_pending_changes(self):
+        """Are there worktree changes that have not been recorded yet?
+
+        Changes are recorded when they are reported, after the quiet
+        period that coalesces them.
+
+        """
+        return bool(self._force_notify or self._file_paths)
 
     def refresh(self):
         """Do any housekeeping necessary in response to repository changes."""
         pass
 
+    def watch_count(self):
+        """Return the number of directories being watched"""
+        return 0
+
+    def refresh_finished(self, elapsed, count=1):
+        """Record how long the refresh for `count` of our signals took
+
+        Signals that are answered by a single refresh are reported together.
+        This is called from the GUI thread.
+
+        """
+        with self._flight_lock:
+            if not self._refreshes_in_flight:
+                return
+            self._refreshes_in_flight = max(0,
+                                            self._refreshes_in_flight - count)
+            self._in_flight_duration += elapsed
+            if not self._refreshes_in_flight:
+                self._refresh_duration = self._in_flight_duration
+                self._refresh_end_time = time.time()
+
+    def _record_events(self, count):
+        """Update the event rate statistics with newly detected events"""
+        if not count:
+            return
+        now = time.time()
+        if self._first_event_time is None:
+            self._first_event_time = now
+            self._event_count = 0
+        self._last_event_time = now
+        self._event_count += count
+
+    def _in_flight(self):
+        """Return True while a refresh triggered by us is still running"""
+        with self._flight_lock:
+            if (self._refreshes_in_flight and
+                    time.time() - self._in_flight_since >
+                    self._IN_FLIGHT_TIMEOUT / 1000.0):
+                self._refreshes_in_flight = 0
+            return bool(self._refreshes_in_flight)
+
+    def _notify_time(self, quiet=True):
+        """Return the time at which the pending changes are due
+
+        The quiet period grows with the event rate and is bounded by
+        _MAX_LATENCY.  After an expensive refresh the GUI is left alone for
+        at least as long as that refresh took.
+
+        """
+        now = time.time()
+        first = self._first_event_time
+        if first is None:
+            first = now
+        last = self._last_event_time or first
+        notify_time = now
+        if quiet:
+            rate = self._event_count / max(last - first, 1.0)
+            delay = min(self._MAX_DELAY,
+                        self._MIN_DELAY * (1.0 + rate / self._RATE_STEP))
+            notify_time = min(last + delay / 1000.0,
+                              first + self._MAX_LATENCY / 1000.0)
+        return max(notify_time,
+                   self._refresh_end_time + self._refresh_duration)
+
+    def _timeout(self):
+        """Return the milliseconds until pending changes are due, or None"""
+        if not self._pending:
+            return None
+        if self._in_flight():
+            return self._MIN_DELAY
+        return max(0, int((self._notify_time() - time.time()) * 1000))
+
+    def _notify_due(self, quiet=True):
+        """Return True when the pending changes should be reported now"""
+        return bool(self._pending and not self._in_flight() and
+                    time.time() >= self._notify_time(quiet=quiet))
+
+    def _emit(self, signals):
+        """Emit (signal, args) pairs and wait for their refreshes"""
+        if not signals:
+            return
+        with self._flight_lock:
+            self._refreshes_in_flight = len(signals)
+            self._in_flight_since = time.time()
+            self._in_flight_duration = 0.0
+        for signal, args in signals:
+            signal.emit(*args)
+
     def notify(self):
         """Notifies all observers"""
         do_notify = False
+        paths = set()
         if self._force_notify:
             do_notify = True
-        elif self._file_paths:
-            proc = core.start_command(['git', 'check-ignore', '--verbose',
-                                       '--non-matching', '-z', '--stdin'])
-            path_list = bchr(0).join(core.encode(path)
-                                     for path in self._file_paths)
-            out, err = proc.communicate(path_list)
-            if proc.returncode:
+        elif self._file_paths and self._use_check_ignore:
+            paths = self._filter_ignored(self._file_paths)
+            if paths is None:
                 do_notify = True
-            else:
-                # Each output record is four fields separated by NULL
-                # characters (records are also separated by NULL characters):
-                # <source> <NULL> <linenum> <NULL> <pattern> <NULL> <pathname>
-                # For paths which are not ignored, all fields will be empty
-                # except for <pathname>.  So to see if we have any non-ignored
-                # files, we simply check every fourth field to see if any of
-                # them are empty.
-                source_fields = out.split(bchr(0))[0:-1:4]
-                do_notify = not all(source_fields)
+        elif self._file_paths:
+            paths = self._file_paths
+        scopes = set()
+        if not do_notify and self._git_dir_paths:
+            scopes = git_dir_scopes(self._git_dir_paths)
         self._force_notify = False
         self._file_paths = set()
+        self._git_dir_paths = set()
+        self._first_event_time = None
+        self._last_event_time = None
+        self._event_count = 0
+        if not do_notify and paths:
+            paths = self._relative_paths(paths)
+            if paths is None:
+                do_notify = True
+        # Recorded before the paths are dropped below because refreshing
+        # the index needs every changed path.
         if do_notify:
-            self._monitor.files_changed.emit()
+            self._monitor.record_changes(None)
+        else:
+            self._monitor.record_changes(paths)
+        if scopes & _FILE_SCOPES:
+            # The file lists are rescanned as a whole
+            paths = set()
+        if paths and len(paths) > self._MAX_CHANGED_PATHS:
+            do_notify = True
+        signals = []
+        if do_notify:
+            signals.append((self._monitor.files_changed, ()))
+        else:
+            if scopes:
+                signals.append((self._monitor.git_dir_changed, (scopes,)))
+            if paths:
+                signals.append((self._monitor.paths_changed, (paths,)))
+        self._emit(signals)
+
+    def _started(self):
+        """Record that the initial watches are in place
+
+        Changes made before this point were not seen, so they are recorded
+        as unknown.
+
+        """
+        self._monitor.record_changes(None)
+        self.ready = True
+
+    def _filter_ignored(self, paths):
+        """Return the paths not ignored by git, or None on error"""
+        proc = core.start_command(['git', 'check-ignore', '--verbose',
+                                   '--non-matching', '-z', '--stdin'])
+        path_list = bchr(0).join(core.encode(path) for path in paths)
+        out, err = proc.communicate(path_list)
+        # check-ignore exits with 1 when none of the paths are ignored
+        if proc.returncode not in (0, 1):
+            return None
+        # Each output record is four fields separated by NULL
+        # characters (records are also separated by NULL characters):
+        # <source> <NULL> <linenum> <NULL> <pattern> <NULL> <pathname>
+        # For paths which are not ignored, all fields will be empty
+        # except for <pathname>.  So to find the non-ignored files,
+        # we collect every <pathname> whose <source> field is empty.
+        result = set()
+        fields = out.split(bchr(0))
+        for source, path in zip(fields[0:-1:4], fields[3:-1:4]):
+            if not source:
+                result.add(core.decode(path))
+        return result
+
+    def _relative_paths(self, paths):
+        """Return worktree-relative paths, or None if a path is outside"""
+        if self._worktree is None:
+            return None
+        prefix = self._worktree + '/'
+        prefix_len = len(prefix)
+        result = set()
+        for path in paths:
+            if not path.startswith(prefix):
+                return None
+            result.add(path[prefix_len:])
+        return result
 
     @staticmethod
     def _log_enabled_message():
@@ -147,6 +422,10 @@ if AVAILABLE == 'inotify':
                 inotify.IN_EXCL_UNLINK |
                 inotify.IN_ONLYDIR
         )
+        #: Directory events that require a new watch
+        _DIR_ADDED_MASK = inotify.IN_CREATE | inotify.IN_MOVED_TO
+        #: Directory events that make existing watches obsolete
+        _DIR_REMOVED_MASK = inotify.IN_DELETE | inotify.IN_MOVED_FROM
 
         def __init__(self, monitor):
             _BaseThread.__init__(self, monitor)
@@ -155,21 +434,35 @@ if AVAILABLE == 'inotify':
                 worktree = core.abspath(worktree)
             self._worktree = worktree
             self._git_dir = git.git_path()
+            self._refs_dir = os.path.join(self._git_dir, 'refs')
             self._lock = Lock()
             self._inotify_fd = None
             self._pipe_r = None
             self._pipe_w = None
+            self._refresh_requested = False
             self._worktree_wd_to_path_map = {}
             self._worktree_path_to_wd_map = {}
             self._git_dir_wd_to_path_map = {}
             self._git_dir_path_to_wd_map = {}
-            self._git_dir_wd = None
+            self._new_dirs = set()
+            # Worktree directories are ranked by their most recent activity
+            # when the watch budget forces us to drop some of them.
+            self._activity = {}
+            self._tick = 0
+            self._watch_budget = _max_user_watches()
+            self._watch_limit_logged = False
+            cfg = gitcfg.current()
+            self._watch_untracked = cfg.get('cola.inotifyuntracked', False)
 
-        @staticmethod
-        def _log_out_of_wds_message():
-            msg = N_('File system change monitoring: disabled because the'
-                     ' limit on the total number of inotify watches was'
-                     ' reached.  You may be able to increase the limit on'
+        def _log_watch_limit_message(self):
+            self.complete = False
+            if self._watch_limit_logged:
+                return
+            self._watch_limit_logged = True
+            msg = N_('File system change monitoring: the limit on the total'
+                     ' number of inotify watches was reached, so changes in'
+                     ' the least recently active directories will not be'
+                     ' detected.  You may be able to increase the limit on'
                      ' the number of watches by running:\n'
                      '\n'
                      '    echo fs.inotify.max_user_watches=100000 |'
@@ -177,6 +470,10 @@ if AVAILABLE == 'inotify':
                      ' sudo sysctl -p\n')
             Interaction.safe_log(msg)
 
+        def watch_count(self):
+            return (len(self._worktree_wd_to_path_map) +
+                    len(self._git_dir_wd_to_path_map))
+
         def run(self):
             try:
                 with self._lock:
@@ -187,17 +484,14 @@ if AVAILABLE == 'inotify':
                 poll_obj.register(self._inotify_fd, select.POLLIN)
                 poll_obj.register(self._pipe_r, select.POLLIN)
 
-                self.refresh()
+                self._refresh()
 
                 self._log_enabled_message()
+                self._started()
 
                 while self._running:
-                    if self._pending:
-                        timeout = self._NOTIFICATION_DELAY
-                    else:
-                        timeout = None
                     try:
-                        events = poll_obj.poll(timeout)
+                        events = poll_obj.poll(self._timeout())
                     except OSError as e:
                         if e.errno == errno.EINTR:
                             continue
@@ -208,12 +502,17 @@ if AVAILABLE == 'inotify':
                     else:
                         if not self._running:
                             break
-                        elif not events:
+                        for fd, event in events:
+                            if fd == self._inotify_fd:
+                                self._handle_events()
+                            elif fd == self._pipe_r:
+                                os.read(self._pipe_r, 4096)
+                        if self._refresh_requested:
+                            self._refresh_requested = False
+                            self._refresh()
+                        if self._notify_due():
+                            self._watch_new_dirs()
                             self.notify()
-                        else:
-                            for fd, event in events:
-                                if fd == self._inotify_fd:
-                                    self._handle_events()
             finally:
                 with self._lock:
                     if self._inotify_fd is not None:
@@ -226,98 +525,239 @@ if AVAILABLE == 'inotify':
                         self._pipe_w = None
 
         def refresh(self):
+            """Ask the monitor thread to update its watches"""
             with self._lock:
-                if self._inotify_fd is None:
+                if self._pipe_w is None:
                     return
-                try:
-                    if self._worktree is not None:
-                        tracked_dirs = set(
-                                os.path.dirname(os.path.join(self._worktree,
+                self._refresh_requested = True
+                os.write(self._pipe_w, bchr(0))
+
+        def _refresh(self):
+            """Add watches for directories that are not being watched yet
+
+            Watches for directories that disappear are dropped as their
+            removal is reported, so existing watches are left alone.
+
+            """
+            git_dirs = set()
+            git_dirs.add(self._git_dir)
+            for dirpath, dirnames, filenames in core.walk(self._refs_dir):
+                git_dirs.add(core.decode(dirpath))
+            for path in git_dirs - set(self._git_dir_path_to_wd_map):
+                self._add_watch(path, self._git_dir_wd_to_path_map,
+                                self._git_dir_path_to_wd_map)
+
+            if self._worktree is None:
+                return
+            paths = gitcmds.tracked_files()
+            if self._watch_untracked:
+                paths.extend(gitcmds.untracked_files())
+            worktree_dirs = set(os.path.dirname(os.path.join(self._worktree,
                                                              path))
-                                for path in gitcmds.tracked_files())
-                        self._refresh_watches(tracked_dirs,
-                                              self._worktree_wd_to_path_map,
-                                              self._worktree_path_to_wd_map)
-                    git_dirs = set()
-                    git_dirs.add(self._git_dir)
-                    for dirpath, dirnames, filenames in core.walk(
-                            os.path.join(self._git_dir, 'refs')):
-                        git_dirs.add(dirpath)
-                    self._refresh_watches(git_dirs,
-                                          self._git_dir_wd_to_path_map,
-                                          self._git_dir_path_to_wd_map)
-                    self._git_dir_wd = \
-                            self._git_dir_path_to_wd_map[self._git_dir]
-                except OSError as e:
-                    if e.errno == errno.ENOSPC:
-                        self._log_out_of_wds_message()
-                        self._running = False
-                    else:
-                        raise
-
-        def _refresh_watches(self, paths_to_watch, wd_to_path_map,
-                             path_to_wd_map):
-            watched_paths = set(path_to_wd_map)
-            for path in watched_paths - paths_to_watch:
-                wd = path_to_wd_map.pop(path)
-                wd_to_path_map.pop(wd)
-                try:
-                    inotify.rm_watch(self._inotify_fd, wd)
-                except OSError as e:
-                    if e.errno == errno.EINVAL:
-                        # This error can occur if the target of the wd was
-                        # removed on the filesystem before we call
-                        # inotify.rm_watch() so ignore it.
-                        pass
-                    else:
-                        raise
-            for path in paths_to_watch - watched_paths:
-                try:
-                    wd = inotify.add_watch(self._inotify_fd, core.encode(path),
-                                           self._ADD_MASK)
-                except OSError as e:
-                    if e.errno in (errno.ENOENT, errno.ENOTDIR):
-                        # These two errors should only occur as a result of
-                        # race conditions:  the first if the directory
-                        # referenced by path was removed or renamed before the
-                        # call to inotify.add_watch(); the second if the
-                        # directory referenced by path was replaced with a file
-                        # before the call to inotify.add_watch().  Therefore we
-                        # simply ignore them.
-                        pass
-                    else:
-                        raise
+                                for path in paths)
+            worktree_dirs.add(self._worktree)
+            new_dirs = worktree_dirs - set(self._worktree_path_to_wd_map)
+            if not new_dirs:
+                return
+            available = self._available_watches()
+            if available is not None and len(new_dirs) > available:
+                # Shallow directories cover the most commonly edited files
+                new_dirs = sorted(new_dirs, key=lambda x: x.count('/'))
+                new_dirs = new_dirs[:available]
+                self._log_watch_limit_message()
+            for path in new_dirs:
+                if not self._add_worktree_watch(path):
+                    break
+
+        def _available_watches(self):
+            """Return the number of watches that can be added, if limited"""
+            if self._watch_budget is None:
+                return None
+            return max(0, self._watch_budget - self.watch_count())
+
+        def _add_worktree_watch(self, path):
+            result = self._add_watch(path, self._worktree_wd_to_path_map,
+                                     self._worktree_path_to_wd_map)
+            if result:
+                self._activity[path] = self._tick
+            return result
+
+        def _add_watch(self, path, wd_to_path_map, path_to_wd_map):
+            """Add a watch for path, returns False when it cannot be added"""
+            try:
+                wd = inotify.add_watch(self._inotify_fd, core.encode(path),
+                                       self._ADD_MASK)
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    # These two errors should only occur as a result of
+                    # race conditions:  the first if the directory
+                    # referenced by path was removed or renamed before the
+                    # call to inotify.add_watch(); the second if the
+                    # directory referenced by path was replaced with a file
+                    # before the call to inotify.add_watch().  Therefore we
+                    # simply ignore them.
+                    return False
+                elif e.errno == errno.ENOSPC:
+                    # Other programs share the per-user limit, so the
+                    # effective budget is whatever we hold right now.
+                    self._watch_budget = self.watch_count()
+                    self._log_watch_limit_message()
+                    return False
+                else:
+                    raise
+            wd_to_path_map[wd] = path
+            path_to_wd_map[path] = wd
+            return True
+
+        def _remove_watch(self, path, wd_to_path_map, path_to_wd_map):
+            wd = path_to_wd_map.pop(path, None)
+            if wd is None:
+                return
+            wd_to_path_map.pop(wd, None)
+            self._activity.pop(path, None)
+            try:
+                inotify.rm_watch(self._inotify_fd, wd)
+            except OSError as e:
+                if e.errno == errno.EINVAL:
+                    # This error can occur if the target of the wd was
+                    # removed on the filesystem before we call
+                    # inotify.rm_watch() so ignore it.
+                    pass
                 else:
-                    wd_to_path_map[wd] = path
-                    path_to_wd_map[path] = wd
+                    raise
+
+        def _remove_watches(self, path, wd_to_path_map, path_to_wd_map,
+                            recursive):
+            """Remove the watch for path and optionally its subdirectories"""
+            self._remove_watch(path, wd_to_path_map, path_to_wd_map)
+            if not recursive:
+                return
+            prefix = path + '/'
+            for subdir in [p for p in path_to_wd_map if p.startswith(prefix)]:
+                self._remove_watch(subdir, wd_to_path_map, path_to_wd_map)
+
+        def _forget_watch(self, wd):
+            """Drop a watch that was removed by the kernel"""
+            for wd_to_path_map, path_to_wd_map in (
+                    (self._worktree_wd_to_path_map,
+                     self._worktree_path_to_wd_map),
+                    (self._git_dir_wd_to_path_map,
+                     self._git_dir_path_to_wd_map)):
+                path = wd_to_path_map.pop(wd, None)
+                if path is not None:
+                    path_to_wd_map.pop(path, None)
+                    self._activity.pop(path, None)
+                    return
+
+        def _evict_watches(self, count):
+            """Drop up to count of the least recently active worktree watches
+
+            Returns the number of watches that were removed.
+
+            """
+            activity = self._activity
+            candidates = [path for path in self._worktree_path_to_wd_map
+                          if path != self._worktree]
+            candidates.sort(key=lambda x: (activity.get(x, -1),
+                                           -x.count('/')))
+            evicted = candidates[:count]
+            for path in evicted:
+                self._remove_watch(path, self._worktree_wd_to_path_map,
+                                   self._worktree_path_to_wd_map)
+            return len(evicted)
+
+        def _watch_new_dirs(self):
+            """Watch directories created since the last notification
+
+            The new directories themselves are reported as changed, which
+            covers files created before their watches were in place.
+
+            """
+            dirs = self._new_dirs
+            self._new_dirs = set()
+            while dirs:
+                if self._use_check_ignore:
+                    filtered = self._filter_ignored(dirs)
+                    if filtered is not None:
+                        dirs = filtered
+                dirs = [path for path in dirs
+                        if path not in self._worktree_path_to_wd_map]
+                available = self._available_watches()
+                if available is not None and len(dirs) > available:
+                    # Recently created directories are the active ones
+                    available += self._evict_watches(len(dirs) - available)
+                    dirs = dirs[:available]
+                    self._log_watch_limit_message()
+                subdirs = set()
+                for path in dirs:
+                    if not self._add_worktree_watch(path):
+                        continue
+                    for dirpath, dirnames, filenames in core.walk(path):
+                        for name in dirnames:
+                            subdirs.add(os.path.join(path, core.decode(name)))
+                        break
+                dirs = subdirs
+
+        def _watch_new_git_dirs(self, path):
+            """Watch a new directory below .git/refs and its subdirectories"""
+            for dirpath, dirnames, filenames in core.walk(path):
+                dirpath = core.decode(dirpath)
+                if dirpath not in self._git_dir_path_to_wd_map:
+                    self._add_watch(dirpath, self._git_dir_wd_to_path_map,
+                                    self._git_dir_path_to_wd_map)
 
         def _check_event(self, wd, mask, name):
             if mask & inotify.IN_Q_OVERFLOW:
+                # Directory creation events may have been lost as well
                 self._force_notify = True
+                self._refresh_requested = True
+            elif mask & inotify.IN_IGNORED:
+                self._forget_watch(wd)
             elif not mask & self._TRIGGER_MASK:
                 pass
-            elif mask & inotify.IN_ISDIR:
-                pass
             elif wd in self._worktree_wd_to_path_map:
-                if self._use_check_ignore:
-                    self._file_paths.add(
-                            os.path.join(self._worktree_wd_to_path_map[wd],
-                                         core.decode(name)))
-                else:
-                    self._force_notify = True
-            elif wd == self._git_dir_wd:
-                name = core.decode(name)
-                if name == 'HEAD' or name == 'index':
-                    self._force_notify = True
-            elif (wd in self._git_dir_wd_to_path_map
-                    and not core.decode(name).endswith('.lock')):
-                self._force_notify = True
+                dirpath = self._worktree_wd_to_path_map[wd]
+                path = os.path.join(dirpath, core.decode(name))
+                self._activity[dirpath] = self._tick
+                if not mask & inotify.IN_ISDIR:
+                    self._file_paths.add(path)
+                elif mask & self._DIR_ADDED_MASK:
+                    self._new_dirs.add(path)
+                    self._file_paths.add(path)
+                elif mask & self._DIR_REMOVED_MASK:
+                    # Deleted directories are reported bottom-up, so only
+                    # a rename can leave watches on subdirectories behind.
+                    recursive = bool(mask & inotify.IN_MOVED_FROM)
+                    self._remove_watches(path, self._worktree_wd_to_path_map,
+                                         self._worktree_path_to_wd_map,
+                                         recursive)
+                    self._new_dirs.discard(path)
+                    self._file_paths.add(path)
+            elif wd in self._git_dir_wd_to_path_map:
+                # Directory events are interesting here, e.g. "rebase-merge"
+                # or a new "refs/remotes/<remote>" directory.
+                dirpath = self._git_dir_wd_to_path_map[wd]
+                path = os.path.join(dirpath, core.decode(name))
+                relpath = os.path.relpath(path, self._git_dir)
+                self._git_dir_paths.add(relpath.replace(os.sep, '/'))
+                if (mask & inotify.IN_ISDIR and
+                        (path + '/').startswith(self._refs_dir + '/')):
+                    if mask & self._DIR_ADDED_MASK:
+                        self._watch_new_git_dirs(path)
+                    elif mask & inotify.IN_MOVED_FROM:
+                        self._remove_watches(path,
+                                             self._git_dir_wd_to_path_map,
+                                             self._git_dir_path_to_wd_map,
+                                             True)
 
         def _handle_events(self):
+            self._tick += 1
+            count = 0
             for wd, mask, cookie, name in \
                     inotify.read_events(self._inotify_fd):
-                if not self._force_notify:
-                    self._check_event(wd, mask, name)
+                self._check_event(wd, mask, name)
+                count += 1
+            self._record_events(count)
 
         def stop(self):
             self._running = False
@@ -326,6 +766,14 @@ if AVAILABLE == 'inotify':
                     os.write(self._pipe_w, bchr(0))
             self.wait()
 
+    def _max_user_watches():
+        """Return the per-user inotify watch limit, or None if unknown"""
+        try:
+            with open('/proc/sys/fs/inotify/max_user_watches') as f:
+                return int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            return None
+
 
 if AVAILABLE == 'pywin32':
 
@@ -429,20 +877,20 @@ if AVAILABLE == 'pywin32':
                 events.append(self._git_dir_watch.event)
 
                 self._log_enabled_message()
+                self._started()
 
                 while self._running:
-                    if self._pending:
-                        timeout = self._NOTIFICATION_DELAY
-                    else:
+                    timeout = self._timeout()
+                    if timeout is None:
                         timeout = win32event.INFINITE
                     rc = win32event.WaitForMultipleObjects(events, False,
                                                            timeout)
                     if not self._running:
                         break
-                    elif rc == win32event.WAIT_TIMEOUT:
-                        self.notify()
-                    else:
+                    elif rc != win32event.WAIT_TIMEOUT:
                         self._handle_results()
+                    if self._notify_due():
+                        self.notify()
             finally:
                 with self._stop_event_lock:
                     if self._stop_event is not None:
@@ -454,34 +902,31 @@ if AVAILABLE == 'pywin32':
                     self._git_dir_watch.close()
 
         def _handle_results(self):
+            count = 0
             if self._worktree_watch is not None:
                 for action, path in self._worktree_watch.read():
+                    count += 1
                     if not self._running:
                         break
                     if self._force_notify:
                         continue
-                    path = self._worktree + '/' + self._transform_path(path)
-                    if (path != self._git_dir
-                        and not path.startswith(self._git_dir + '/')
+                    # Keep the original case of the worktree-relative part
+                    # so that the reported paths match git's output.
+                    path = self._worktree + '/' + path.replace('\\', '/')
+                    transformed = self._transform_path(path)
+                    if (transformed != self._git_dir
+                        and not transformed.startswith(self._git_dir + '/')
                         and not os.path.isdir(path)
                        ):
-                        if self._use_check_ignore:
-                            self._file_paths.add(path)
-                        else:
-                            self._force_notify = True
+                        self._file_paths.add(path)
             for action, path in self._git_dir_watch.read():
+                count += 1
                 if not self._running:
                     break
                 if self._force_notify:
                     continue
-                path = self._transform_path(path)
-                if path.endswith('.lock'):
-                    continue
-                if (path == 'head'
-                    or path == 'index'
-                    or path.startswith('refs/')
-                   ):
-                    self._force_notify = True
+                self._git_dir_paths.add(path.replace('\\', '/'))
+            self._record_events(count)
 
         def stop(self):
             self._running = False
@@ -491,6 +936,272 @@ if AVAILABLE == 'pywin32':
             self.wait()
 
 
+class _PollThread(_BaseThread):
+    """Detect changes by comparing periodic stat snapshots
+
+    This works on file systems that do not deliver inotify events,
+    e.g. NFS and SSHFS mounts or some container volumes.
+
+    """
+    #: The bounds, in seconds, of the interval between scans.
+    _MIN_INTERVAL = 2.0
+    _MAX_INTERVAL = 30.0
+    #: The interval is kept above this multiple of the cost of one scan
+    #: so that polling uses a bounded share of the machine.
+    _COST_FACTOR = 10
+    #: Stat calls on network file systems are latency-bound, so they are
+    #: issued from several threads.
+    _SCAN_WORKERS = 4
+
+    def __init__(self, monitor):
+        _BaseThread.__init__(self, monitor)
+        worktree = git.worktree()
+        if worktree is not None:
+            worktree = core.abspath(worktree)
+        self._worktree = worktree
+        self._git_dir = core.abspath(git.git_path())
+        self._refs_dir = os.path.join(self._git_dir, 'refs')
+        self._wakeup = Event()
+        self._refresh_requested = False
+        self._pool = None
+        self._interval = self._MIN_INTERVAL
+        self._logged_interval = None
+        # directory path -> {entry name: (mtime, size, inode)}
+        self._worktree_snapshot = {}
+        self._git_dir_snapshot = {}
+
+    def watch_count(self):
+        return len(self._worktree_snapshot) + len(self._git_dir_snapshot)
+
+    def run(self):
+        self._pool = ThreadPool(self._SCAN_WORKERS)
+        try:
+            start = time.time()
+            self._refresh()
+            self._log_enabled_message()
+            self._started()
+            self._adapt_interval(time.time() - start, False)
+
+            next_scan = time.time() + self._interval
+            while self._running:
+                timeout = max(0.0, next_scan - time.time())
+                pending_timeout = self._timeout()
+                if pending_timeout is not None:
+                    timeout = min(timeout, pending_timeout / 1000.0)
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                if not self._running:
+                    break
+                if self._refresh_requested:
+                    self._refresh_requested = False
+                    self._refresh()
+                if time.time() >= next_scan:
+                    count = len(self._file_paths) + len(self._git_dir_paths)
+                    start = time.time()
+                    self._scan()
+                    cost = time.time() - start
+                    count = (len(self._file_paths) +
+                             len(self._git_dir_paths) - count)
+                    self._record_events(count)
+                    self._adapt_interval(cost, bool(count))
+                    next_scan = time.time() + self._interval
+                # A scan already spans a quiet period
+                if self._notify_due(quiet=False):
+                    self.notify()
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def refresh(self):
+        """Ask the polling thread to update the set of scanned directories"""
+        self._refresh_requested = True
+        self._wakeup.set()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        self.wait()
+
+    def _refresh(self):
+        git_dirs = set()
+        git_dirs.add(self._git_dir)
+        for dirpath, dirnames, filenames in core.walk(self._refs_dir):
+            git_dirs.add(core.decode(dirpath))
+        self._git_dir_snapshot = self._snapshot(git_dirs,
+                                                self._git_dir_snapshot)
+        if self._worktree is None:
+            return
+        worktree_dirs = set(os.path.dirname(os.path.join(self._worktree, path))
+                            for path in gitcmds.tracked_files())
+        worktree_dirs.add(self._worktree)
+        self._worktree_snapshot = self._snapshot(worktree_dirs,
+                                                 self._worktree_snapshot)
+
+    def _scan_dirs(self, paths):
+        chunksize = max(1, len(paths) // (self._SCAN_WORKERS * 4))
+        return self._pool.map(_scan_dir, paths, chunksize)
+
+    def _snapshot(self, paths, snapshot):
+        """Return a snapshot of paths, reusing existing directory entries"""
+        result = {}
+        new_paths = []
+        for path in paths:
+            try:
+                result[path] = snapshot[path]
+            except KeyError:
+                new_paths.append(path)
+        for path, entries in zip(new_paths, self._scan_dirs(new_paths)):
+            if entries is not None:
+                result[path] = entries
+        return result
+
+    def _scan(self):
+        """Compare the directories against their snapshots"""
+        snapshot = self._worktree_snapshot
+        paths = list(snapshot)
+        for path, entries in zip(paths, self._scan_dirs(paths)):
+            if entries is None:
+                del snapshot[path]
+                self._file_paths.add(path)
+                continue
+            for name in _changed_entries(snapshot[path], entries):
+                self._file_paths.add(os.path.join(path, core.decode(name)))
+            snapshot[path] = entries
+
+        snapshot = self._git_dir_snapshot
+        paths = list(snapshot)
+        new_dirs = set()
+        for path, entries in zip(paths, self._scan_dirs(paths)):
+            if entries is None:
+                del snapshot[path]
+                self._add_git_dir_path(path)
+                continue
+            for name in _changed_entries(snapshot[path], entries):
+                subpath = os.path.join(path, core.decode(name))
+                self._add_git_dir_path(subpath)
+                # New directories below .git/refs, e.g. for a new remote
+                if (entries.get(name, _MISSING) is None and
+                        (subpath + '/').startswith(self._refs_dir + '/')):
+                    new_dirs.add(subpath)
+            snapshot[path] = entries
+        if new_dirs:
+            for subdir in list(new_dirs):
+                for dirpath, dirnames, filenames in core.walk(subdir):
+                    new_dirs.add(core.decode(dirpath))
+            snapshot.update(self._snapshot(new_dirs, snapshot))
+
+    def _add_git_dir_path(self, path):
+        relpath = os.path.relpath(path, self._git_dir)
+        self._git_dir_paths.add(relpath.replace(os.sep, '/'))
+
+    def _adapt_interval(self, cost, changed):
+        """Poll quickly after changes and back off while idle"""
+        floor = max(self._MIN_INTERVAL, cost * self._COST_FACTOR)
+        if changed:
+            interval = floor
+        else:
+            interval = min(max(floor, self._interval * 1.5),
+                           max(floor, self._MAX_INTERVAL))
+        self._interval = interval
+        # Only log when the cost of scanning changes noticeably
+        logged = self._logged_interval
+        if logged is None or floor >= logged * 2 or floor <= logged / 2:
+            self._logged_interval = floor
+            msg = N_('File system change monitoring: polling %(count)d'
+                     ' directories, one scan takes %(cost).2f seconds, the'
+                     ' minimum interval is %(interval).1f seconds.\n')
+            Interaction.safe_log(msg % dict(count=self.watch_count(),
+                                            cost=cost, interval=floor))
+
+
+_MISSING = object()
+
+
+def _scan_dir(path):
+    """Return {name: (mtime, size, inode)} for the entries of a directory
+
+    Subdirectories map to None because only their presence matters.
+    Returns None when the directory cannot be read.
+
+    """
+    dirpath = core.mkpath(path)
+    try:
+        names = os.listdir(dirpath)
+    except (IOError, OSError):
+        return None
+    entries = {}
+    for name in names:
+        try:
+            st = os.lstat(os.path.join(dirpath, name))
+        except (IOError, OSError):
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            entries[name] = None
+        else:
+            entries[name] = (st.st_mtime, st.st_size, st.st_ino)
+    return entries
+
+
+def _changed_entries(old, new):
+    """Return the names that were added, removed or modified"""
+    changed = [name for name, value in new.items()
+               if old.get(name, _MISSING) != value]
+    changed.extend(name for name in old if name not in new)
+    return changed
+
+
+_FILE_SCOPES = set((MainModel.scope_index, MainModel.scope_head))
+
+_GIT_DIR_FILE_SCOPES = {
+    'index': (MainModel.scope_index,),
+    'HEAD': (MainModel.scope_head,),
+    'config': (MainModel.scope_config,),
+    'packed-refs': (MainModel.scope_local_branches,
+                    MainModel.scope_remote_branches,
+                    MainModel.scope_tags),
+    'MERGE_HEAD': (MainModel.scope_state,),
+    'MERGE_MSG': (MainModel.scope_state,),
+    'SQUASH_MSG': (MainModel.scope_state,),
+    'rebase-apply': (MainModel.scope_state,),
+    'rebase-merge': (MainModel.scope_state,),
+}
+
+_GIT_DIR_REF_SCOPES = (
+    ('refs/heads/', MainModel.scope_local_branches),
+    ('refs/remotes/', MainModel.scope_remote_branches),
+    ('refs/tags/', MainModel.scope_tags),
+)
+
+
+def git_dir_scopes(paths, head_ref=None):
+    """Classify .git-relative paths into the MainModel scopes they affect
+
+    A change to the branch that HEAD points to, e.g. a commit made from
+    another terminal, also affects the 'head' scope.
+
+    """
+    scopes = set()
+    for path in paths:
+        if path.endswith('.lock'):
+            continue
+        try:
+            scopes.update(_GIT_DIR_FILE_SCOPES[path])
+            continue
+        except KeyError:
+            pass
+        for prefix, scope in _GIT_DIR_REF_SCOPES:
+            if path.startswith(prefix) or path + '/' == prefix:
+                scopes.add(scope)
+                if head_ref is None:
+                    head_ref = gitcmds._read_git_head(git.git_path('HEAD'),
+                                                      default='')
+                if path == head_ref:
+                    scopes.add(MainModel.scope_head)
+                break
+    return scopes
+
+
 @memoize
 def current():
     return _create_instance()
@@ -503,6 +1214,8 @@ def _create_instance():
         msg = N_('File system change monitoring: disabled because'
                  ' "cola.inotify" is false.\n')
         Interaction.log(msg)
+    elif cfg.get('cola.fspoll', False):
+        thread_class = _PollThread
     elif AVAILABLE == 'inotify':
         thread_class = _InotifyThread
     elif AVAILABLE == 'pywin32':
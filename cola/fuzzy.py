@@ -0,0 +1,242 @@
+"""Fuzzy matching and ranking of paths
+
+A query matches a path when its characters appear in the path in the same
+order, e.g. "bazctl" matches "src/foo/bar/BazController.java".  Matches are
+ranked by where the characters land: the starts of path segments and
+camel-case humps, runs of adjacent characters and the basename score
+higher, while leading and unmatched characters score lower.
+"""
+from __future__ import division, absolute_import, unicode_literals
+import heapq
+import itertools
+import re
+
+
+# Scores for each matched character
+SEPARATOR_BONUS = 30  # the first character of a path segment or word
+CAMEL_BONUS = 30  # an upper-case character that follows a lower-case one
+SEQUENTIAL_BONUS = 15  # the character follows the previous match
+BASENAME_BONUS = 10  # the character is in the basename
+
+# Penalties for the characters that were not matched
+LEADING_PENALTY = -3  # for each character before the first match...
+MAX_LEADING_PENALTY = -9  # ...up to this much
+UNMATCHED_PENALTY = -1  # for each character that was not matched
+
+SEPARATORS = '/\\_-. '
+
+#: The number of matches that are ranked by default
+LIMIT = 100
+
+#: The number of paths that are scored between results and cancellation
+CHUNK_SIZE = 16384
+
+
+def lowercase(text):
+    """Return `text` in lower case, one character per character
+
+    Positions in the result are positions in `text`.  The few characters
+    that lower-case to several characters, e.g. "\u0130", are kept as-is.
+
+    """
+    result = text.lower()
+    if len(result) == len(text):
+        return result
+    return ''.join(char if len(char.lower()) != 1 else char.lower()
+                   for char in text)
+
+
+def _last_positions(term, lower):
+    """Return the last position at which each character can match
+
+    Returns None when `term` is not a subsequence of `lower`.
+
+    """
+    last = [0] * len(term)
+    end = len(lower)
+    for idx in range(len(term) - 1, -1, -1):
+        end = lower.rfind(term[idx], 0, end)
+        if end < 0:
+            return None
+        last[idx] = end
+    return last
+
+
+def _is_boundary(path, pos):
+    if pos == 0:
+        return True
+    before = path[pos - 1]
+    if before in SEPARATORS:
+        return True
+    return path[pos].isupper() and before.islower()
+
+
+def _align(term, path, lower, last, prefer_last):
+    """Choose a position for each character of the term
+
+    Characters that follow the previous match are taken right away.
+    Otherwise the first, or the last, boundary position that leaves room
+    for the rest of the term is preferred over the first occurrence.
+
+    """
+    positions = []
+    start = 0
+    for idx, char in enumerate(term):
+        end = last[idx] + 1
+        pos = chosen = lower.find(char, start, end)
+        if pos != start:
+            while pos != -1:
+                if _is_boundary(path, pos):
+                    chosen = pos
+                    if not prefer_last:
+                        break
+                pos = lower.find(char, pos + 1, end)
+        positions.append(chosen)
+        start = chosen + 1
+    return positions
+
+
+def _score_positions(positions, path):
+    basename = path.rfind('/') + 1
+    score = 0
+    prev = -2
+    for pos in positions:
+        before = path[pos - 1] if pos else '/'
+        if before in SEPARATORS:
+            score += SEPARATOR_BONUS
+        elif path[pos].isupper() and before.islower():
+            score += CAMEL_BONUS
+        if pos == prev + 1:
+            score += SEQUENTIAL_BONUS
+        if pos >= basename:
+            score += BASENAME_BONUS
+        prev = pos
+    score += max(MAX_LEADING_PENALTY, LEADING_PENALTY * positions[0])
+    score += UNMATCHED_PENALTY * (len(path) - len(positions))
+    return score
+
+
+def _score(term, path, lower):
+    last = _last_positions(term, lower)
+    if last is None:
+        return None
+    first = _align(term, path, lower, last, False)
+    value = _score_positions(first, path)
+    second = _align(term, path, lower, last, True)
+    if second != first:
+        value = max(value, _score_positions(second, path))
+    return value
+
+
+def score(query, path):
+    """Return the score of `path` for `query`, or None when it does not match
+
+    The query is split into whitespace-separated terms that must all
+    match.  Matching ignores case.
+
+    """
+    terms = lowercase(query).split()
+    lowered = lowercase(path)
+    total = 0
+    for term in terms:
+        value = _score(term, path, lowered)
+        if value is None:
+            return None
+        total += value
+    return total
+
+
+def _pattern(term):
+    """Return a regex that finds `term` as a subsequence"""
+    return re.compile('.*?'.join(re.escape(char) for char in term),
+                      re.DOTALL)
+
+
+def _narrows(old_terms, terms):
+    """Are the matches for `terms` a subset of the matches for `old_terms`?"""
+    if len(old_terms) > len(terms):
+        return False
+    for old, new in zip(old_terms, terms):
+        if _last_positions(old, new) is None:
+            return False
+    return True
+
+
+class Matcher(object):
+    """Ranks a fixed list of paths against fuzzy queries
+
+    The paths are lowercased once.  A regex finds the paths that contain
+    every term as a subsequence, and only those are scored.  When a query
+    extends the previous one, e.g. while typing, only the paths that
+    matched the previous query are searched again.
+
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.lower = [lowercase(path) for path in self.paths]
+        self._last = None  # (terms, indexes, lowercased paths)
+
+    def iter_ranked(self, query, limit=LIMIT, cancel=None):
+        """Yield the best `limit` matches found so far, best first
+
+        The paths are searched and scored in chunks, and the ranking so far
+        is yielded after each chunk that matched, so callers can show
+        results before all of the paths are scored.  The last list is the
+        final ranking.  Ties go to shorter paths and then to the original
+        order.  Nothing more is yielded once the optional `cancel` event is
+        set.  An empty query yields every path in the original order.
+
+        """
+        terms = lowercase(query).split()
+        if not terms:
+            yield list(self.paths)
+            return
+        last = self._last
+        if last is not None and _narrows(last[0], terms):
+            indexes, strings = last[1], last[2]
+        else:
+            indexes, strings = range(len(self.paths)), self.lower
+        searches = [_pattern(term).search for term in terms]
+        matched_indexes = []
+        matched_strings = []
+        paths = self.paths
+        heap = []
+        results = []
+        for start in range(0, len(strings), CHUNK_SIZE):
+            if cancel is not None and cancel.is_set():
+                return
+            end = start + CHUNK_SIZE
+            chunk_indexes = indexes[start:end]
+            chunk_strings = strings[start:end]
+            # map() and compress() keep the search out of the interpreter
+            for search in searches:
+                mask = list(map(search, chunk_strings))
+                chunk_indexes = list(itertools.compress(chunk_indexes, mask))
+                chunk_strings = list(itertools.compress(chunk_strings, mask))
+            if not chunk_indexes:
+                continue
+            matched_indexes.extend(chunk_indexes)
+            matched_strings.extend(chunk_strings)
+            for idx, lower in zip(chunk_indexes, chunk_strings):
+                path = paths[idx]
+                total = 0
+                for term in terms:
+                    total += _score(term, path, lower)
+                item = (total, -len(path), -idx)
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            results = [paths[-item[2]] for item in sorted(heap, reverse=True)]
+            yield results
+        self._last = (terms, matched_indexes, matched_strings)
+        if not matched_indexes:
+            yield results
+
+    def ranked(self, query, limit=LIMIT, cancel=None):
+        """Return the best `limit` matches for `query`, best first"""
+        result = []
+        for result in self.iter_ranked(query, limit=limit, cancel=cancel):
+            pass
+        return result
@@ -196,6 +196,7 @@ class Git(object):
                 _encoding=None,
                 _raw=False,
                 _stdin=None,
+                _input=None,
                 _stderr=subprocess.PIPE,
                 _stdout=subprocess.PIPE,
                 _readonly=False,
@@ -209,6 +210,7 @@ class Git(object):
         :param _encoding: default encoding, defaults to None (utf-8).
         :param _raw: do not strip trailing whitespace.
         :param _stdin: optional stdin filehandle.
+        :param _input: optional data to write to stdin.
         :returns (status, out, err): exit status, stdout, stderr
 
         """
@@ -217,6 +219,8 @@ class Git(object):
             _cwd = core.getcwd()
 
         extra = {}
+        if _input is not None:
+            _stdin = subprocess.PIPE
 
         if hasattr(os, 'setsid'):
             # SSH uses the SSH_ASKPASS variable only if the process is really
@@ -230,7 +234,7 @@ class Git(object):
         if not _readonly:
             INDEX_LOCK.acquire()
         status, out, err = core.run_command(
-                command, cwd=_cwd, encoding=_encoding,
+                command, cwd=_cwd, encoding=_encoding, input=_input,
                 stdin=_stdin, stdout=_stdout, stderr=_stderr,
                 no_win32_startupinfo=_no_win32_startupinfo, **extra)
         # Let the next thread in
@@ -298,6 +302,7 @@ class Git(object):
                 '_decode',
                 '_encoding',
                 '_stdin',
+                '_input',
                 '_stdout',
                 '_stderr',
                 '_raw',
@@ -1,6 +1,7 @@
 """Provides commands and queries for Git."""
 from __future__ import division, absolute_import, unicode_literals
 
+import os
 import re
 from io import StringIO
 
@@ -40,37 +41,140 @@ def diff_filenames(*args):
     return _parse_diff_filenames(out)
 
 
+class _tree_listing(object):
+    """Cache for listdir(), for the repository at git_dir"""
+    git_dir = None
+    ref = None
+    oid = None
+    valid = False  # False when the tree oid must be checked again
+    tracked = {}  # dirname -> (dirs, files) for the tracked paths
+    untracked = None  # dirname -> (dirs, files) from set_listdir_overlay()
+
+
 def listdir(dirname, ref='HEAD'):
     """Get the contents of a directory according to Git
 
-    Query Git for the content of a directory, taking ignored
-    files into account.
+    The tracked paths come from an in-memory listing of the whole tree,
+    which is only read again when the tree oid of `ref` changes.  The
+    untracked paths come from set_listdir_overlay(), so expanding and
+    refreshing directories is a dictionary lookup.  Untracked paths are
+    queried from Git when no overlay has been set.
 
     """
-    dirs = []
-    files = []
-
-    # first, parse git ls-tree to get the tracked files
-    # in a list of (type, path) tuples
-    entries = ls_tree(dirname, ref=ref)
-    for entry in entries:
-        if entry[0][0] == 't':  # tree
-            dirs.append(entry[1])
-        else:
-            files.append(entry[1])
+    _check_listing_repo()
+    key = _listing_key(dirname)
+    tracked = _tracked_listing(ref)
+    dirs, files = tracked.get(key, ((), ()))
+    dirs = set(dirs)
+    files = set(files)
+
+    untracked = _tree_listing.untracked
+    if untracked is None:
+        untracked = _listing(
+            untracked_files(paths=[dirname], directory=True))
+    untracked_dirs, untracked_files_ = untracked.get(key, ((), ()))
+    dirs.update(untracked_dirs)
+    files.update(untracked_files_)
+
+    return (sorted(dirs), sorted(files))
+
+
+def set_listdir_overlay(paths):
+    """Set the untracked paths that listdir() shows alongside the tree
+
+    The paths normally come from the status of the worktree.  The tree oid
+    is checked again on the next call to listdir() since the overlay is
+    set whenever the status is refreshed.  When `paths` is None listdir()
+    queries the untracked paths from Git.
 
-    # gather untracked files
-    untracked = untracked_files(paths=[dirname], directory=True)
-    for path in untracked:
-        if path.endswith('/'):
-            dirs.append(path[:-1])
+    """
+    _check_listing_repo()
+    if paths is None:
+        _tree_listing.untracked = None
+    else:
+        _tree_listing.untracked = _listing(paths)
+    _tree_listing.valid = False
+
+
+def _check_listing_repo():
+    """Forget the cached listings when another repository is current"""
+    cache = _tree_listing
+    git_dir = git.git_path()
+    if git_dir == cache.git_dir:
+        return
+    cache.git_dir = git_dir
+    cache.ref = None
+    cache.oid = None
+    cache.valid = False
+    cache.tracked = {}
+    cache.untracked = None
+
+
+def tree_oid(ref='HEAD'):
+    """Return the object ID of the tree for `ref`, or an empty string"""
+    status, out, err = git.rev_parse(ref + '^{tree}', _readonly=True)
+    if status != 0:
+        return ''
+    return out.strip()
+
+
+def _tracked_listing(ref):
+    cache = _tree_listing
+    if cache.valid and cache.ref == ref:
+        return cache.tracked
+    oid = tree_oid(ref)
+    if oid != cache.oid or ref != cache.ref:
+        if oid:
+            out = git.ls_tree(oid, r=True, z=True, name_only=True,
+                              full_tree=True, _readonly=True)[STDOUT]
+            paths = out[:-1].split('\0') if out else []
         else:
-            files.append(path)
+            paths = []
+        cache.tracked = _listing(paths)
+        cache.oid = oid
+        cache.ref = ref
+    cache.valid = True
+    return cache.tracked
+
+
+def _listing_key(dirname):
+    key = dirname.strip('/')
+    if key == '.':
+        key = ''
+    return key
+
 
-    dirs.sort()
-    files.sort()
+def _listing(paths):
+    """Return a dict mapping each directory to its (dirs, files) entries
 
-    return (dirs, files)
+    Paths ending in "/" are directories, e.g. from "ls-files --directory".
+
+    """
+    listing = {}
+    for path in paths:
+        is_dir = path.endswith('/')
+        path = path.rstrip('/')
+        if not path:
+            continue
+        parent = path.rpartition('/')[0]
+        entry = listing.get(parent)
+        if entry is None:
+            entry = listing[parent] = (set(), set())
+        if is_dir:
+            entry[0].add(path)
+        else:
+            entry[1].add(path)
+        # Register the directories that lead up to the path
+        while parent:
+            dirname = parent.rpartition('/')[0]
+            entry = listing.get(dirname)
+            if entry is None:
+                entry = listing[dirname] = (set(), set())
+            elif parent in entry[0]:
+                break
+            entry[0].add(parent)
+            parent = dirname
+    return listing
 
 
 def diff(args):
@@ -92,7 +196,7 @@ def _parse_diff_filenames(out):
 
 def tracked_files(*args):
     """Return the names of all files in the repository"""
-    out = git.ls_files('--', *args, z=True)[STDOUT]
+    out = git.ls_files('--', *args, z=True, _readonly=True)[STDOUT]
     if out:
         return sorted(out[:-1].split('\0'))
     else:
@@ -105,7 +209,8 @@ def all_files(*args):
                             z=True,
                             cached=True,
                             others=True,
-                            exclude_standard=True)[STDOUT]
+                            exclude_standard=True,
+                            _readonly=True)[STDOUT]
     return sorted([f for f in ls_files.split('\0') if f])
 
 
@@ -117,6 +222,8 @@ class _current_branch(object):
 
 def reset():
     _current_branch.key = None
+    _tree_listing.valid = False
+    _tree_listing.untracked = None
 
 
 def current_branch():
@@ -130,7 +237,8 @@ def current_branch():
         # OSError means we can't use the stat cache
         key = 0
 
-    status, data, err = git.rev_parse('HEAD', symbolic_full_name=True)
+    status, data, err = git.rev_parse('HEAD', symbolic_full_name=True,
+                                      _readonly=True)
     if status != 0:
         # git init -- read .git/HEAD.  We could do this unconditionally...
         data = _read_git_head(head)
@@ -239,7 +347,7 @@ def untracked_files(git=git, paths=None, **kwargs):
         paths = []
     args = ['--'] + paths
     out = git.ls_files(z=True, others=True, exclude_standard=True,
-                       *args, **kwargs)[STDOUT]
+                       _readonly=True, *args, **kwargs)[STDOUT]
     if out:
         return out[:-1].split('\0')
     return []
@@ -459,8 +567,46 @@ def export_patchset(start, end, output='patches', **kwargs):
     return git.format_patch('-o', output, start + '^..' + end, **kwargs)
 
 
+def pathspec_from_stdin():
+    """Return True when git add and git reset can read pathspecs from stdin"""
+    return version.check('pathspec-from-file', version.git_version())
+
+
+def pathspec_stdin(paths):
+    """Return the git kwargs that send `paths` to git over stdin
+
+    This runs a single command for any number of paths, where passing them
+    as arguments needs one command per slice to stay below ARG_MAX.
+
+    """
+    return {'pathspec_from_file': '-',
+            'pathspec_file_nul': True,
+            '_input': _nul_terminated(paths)}
+
+
+def _nul_terminated(paths):
+    return ''.join(path + '\0' for path in paths)
+
+
+def add_files(paths):
+    """Add files to the index, or remove them when they no longer exist
+
+    Directories are not expanded; use "git add" for those.  Unlike
+    "git add", "git update-index" does not match every path against every
+    pathspec, which makes it much faster for long lists of paths.
+
+    """
+    # --stdin must come after the other options
+    return git.update_index('--add', '--remove', '--verbose', '-z', '--stdin',
+                            _input=_nul_terminated(paths))
+
+
 def unstage_paths(args, head='HEAD'):
-    status, out, err = git.reset(head, '--', *set(args))
+    paths = set(args)
+    if pathspec_from_stdin():
+        status, out, err = git.reset(head, **pathspec_stdin(paths))
+    else:
+        status, out, err = git.reset(head, '--', *paths)
     if status == 128:
         # handle git init: we have to use 'git rm --cached'
         # detect this condition by checking if the file is still staged
@@ -472,7 +618,9 @@ def unstage_paths(args, head='HEAD'):
 def untrack_paths(args, head='HEAD'):
     if not args:
         return (-1, N_('Nothing to do'), '')
-    return git.update_index('--', force_remove=True, *set(args))
+    # --stdin must come after --force-remove
+    return git.update_index('--force-remove', '-z', '--stdin',
+                            _input=_nul_terminated(set(args)))
 
 
 def worktree_state(head='HEAD',
@@ -488,36 +636,94 @@ def worktree_state(head='HEAD',
     if update_index:
         git.update_index(refresh=True)
 
-    staged, unmerged, staged_deleted, staged_submods = diff_index(head,
-                                                                  paths=paths)
-    modified, unstaged_deleted, modified_submods = diff_worktree(paths)
+    state = _worktree_state(head, display_untracked, paths)
+
+    # Look for upstream modified files if this is a tracking branch
+    upstream_changed = diff_upstream(head)
+    upstream_changed.sort()
+    state['upstream_changed'] = upstream_changed
+
+    return state
+
+
+def worktree_paths_state(paths, head='HEAD',
+                         update_index=False,
+                         display_untracked=True):
+    """Return a dict describing the state of specific worktree paths
+
+    This is the pathspec-limited subset of worktree_state() used for
+    incremental updates.  The 'upstream_changed' key is not computed
+    because it does not depend on the worktree.
+
+    """
+    if update_index:
+        refresh_paths(paths)
+    return _worktree_state(head, display_untracked, paths)
+
+
+def _worktree_state(head, display_untracked, paths):
+    index_state = diff_index(head, paths=paths)
+    worktree = diff_worktree(paths)
     untracked = display_untracked and untracked_files(paths=paths) or []
+    return assemble_worktree_state(index_state, worktree, untracked)
+
+
+def assemble_worktree_state(index_state, worktree, untracked):
+    """Combine the results of diff_index(), diff_worktree() and
+    untracked_files() into the dict returned by worktree_state()
+
+    The queries are independent so that callers can run them concurrently.
+
+    """
+    staged, unmerged, staged_deleted, staged_submods = index_state
+    modified, unstaged_deleted, modified_submods = worktree
 
     # Remove unmerged paths from the modified list
     if unmerged:
         unmerged_set = set(unmerged)
         modified = [path for path in modified if path not in unmerged_set]
 
-    # Look for upstream modified files if this is a tracking branch
-    upstream_changed = diff_upstream(head)
-
     # Keep stuff sorted
     staged.sort()
     modified.sort()
     unmerged.sort()
     untracked.sort()
-    upstream_changed.sort()
 
     return {'staged': staged,
             'modified': modified,
             'unmerged': unmerged,
             'untracked': untracked,
-            'upstream_changed': upstream_changed,
             'staged_deleted': staged_deleted,
             'unstaged_deleted': unstaged_deleted,
             'submodules': staged_submods | modified_submods}
 
 
+def index_stat():
+    """Return stat data that changes whenever the index is rewritten
+
+    Returns None when the index does not exist.
+
+    """
+    try:
+        st = core.stat(git.git_path('index'))
+    except (OSError, TypeError):
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+def refresh_paths(paths):
+    """Refresh the index stat information for the tracked subset of paths
+
+    This is the pathspec-limited equivalent of "update-index --refresh".
+    "git add --refresh" rejects untracked paths, so they are filtered out.
+
+    """
+    tracked = tracked_files(*paths)
+    if not tracked:
+        return (0, '', '')
+    return git.add('--', refresh=True, *tracked)
+
+
 def _parse_raw_diff(out):
     while out:
         info, path, out = out.split('\0', 2)
@@ -535,11 +741,13 @@ def diff_index(head, cached=True, paths=None):
     if paths is None:
         paths = []
     args = [head, '--'] + paths
-    status, out, err = git.diff_index(cached=cached, z=True, *args)
+    status, out, err = git.diff_index(cached=cached, z=True, _readonly=True,
+                                      *args)
     if status != 0:
         # handle git init
         args[0] = EMPTY_TREE_OID
-        status, out, err = git.diff_index(cached=cached, z=True, *args)
+        status, out, err = git.diff_index(cached=cached, z=True,
+                                          _readonly=True, *args)
 
     for path, status, is_submodule in _parse_raw_diff(out):
         if is_submodule:
@@ -562,7 +770,7 @@ def diff_worktree(paths=None):
     if paths is None:
         paths = []
     args = ['--'] + paths
-    status, out, err = git.diff_files(z=True, *args)
+    status, out, err = git.diff_files(z=True, _readonly=True, *args)
     for path, status, is_submodule in _parse_raw_diff(out):
         if is_submodule:
             submodules.add(path)
@@ -608,38 +816,213 @@ def merge_base_parent(branch):
 
 def parse_ls_tree(rev):
     """Return a list of (mode, type, oid, path) tuples."""
+    out = git.ls_tree(rev, r=True, z=True, _readonly=True)[STDOUT]
+    return parse_ls_tree_z(out)
+
+
+def parse_ls_tree_z(out):
+    """Parse "ls-tree -z" output into (mode, type, oid, path) tuples
+
+    Each record is "<mode> SP <type> SP <oid> TAB <path>".  The mode is
+    always six digits, so the fields are sliced at fixed offsets instead of
+    being matched with a regex.  Only the end of the type and the tab are
+    searched for, since types ("blob", "tree", "commit") and oids (SHA-1
+    or SHA-256) vary in length.
+
+    """
     output = []
-    lines = git.ls_tree(rev, r=True, _readonly=True)[STDOUT].splitlines()
-    regex = re.compile(r'^(\d+)\W(\w+)\W(\w+)[ \t]+(.*)$')
-    for line in lines:
-        match = regex.match(line)
-        if match:
-            mode = match.group(1)
-            objtype = match.group(2)
-            oid = match.group(3)
-            filename = match.group(4)
-            output.append((mode, objtype, oid, filename,))
+    if not out:
+        return output
+    for record in out[:-1].split('\0'):
+        # .....6 ...4 ......................................40
+        # 040000 tree c127cde9a0c644a3a8fef449a244f47d5272dfa6	relative
+        type_end = record.find(' ', 7)
+        tab = record.find('\t', type_end)
+        output.append((record[:6], record[7:type_end],
+                       record[type_end + 1:tab], record[tab + 1:]))
     return output
 
 
-def ls_tree(path, ref='HEAD'):
-    """Return a parsed git ls-tree result for a single directory"""
+def tree_entries(oid):
+    """Return the (mode, type, oid, name) entries of a single tree
+
+    Trees are immutable, so the entries are cached by tree oid and shared
+    by every ref, and every directory, that contains the same tree.
+    Returns None when the tree cannot be read.
+
+    """
+    cache = _tree_entries
+    try:
+        return cache.entries[oid]
+    except KeyError:
+        pass
+    status, out, err = git.ls_tree(oid, z=True, _readonly=True)
+    if status != 0:
+        return None
+    entries = parse_ls_tree_z(out)
+    if len(cache.entries) >= cache.MAX_TREES:
+        cache.entries.clear()
+    cache.entries[oid] = entries
+    return entries
+
+
+class _tree_entries(object):
+    """Cache for tree_entries()"""
+    MAX_TREES = 10000
+    entries = {}
+
+
+def head_oid():
+    """Return the object ID of HEAD, or an empty string"""
+    status, out, err = git.rev_parse('HEAD', _readonly=True)
+    if status != 0:
+        return ''
+    return out.strip()
 
-    result = []
-    status, out, err = git.ls_tree(ref, '--', path, z=True, full_tree=True)
-    if status == 0 and out:
-        for line in out[:-1].split('\0'):
-            # .....6 ...4 ......................................40
-            # 040000 tree c127cde9a0c644a3a8fef449a244f47d5272dfa6	relative
-            # 100644 blob 139e42bf4acaa4927ec9be1ec55a252b97d3f1e2	relative/path
-            # 0..... 7... 12......................................	53
-            # path offset = 6 + 1 + 4 + 1 + 40 + 1 = 53
-            objtype = line[7:11]
-            relpath = line[53:]
-            result.append((objtype, relpath))
 
+# Separates the fields of the commits listed by last_commits()
+_LOG_START = b'\x01'
+_LOG_FIELD = '\x02'
+
+
+def last_commits(dirname, paths, ref='HEAD'):
+    """Return a dict mapping paths to the last commit that touched them
+
+    `paths` are entries, files or directories, inside `dirname`.  A single
+    "git log --name-only" walk over `dirname` resolves all of them and is
+    stopped as soon as every path has been seen, instead of running
+    "git log -1" once per path.  Each commit is a (date, message, author)
+    tuple.  Paths that are not in the history are left out.
+
+    """
+    wanted = set(paths)
+    if not wanted:
+        return {}
+    prefix = dirname.strip('/')
+    if prefix in ('', '.'):
+        prefix = ''
+    else:
+        prefix += '/'
+    cmd = ['git', 'log', '--name-only', '-z', '--no-color',
+           '--format=%x01%ar%x02%s%x02%an', ref, '--']
+    if prefix:
+        cmd.append(prefix)
+    prefix_len = len(prefix)
+
+    result = {}
+    commit = None
+    first_name = False
+    pending = b''
+    proc = core.start_command(cmd)
+    fd = proc.stdout.fileno()
+    try:
+        while wanted:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            records = (pending + chunk).split(b'\0')
+            pending = records.pop()
+            for record in records:
+                if record.startswith(_LOG_START):
+                    commit = tuple(core.decode(record[1:])
+                                   .split(_LOG_FIELD, 2))
+                    first_name = True
+                    continue
+                # The file names start on the line after the commit
+                if first_name and record.startswith(b'\n'):
+                    record = record[1:]
+                first_name = False
+                if not record or commit is None:
+                    continue
+                name = core.decode(record)
+                entry = prefix + name[prefix_len:].split('/', 1)[0]
+                if entry in wanted:
+                    wanted.remove(entry)
+                    result[entry] = commit
+                    if not wanted:
+                        break
+    finally:
+        # Stop the walk early once every path has been resolved
+        if proc.poll() is None:
+            proc.kill()
+        proc.communicate()
     return result
 
+
+#: The number of bytes that export_blob() copies at a time
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_size(obj):
+    """Return the size of a blob in bytes, or None"""
+    status, out, err = git.cat_file('-s', obj, _readonly=True)
+    if status != 0:
+        return None
+    try:
+        return int(out)
+    except ValueError:
+        return None
+
+
+def export_blob(obj, filename, progress=None, cancel=None,
+                chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream the contents of a blob, e.g. "HEAD:path", into a file
+
+    The bytes are piped from "git cat-file blob" to the file in
+    `chunk_size` chunks without being decoded, so binary files are saved
+    as-is and memory use does not grow with the size of the blob.
+    `progress` is called with (bytes written, total bytes) after each
+    chunk, where the total is None when it is unknown.  Once the optional
+    `cancel` event is set the export stops and the partial file is removed.
+    Returns (status, out, err).
+
+    """
+    total = blob_size(obj)
+    proc = core.start_command(['git', 'cat-file', 'blob', obj])
+    written = 0
+    cancelled = False
+    finished = False
+    try:
+        with core.xopen(filename, 'wb') as fp:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    cancelled = True
+                    break
+                chunk = proc.stdout.read(chunk_size)
+                if not chunk:
+                    finished = True
+                    break
+                fp.write(chunk)
+                written += len(chunk)
+                if progress is not None:
+                    progress(written, total)
+    finally:
+        # Do not let communicate() buffer the rest of an abandoned blob
+        if not finished and proc.poll() is None:
+            proc.kill()
+        out, err = proc.communicate()
+    status = proc.returncode
+    err = core.decode(err or b'')
+    if cancelled:
+        status = status or 1
+        err = err or N_('Cancelled')
+    if status != 0:
+        try:
+            core.unlink(filename)
+        except OSError:
+            pass
+    return (status, '', err)
+
+
+def ls_tree(path, ref='HEAD'):
+    """Return a parsed git ls-tree result for a single directory"""
+    status, out, err = git.ls_tree(ref, '--', path, z=True, full_tree=True,
+                                   _readonly=True)
+    if status != 0:
+        return []
+    return [(objtype, relpath)
+            for mode, objtype, oid, relpath in parse_ls_tree_z(out)]
+
 # A regex for matching the output of git(log|rev-list) --pretty=oneline
 REV_LIST_REGEX = re.compile(r'^([0-9a-f]{40}) (.*)$')
 
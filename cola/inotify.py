@@ -16,12 +16,15 @@ IN_MOVED_FROM = 0x00000040
 IN_MOVED_TO = 0x00000080
 IN_CREATE = 0x00000100
 IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
 
 IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
 
 IN_ONLYDIR = 0x01000000
 IN_EXCL_UNLINK = 0x04000000
-IN_ISDIR = 0x80000000
+IN_ISDIR = 0x40000000
 
 
 class inotify_event(ctypes.Structure):
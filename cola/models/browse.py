@@ -1,5 +1,6 @@
 from __future__ import division, absolute_import, unicode_literals
 import collections
+import threading
 import time
 
 from qtpy import QtCore
@@ -14,9 +15,10 @@ from .. import core
 from .. import icons
 from .. import utils
 from .. import qtutils
-from ..git import STDOUT
+from ..decorators import memoize
 from ..i18n import N_
 from ..models import main
+from ..models import prefs
 
 
 class Columns(object):
@@ -64,6 +66,19 @@ class Columns(object):
         return cls.ATTRS[column]
 
 
+def listdir_overlay(model):
+    """Return the paths that the browser shows alongside the tree
+
+    The main model does not list untracked files when they are hidden
+    from the status widget, so None is returned and gitcmds.listdir()
+    queries them from git instead.
+
+    """
+    if not prefs.display_untracked():
+        return None
+    return model.untracked + model.staged
+
+
 class GitRepoModel(QtGui.QStandardItemModel):
     """Provides an interface into a git repository for browsing purposes."""
 
@@ -176,11 +191,11 @@ class GitRepoModel(QtGui.QStandardItemModel):
         # Insert directories before file paths
         for dirname in dirs:
             self.add_directory(parent, dirname)
-            self.update_entry(dirname)
 
         for filename in paths:
             self.add_file(parent, filename)
-            self.update_entry(filename)
+
+        self.update_entries(dirs + paths)
 
     def path_is_interesting(self, path):
         """Return True if path has a status."""
@@ -201,6 +216,9 @@ class GitRepoModel(QtGui.QStandardItemModel):
         self.model_updated.emit()
 
     def refresh(self):
+        # Show the untracked and newly staged paths alongside the tree
+        gitcmds.set_listdir_overlay(listdir_overlay(main.model()))
+
         old_files = self._interesting_files
         old_paths = self._interesting_paths
         new_files = self.get_files()
@@ -213,8 +231,7 @@ class GitRepoModel(QtGui.QStandardItemModel):
             self.restore.emit()
 
         # Existing items
-        for path in sorted(new_paths.union(old_paths)):
-            self.update_entry(path)
+        self.update_entries(sorted(new_paths.union(old_paths)))
 
         self._interesting_files = new_files
         self._interesting_paths = new_paths
@@ -229,48 +246,172 @@ class GitRepoModel(QtGui.QStandardItemModel):
         self.populate_dir(root, './')
 
     def update_entry(self, path):
-        if self.turbo or path not in self.entries:
-            return  # entry doesn't currently exist
-        task = GitRepoInfoTask(self._parent, path, self.default_author)
-        self._runtask.start(task)
+        self.update_entries([path])
+
+    def update_entries(self, paths):
+        """Look up the status and last commit of entries in the background
+
+        The entries of each directory are looked up by a single task.
+
+        """
+        if self.turbo:
+            return
+        dirs = {}
+        for path in paths:
+            if path not in self.entries:
+                continue  # entry doesn't currently exist
+            dirs.setdefault(utils.dirname(path), []).append(path)
+        for dirname, dir_paths in sorted(dirs.items()):
+            task = GitRepoInfoTask(self._parent, dirname, dir_paths,
+                                   self.default_author)
+            self._runtask.start(task)
+
+
+@memoize
+def last_commits():
+    """Return the LastCommits cache singleton"""
+    return LastCommits()
+
+
+class LastCommits(object):
+    """Caches the last commit that touched each path, for the current HEAD
+
+    The commits of a directory's entries are resolved by one history walk,
+    see gitcmds.last_commits().  The cache is dropped when HEAD changes.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._head = None
+        self._commits = {}
+
+    def get(self, dirname, paths):
+        """Return a dict mapping paths to (date, message, author) tuples"""
+        head = gitcmds.head_oid()
+        with self._lock:
+            if head != self._head:
+                self._head = head
+                self._commits = {}
+            commits = self._commits
+            result = dict((path, commits[path]) for path in paths
+                          if path in commits)
+        missing = [path for path in paths if path not in result]
+        if missing and head:
+            # Paths missing from HEAD would send the walk to the root commit
+            tracked = set(path for objtype, path
+                          in gitcmds.ls_tree(self._children(dirname),
+                                             ref=head))
+            missing = [path for path in missing if path in tracked]
+        if missing and head:
+            found = gitcmds.last_commits(dirname, missing, ref=head)
+            with self._lock:
+                if head == self._head:
+                    self._commits.update(found)
+            result.update(found)
+        return result
+
+    @staticmethod
+    def _children(dirname):
+        """Return the ls-tree path that lists the entries of a directory"""
+        dirname = dirname.strip('/')
+        if dirname in ('', '.'):
+            return '.'
+        return dirname + '/'
+
+
+@memoize
+def status_index():
+    """Return the StatusIndex singleton"""
+    return StatusIndex()
+
+
+class StatusIndex(object):
+    """Maps paths and their parent directories to their browser status
+
+    The mapping is built once per update of the main model and is then
+    shared, read-only, by every GitRepoInfoTask.
+
+    """
+    #: The status of paths without changes
+    NONE = (None, '')
+
+    def __init__(self, model=None):
+        self._model = model
+        self._lock = threading.Lock()
+        self._generation = None
+        self._statuses = {}
+
+    def model(self):
+        if self._model is None:
+            self._model = main.model()
+        return self._model
+
+    def status(self, path):
+        """Return the (icon name, text) status of a path"""
+        return self.statuses().get(path, self.NONE)
+
+    def statuses(self):
+        """Return the path to status mapping for the current model"""
+        model = self.model()
+        with self._lock:
+            generation = model.generation
+            if generation != self._generation:
+                self._statuses = self._build(model)
+                self._generation = generation
+            return self._statuses
+
+    @staticmethod
+    def _build(model):
+        staged = utils.add_parents(model.staged)
+        statuses = {}
+        # Later assignments take precedence
+        untracked = (None, '?')
+        for path in utils.add_parents(model.untracked):
+            statuses[path] = untracked
+        upstream = (icons.upstream_name(), N_('Changed Upstream'))
+        for path in utils.add_parents(model.upstream_changed):
+            statuses[path] = upstream
+        staged_status = (icons.staged_name(), N_('Staged'))
+        for path in staged:
+            statuses[path] = staged_status
+        modified = (icons.modified_name(), N_('Modified'))
+        partial = (icons.partial_name(), N_('Partially Staged'))
+        for path in utils.add_parents(model.modified):
+            if path in staged:
+                statuses[path] = partial
+            else:
+                statuses[path] = modified
+        unmerged = (icons.modified_name(), N_('Unmerged'))
+        for path in utils.add_parents(model.unmerged):
+            statuses[path] = unmerged
+        return statuses
 
 
 class GitRepoInfoTask(qtutils.Task):
-    """Handles expensive git lookups for a path."""
+    """Handles expensive git lookups for the entries of a directory."""
 
-    def __init__(self, parent, path, default_author):
+    def __init__(self, parent, dirname, paths, default_author):
         qtutils.Task.__init__(self, parent)
-        self.path = path
+        self.dirname = dirname
+        self.paths = paths
         self._parent = parent
         self._default_author = default_author
-        self._data = {}
 
-    def data(self, key):
-        """Return git data for a path
+    def data(self):
+        """Return a dict mapping paths to (date, message, author) tuples
 
-        Supported keys are 'date', 'message', and 'author'
+        New entries that are not in the history get a date from the
+        filesystem and the default author.
 
         """
-        if not self._data:
-            log_line = main.model().git.log('-1', '--', self.path,
-                                            no_color=True,
-                                            pretty=r'format:%ar%x01%s%x01%an',
-                                            _readonly=True
-                                            )[STDOUT]
-            if log_line:
-                log_line = log_line
-                date, message, author = log_line.split(chr(0x01), 2)
-                self._data['date'] = date
-                self._data['message'] = message
-                self._data['author'] = author
-            else:
-                self._data['date'] = self.date()
-                self._data['message'] = '-'
-                self._data['author'] = self._default_author
-
-        return self._data[key]
+        commits = last_commits().get(self.dirname, self.paths)
+        for path in self.paths:
+            if path not in commits:
+                commits[path] = (self.date(path), '-', self._default_author)
+        return commits
 
-    def date(self):
+    def date(self, path):
         """Returns a relative date for a file path
 
         This is typically used for new entries that do not have
@@ -278,7 +419,7 @@ class GitRepoInfoTask(qtutils.Task):
 
         """
         try:
-            st = core.stat(self.path)
+            st = core.stat(path)
         except:
             return N_('%d minutes ago') % 0
         elapsed = time.time() - st.st_mtime
@@ -290,48 +431,27 @@ class GitRepoInfoTask(qtutils.Task):
             return N_('%d hours ago') % hours
         return N_('%d days ago') % int(elapsed / 60 / 60 / 24)
 
-    def status(self):
-        """Return the status for the entry's path."""
-
-        model = main.model()
-        unmerged = utils.add_parents(model.unmerged)
-        modified = utils.add_parents(model.modified)
-        staged = utils.add_parents(model.staged)
-        untracked = utils.add_parents(model.untracked)
-        upstream_changed = utils.add_parents(model.upstream_changed)
-
-        path = self.path
-        if path in unmerged:
-            status = (icons.modified_name(), N_('Unmerged'))
-        elif path in modified and self.path in staged:
-            status = (icons.partial_name(), N_('Partially Staged'))
-        elif path in modified:
-            status = (icons.modified_name(), N_('Modified'))
-        elif path in staged:
-            status = (icons.staged_name(), N_('Staged'))
-        elif path in upstream_changed:
-            status = (icons.upstream_name(), N_('Changed Upstream'))
-        elif path in untracked:
-            status = (None, '?')
-        else:
-            status = (None, '')
-        return status
+    def status(self, path):
+        """Return the status for an entry's path."""
+        return status_index().status(path)
 
     def task(self):
         """Perform expensive lookups and post corresponding events."""
-        data = (
-            self.path,
-            self.status(),
-            self.data('message'),
-            self.data('author'),
-            self.data('date'),
-        )
+        commits = self.data()
+        data = []
+        for path in self.paths:
+            date, message, author = commits[path]
+            data.append((path, self.status(path), message, author, date))
         app = QtWidgets.QApplication.instance()
         app.postEvent(self._parent, GitRepoInfoEvent(data))
 
 
 class GitRepoInfoEvent(QtCore.QEvent):
-    """Transport mechanism for communicating from a GitRepoInfoTask."""
+    """Transport mechanism for communicating from a GitRepoInfoTask.
+
+    `data` is a list of (path, status, message, author, date) tuples.
+
+    """
     # Custom event type
     TYPE = QtCore.QEvent.Type(QtCore.QEvent.registerEventType())
 
@@ -5,25 +5,87 @@ from __future__ import division, absolute_import, unicode_literals
 
 import copy
 import os
+import time
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 from .. import core
 from .. import git
 from .. import gitcmds
 from .. import gitcfg
+from .. import utils
 from ..git import STDOUT
 from ..observable import Observable
 from ..decorators import memoize
 from ..models.selection import selection_model
 from ..models import prefs
+from ..models import snapshot
 from ..compat import ustr
 
 
+# The number of git queries that update_status() runs concurrently
+QUERY_WORKERS = 4
+
+# Path-limited updates of more paths than this refresh the full file lists
+# instead because pathspec-limited queries stop paying off.
+MAX_UPDATE_PATHS = 128
+
+
 @memoize
 def model():
     """Returns the main model singleton"""
     return MainModel()
 
 
+@memoize
+def query_pool():
+    """Returns the worker pool used to run independent git queries"""
+    return ThreadPool(QUERY_WORKERS)
+
+
+def _timed(fn, cancel=None):
+    if cancel is not None and cancel.is_set():
+        return None, 0.0
+    start = time.time()
+    value = fn()
+    return value, time.time() - start
+
+
+def run_queries(queries, label='update', cancel=None):
+    """Run independent, read-only queries concurrently
+
+    `queries` is a list of (name, callable) pairs.  Returns a dict mapping
+    each name to its result once every query has finished.  The queries
+    must not modify the model; callers apply the results afterwards so that
+    observers never see a partially updated model.
+
+    Queries that have not started yet are skipped once the optional
+    `cancel` event is set, and None is returned instead of the results.
+
+    """
+    start = time.time()
+    if len(queries) <= 1:
+        pending = [(name, _timed(fn, cancel)) for name, fn in queries]
+    else:
+        pool = query_pool()
+        pending = [(name, pool.apply_async(_timed, (fn, cancel)))
+                   for name, fn in queries]
+        pending = [(name, result.get()) for name, result in pending]
+    if cancel is not None and cancel.is_set():
+        return None
+
+    results = {}
+    timings = []
+    for name, (value, elapsed) in pending:
+        results[name] = value
+        timings.append('%s %.3fs' % (name, elapsed))
+
+    if git.GIT_COLA_TRACE:
+        core.stderr('%s: %.3fs (%s)' %
+                    (label, time.time() - start, ', '.join(timings)))
+    return results
+
+
 class MainModel(Observable):
     """Provides a friendly wrapper for doing common git operations."""
 
@@ -36,6 +98,10 @@ class MainModel(Observable):
     message_mode_changed = 'mode_changed'
     message_updated = 'updated'
 
+    # Delivered right away inside of notification transactions
+    immediate_messages = (message_about_to_update,
+                          message_mode_about_to_change)
+
     # States
     mode_none = 'none'  # Default: nothing's happened, do nothing
     mode_worktree = 'worktree'  # Comparing index to worktree
@@ -44,6 +110,22 @@ class MainModel(Observable):
     mode_index = 'index'  # Comparing index to last commit
     mode_amend = 'amend'  # Amending a commit
 
+    # Scopes for partial updates, see update_scopes()
+    scope_index = 'index'  # The index and worktree file lists
+    scope_head = 'head'  # HEAD moved or now points elsewhere
+    scope_local_branches = 'refs/heads'
+    scope_remote_branches = 'refs/remotes'
+    scope_tags = 'refs/tags'
+    scope_state = 'state'  # Merge and rebase state, e.g. MERGE_HEAD
+    scope_config = 'config'  # Remotes and upstream configuration
+
+    # Scopes that require the full file lists
+    scopes_files = frozenset((scope_index, scope_head))
+
+    scopes_all = frozenset((scope_index, scope_head, scope_local_branches,
+                            scope_remote_branches, scope_tags, scope_state,
+                            scope_config))
+
     # Modes where we can checkout files from the $head
     modes_undoable = set((mode_amend, mode_index, mode_worktree))
 
@@ -77,6 +159,16 @@ class MainModel(Observable):
         self.project = ''
         self.remotes = []
         self.filter_paths = None
+        # Incremented by apply_update() once the update has been applied, so
+        # that readers on other threads never cache a half-applied update
+        # under the new generation
+        self.generation = 0
+        self.stale = False  # showing a snapshot from an earlier session
+        # Returns the worktree changes since an fsmonitor generation,
+        # see fsmonitor._Monitor.changes_since()
+        self.worktree_changes = None
+        self._index_generation = None  # as of the last refresh_index()
+        self._index_stat = None  # gitcmds.index_stat() after refreshing
 
         self.commitmsg = ''  # current commit message
         self._auto_commitmsg = ''  # e.g. .git/MERGE_MSG
@@ -183,37 +275,303 @@ class MainModel(Observable):
         self.filter_paths = filter_paths
         self.update_file_status()
 
-    def update_file_status(self, update_index=False):
-        self.notify_observers(self.message_about_to_update)
-        self._update_files(update_index=update_index)
-        self.notify_observers(self.message_updated)
-
-    def update_status(self, update_index=False):
-        # Give observers a chance to respond
-        self.notify_observers(self.message_about_to_update)
-        self._update_merge_rebase_status()
-        self._update_files(update_index=update_index)
-        self._update_remotes()
-        self._update_branches_and_tags()
-        self._update_branch_heads()
-        self._update_commitmsg()
-        self.notify_observers(self.message_updated)
-
-    def _update_files(self, update_index=False):
-        display_untracked = prefs.display_untracked()
-        state = gitcmds.worktree_state(head=self.head,
-                                       update_index=update_index,
-                                       display_untracked=display_untracked,
-                                       paths=self.filter_paths)
-        self.staged = state.get('staged', [])
-        self.modified = state.get('modified', [])
-        self.unmerged = state.get('unmerged', [])
-        self.untracked = state.get('untracked', [])
-        self.upstream_changed = state.get('upstream_changed', [])
-        self.staged_deleted = state.get('staged_deleted', set())
-        self.unstaged_deleted = state.get('unstaged_deleted', set())
-        self.submodules = state.get('submodules', set())
+    def update_file_status(self, update_index=False, cancel=None):
+        return self.update_scopes((self.scope_index,),
+                                  update_index=update_index, cancel=cancel)
+
+    def update_paths_status(self, paths, update_index=False, cancel=None):
+        """Re-query the status of specific paths and merge the results
+
+        This is much cheaper than update_file_status() on large worktrees
+        because git only has to look at the specified paths.
+
+        """
+        return self.update_scopes((), paths=paths,
+                                  update_index=update_index, cancel=cancel)
+
+    def update_status(self, update_index=False, cancel=None):
+        return self.update_scopes(self.scopes_all,
+                                  update_index=update_index, cancel=cancel)
 
+    def update_scopes(self, scopes, paths=None, update_index=False,
+                      cancel=None):
+        """Refresh only the parts of the model affected by `scopes`
+
+        `scopes` is a collection of the MainModel.scope_* values.
+        `paths` limits the refresh of the file lists to specific paths
+        when `scope_index` is not one of the scopes.
+
+        `cancel` is an optional threading.Event; once it is set the
+        refresh is abandoned before the model is modified.
+        Returns False when the refresh was cancelled.
+
+        """
+        update = self.query_scopes(scopes, paths=paths,
+                                   update_index=update_index, cancel=cancel)
+        if update is None:
+            return False
+        self.apply_update(update)
+        return True
+
+    def query_scopes(self, scopes, paths=None, update_index=False,
+                     cancel=None):
+        """Run the git queries for update_scopes() without touching the model
+
+        The queries run concurrently and can be started outside of the
+        main thread.  Returns a value for apply_update(), or None when
+        `cancel` was set.
+
+        """
+        scopes = set(scopes)
+        if paths and self.filter_paths:
+            # The path filter is applied as a pathspec by git itself
+            scopes.add(self.scope_index)
+        if paths and len(paths) > MAX_UPDATE_PATHS:
+            scopes.add(self.scope_index)
+        if scopes & self.scopes_files:
+            paths = None
+        elif paths:
+            paths = sorted(set(paths))
+
+        if cancel is not None and cancel.is_set():
+            return None
+        if update_index:
+            if paths:
+                self._refresh_index_paths(paths)
+            elif scopes & self.scopes_files:
+                self.refresh_index()
+
+        if scopes == self.scopes_all:
+            label = 'update_status'
+        else:
+            label = 'update_scopes'
+        queries = self._scope_queries(scopes, paths)
+        results = run_queries(queries, label=label, cancel=cancel)
+        if results is None:
+            return None
+        return (scopes, paths, results)
+
+    def refresh_index(self):
+        """Refresh the index stat information, skipping work that is not needed
+
+        "update-index --refresh" stats every tracked file, so it only runs
+        when the changes since the previous refresh are unknown or when
+        another process rewrote the index.  When the filesystem monitor
+        knows which paths changed only those are refreshed.
+        Returns "full", "paths" or "skipped".
+
+        """
+        generation = changed = None
+        if self.worktree_changes is not None:
+            generation, changed = self.worktree_changes(self._index_generation)
+        if changed is None or gitcmds.index_stat() != self._index_stat:
+            self.git.update_index(refresh=True)
+            result = 'full'
+        elif changed:
+            gitcmds.refresh_paths(changed)
+            result = 'paths'
+        else:
+            result = 'skipped'
+        self._index_generation = generation
+        self._index_stat = gitcmds.index_stat()
+        if git.GIT_COLA_TRACE:
+            core.stderr('update_index: %s' % result)
+        return result
+
+    def _refresh_index_paths(self, paths):
+        """Refresh specific paths without forgetting that the index is fresh"""
+        with self.index_write():
+            gitcmds.refresh_paths(paths)
+
+    def index_is_fresh(self):
+        """Return True when the index is as cola last refreshed or wrote it"""
+        return (self._index_stat is not None and
+                gitcmds.index_stat() == self._index_stat)
+
+    @contextmanager
+    def index_write(self, paths=None):
+        """Context manager for commands that rewrite the index
+
+        An index that was fresh before cola rewrote it stays fresh, so the
+        next refresh_index() does not have to refresh every tracked file.
+        git records the stat information of the `paths` that it writes,
+        which also covers pending worktree changes at or below them.
+
+        """
+        fresh = self.index_is_fresh()
+        yield
+        if not fresh:
+            return
+        self._index_stat = gitcmds.index_stat()
+        if not paths or self.worktree_changes is None:
+            return
+        generation, changed = self.worktree_changes(self._index_generation)
+        if changed is None:
+            return
+        is_written = stale_path_filter(paths)
+        if all(is_written(path) for path in changed):
+            self._index_generation = generation
+
+    def apply_update(self, update):
+        """Apply the results of query_scopes() all at once"""
+        scopes, paths, results = update
+        with self.transaction():
+            # Give observers a chance to respond
+            self.notify_observers(self.message_about_to_update)
+            with selection_model().transaction():
+                self._apply_scopes(scopes, paths, results)
+                self.generation += 1
+            if scopes == self.scopes_all:
+                self.stale = False
+            self.notify_observers(self.message_updated)
+
+    def load_snapshot(self, filename=None):
+        """Show the status saved by save_snapshot() until the next refresh
+
+        The model is marked as stale until a full refresh replaces the
+        snapshot.  Returns False when there is no usable snapshot.
+
+        """
+        # Amending lists the files staged since HEAD^, not since HEAD
+        if self.amending():
+            return False
+        values = snapshot.load(filename=filename, git=self.git)
+        if values is None:
+            return False
+        with self.transaction():
+            self.notify_observers(self.message_about_to_update)
+            snapshot.apply(self, values)
+            self.generation += 1
+            self.stale = True
+            self.notify_observers(self.message_updated)
+        return True
+
+    def save_snapshot(self, filename=None):
+        """Save the current status so that the next session can show it"""
+        # A filtered, stale, amending or unrefreshed model does not reflect
+        # the repository
+        if (self.stale or self.filter_paths or not self.generation or
+                self.amending() or not self.git.is_valid()):
+            return None
+        return snapshot.save(self, filename=filename, git=self.git)
+
+    def _scope_queries(self, scopes, paths):
+        """Return the independent git queries needed to refresh `scopes`"""
+        queries = []
+        if self.scope_state in scopes:
+            queries.append(('state', self._query_merge_rebase_status))
+
+        head = self.head
+        display_untracked = prefs.display_untracked()
+        if scopes & self.scopes_files:
+            filter_paths = self.filter_paths
+            queries.extend([
+                ('index',
+                 lambda: gitcmds.diff_index(head, paths=filter_paths)),
+                ('worktree', lambda: gitcmds.diff_worktree(filter_paths)),
+                ('upstream', self._query_upstream_changed),
+            ])
+            if display_untracked:
+                queries.append(
+                    ('untracked',
+                     lambda: gitcmds.untracked_files(paths=filter_paths)))
+        else:
+            if paths:
+                queries.append(
+                    ('paths',
+                     lambda: gitcmds.worktree_paths_state(
+                         paths, head=head,
+                         display_untracked=display_untracked)))
+            if scopes & set((self.scope_local_branches,
+                             self.scope_remote_branches, self.scope_config)):
+                # The current or the upstream branch moved, or the upstream
+                # now refers to another branch.  scope_head is a file scope.
+                queries.append(('upstream', self._query_upstream_changed))
+
+        if self.scope_config in scopes:
+            queries.append(('remotes', self._query_remotes))
+
+        namespaces = [scope for scope in (self.scope_local_branches,
+                                          self.scope_remote_branches,
+                                          self.scope_tags)
+                      if scope in scopes]
+        if len(namespaces) == 3:
+            queries.append(('refs', lambda: gitcmds.all_refs(split=True)))
+        else:
+            # Only list the namespaces that changed; a repository with
+            # thousands of tags should not re-list them after a fetch.
+            for namespace in namespaces:
+                queries.append(
+                    (namespace,
+                     lambda ns=namespace: gitcmds.for_each_ref_basename(ns)))
+
+        # Branches are renamed and created in refs/heads
+        if scopes & set((self.scope_head, self.scope_local_branches)):
+            queries.append(('branch', gitcmds.current_branch))
+
+        return queries
+
+    def _apply_scopes(self, scopes, paths, results):
+        # The merge state is needed before the commit message is checked
+        if 'state' in results:
+            self._apply_merge_rebase_status(results['state'])
+
+        if 'index' in results:
+            self._apply_files(results)
+        elif 'paths' in results:
+            self._apply_paths(paths, results['paths'])
+        if 'upstream' in results:
+            self.upstream_changed = results['upstream']
+
+        if 'remotes' in results:
+            self.remotes = results['remotes']
+
+        if 'refs' in results:
+            (self.local_branches,
+             self.remote_branches,
+             self.tags) = results['refs']
+        if self.scope_local_branches in results:
+            self.local_branches = results[self.scope_local_branches]
+        if self.scope_remote_branches in results:
+            self.remote_branches = results[self.scope_remote_branches]
+        if self.scope_tags in results:
+            self.tags = results[self.scope_tags]
+
+        if 'branch' in results:
+            self.currentbranch = results['branch']
+
+        if scopes & set((self.scope_head, self.scope_state)):
+            self._update_commitmsg()
+
+    def _apply_files(self, results):
+        state = gitcmds.assemble_worktree_state(results['index'],
+                                                results['worktree'],
+                                                results.get('untracked', []))
+        self.staged = state['staged']
+        self.modified = state['modified']
+        self.unmerged = state['unmerged']
+        self.untracked = state['untracked']
+        self.staged_deleted = state['staged_deleted']
+        self.unstaged_deleted = state['unstaged_deleted']
+        self.submodules = state['submodules']
+        self._update_selection()
+
+    def _apply_paths(self, paths, state):
+        is_stale = stale_path_filter(paths)
+        self.staged = merge_paths(self.staged, state['staged'], is_stale)
+        self.modified = merge_paths(self.modified, state['modified'], is_stale)
+        self.unmerged = merge_paths(self.unmerged, state['unmerged'], is_stale)
+        self.untracked = merge_paths(self.untracked, state['untracked'],
+                                     is_stale)
+        self.staged_deleted = merge_path_set(
+                self.staged_deleted, state['staged_deleted'], is_stale)
+        self.unstaged_deleted = merge_path_set(
+                self.unstaged_deleted, state['unstaged_deleted'], is_stale)
+        self.submodules = merge_path_set(
+                self.submodules, state['submodules'], is_stale)
+        self._update_selection()
+
+    def _update_selection(self):
         sel = selection_model()
         if self.is_empty():
             sel.reset()
@@ -229,22 +587,20 @@ class MainModel(Observable):
     def is_empty_repository(self):
         return not self.local_branches
 
-    def _update_remotes(self):
-        self.remotes = self.git.remote()[STDOUT].splitlines()
+    def _query_remotes(self):
+        return self.git.remote(_readonly=True)[STDOUT].splitlines()
 
-    def _update_branch_heads(self):
-        # Set these early since they are used to calculate 'upstream_changed'.
-        self.currentbranch = gitcmds.current_branch()
+    def _query_upstream_changed(self):
+        upstream_changed = gitcmds.diff_upstream(self.head)
+        upstream_changed.sort()
+        return upstream_changed
 
-    def _update_branches_and_tags(self):
-        local_branches, remote_branches, tags = gitcmds.all_refs(split=True)
-        self.local_branches = local_branches
-        self.remote_branches = remote_branches
-        self.tags = tags
+    def _query_merge_rebase_status(self):
+        return (core.exists(self.git.git_path('MERGE_HEAD')),
+                core.exists(self.git.git_path('rebase-merge')))
 
-    def _update_merge_rebase_status(self):
-        self.is_merging = core.exists(self.git.git_path('MERGE_HEAD'))
-        self.is_rebasing = core.exists(self.git.git_path('rebase-merge'))
+    def _apply_merge_rebase_status(self, state):
+        self.is_merging, self.is_rebasing = state
         if self.is_merging and self.mode == self.mode_amend:
             self.set_mode(self.mode_none)
 
@@ -270,20 +626,16 @@ class MainModel(Observable):
             self.set_commitmsg(self._prev_commitmsg)
 
     def update_remotes(self):
-        self._update_remotes()
-        self._update_branches_and_tags()
+        self.update_scopes((self.scope_config, self.scope_remote_branches))
 
     def delete_branch(self, branch):
         status, out, err = self.git.branch(branch, D=True)
-        self._update_branches_and_tags()
+        self.update_scopes((self.scope_local_branches,))
         return status, out, err
 
     def rename_branch(self, branch, new_branch):
         status, out, err = self.git.branch(branch, new_branch, M=True)
-        self.notify_observers(self.message_about_to_update)
-        self._update_branches_and_tags()
-        self._update_branch_heads()
-        self.notify_observers(self.message_updated)
+        self.update_scopes((self.scope_local_branches,))
         return status, out, err
 
     def _sliced_op(self, input_items, map_fn):
@@ -333,34 +685,70 @@ class MainModel(Observable):
         return (status, '\n'.join(outs), '\n'.join(errs))
 
     def _sliced_add(self, items):
-        add = self.git.add
-        return self._sliced_op(
-                items, lambda x: add('--', force=True, verbose=True, *x))
+        """Add paths to the index, including ignored paths"""
+        files = []
+        dirs = []
+        for item in items:
+            if core.isdir(item):
+                dirs.append(item)
+            else:
+                files.append(item)
+
+        results = []
+        if files:
+            results.append(gitcmds.add_files(files))
+        if dirs:
+            add = self.git.add
+            if gitcmds.pathspec_from_stdin():
+                results.append(add(force=True, verbose=True,
+                                   **gitcmds.pathspec_stdin(dirs)))
+            else:
+                results.append(self._sliced_op(
+                    dirs, lambda x: add('--', force=True, verbose=True, *x)))
+        if not results:
+            return (0, '', '')
+        status = max(result[0] for result in results)
+        out = '\n'.join(result[1] for result in results)
+        err = '\n'.join(result[2] for result in results)
+        return (status, out, err)
 
     def stage_modified(self):
-        status, out, err = self._sliced_add(self.modified)
-        self.update_file_status()
+        paths = self.modified
+        with self.index_write(paths):
+            status, out, err = self._sliced_add(paths)
+        self.update_paths_status(paths)
         return (status, out, err)
 
     def stage_untracked(self):
-        status, out, err = self._sliced_add(self.untracked)
-        self.update_file_status()
+        paths = self.untracked
+        with self.index_write(paths):
+            status, out, err = self._sliced_add(paths)
+        self.update_paths_status(paths)
         return (status, out, err)
 
     def reset(self, *items):
         reset = self.git.reset
-        status, out, err = self._sliced_op(items, lambda x: reset('--', *x))
-        self.update_file_status()
+        with self.index_write(items):
+            if not items:
+                status, out, err = (0, '', '')
+            elif gitcmds.pathspec_from_stdin():
+                status, out, err = reset(**gitcmds.pathspec_stdin(items))
+            else:
+                status, out, err = self._sliced_op(items,
+                                                   lambda x: reset('--', *x))
+        self.update_paths_status(items)
         return (status, out, err)
 
     def unstage_all(self):
         """Unstage all files, even while amending"""
-        status, out, err = self.git.reset(self.head, '--', '.')
+        with self.index_write():
+            status, out, err = self.git.reset(self.head, '--', '.')
         self.update_file_status()
         return (status, out, err)
 
     def stage_all(self):
-        status, out, err = self.git.add(v=True, u=True)
+        with self.index_write():
+            status, out, err = self.git.add(v=True, u=True)
         self.update_file_status()
         return (status, out, err)
 
@@ -469,32 +857,34 @@ class MainModel(Observable):
             else:
                 remove.append(path)
 
-        self.notify_observers(self.message_about_to_update)
-
-        # `git add -u` doesn't work on untracked files
-        if add:
-            self._sliced_add(add)
+        with self.index_write(paths):
+            # `git add -u` doesn't work on untracked files
+            if add:
+                self._sliced_add(add)
 
-        # If a path doesn't exist then that means it should be removed
-        # from the index.   We use `git add -u` for that.
-        if remove:
-            while remove:
-                self.git.add('--', u=True, *remove[:42])
-                remove = remove[42:]
+            # If a path doesn't exist then that means it should be removed
+            # from the index.   We use `git add -u` for that.
+            if remove and gitcmds.pathspec_from_stdin():
+                self.git.add(u=True, **gitcmds.pathspec_stdin(remove))
+            elif remove:
+                while remove:
+                    self.git.add('--', u=True, *remove[:42])
+                    remove = remove[42:]
 
-        self._update_files()
-        self.notify_observers(self.message_updated)
+        self.update_paths_status(paths)
 
     def unstage_paths(self, paths):
         if not paths:
             self.unstage_all()
             return
-        gitcmds.unstage_paths(paths, head=self.head)
-        self.update_file_status()
+        with self.index_write(paths):
+            gitcmds.unstage_paths(paths, head=self.head)
+        self.update_paths_status(paths)
 
     def untrack_paths(self, paths):
-        status, out, err = gitcmds.untrack_paths(paths, head=self.head)
-        self.update_file_status()
+        with self.index_write(paths):
+            status, out, err = gitcmds.untrack_paths(paths, head=self.head)
+        self.update_paths_status(paths)
         return status, out, err
 
     def getcwd(self):
@@ -505,6 +895,37 @@ class MainModel(Observable):
 
 
 # Helpers
+def stale_path_filter(paths):
+    """Return a predicate matching paths at or below any of `paths`"""
+    path_set = set(paths)
+
+    def is_stale(path):
+        while path:
+            if path in path_set:
+                return True
+            path = utils.dirname(path)
+        return False
+
+    return is_stale
+
+
+def merge_paths(old, new, is_stale):
+    """Replace the stale entries in a sorted list with `new` entries"""
+    new_set = set(new)
+    result = [path for path in old
+              if path not in new_set and not is_stale(path)]
+    result.extend(new)
+    result.sort()
+    return result
+
+
+def merge_path_set(old, new, is_stale):
+    """Replace the stale entries in a set with `new` entries"""
+    result = set(path for path in old if not is_stale(path))
+    result.update(new)
+    return result
+
+
 def remote_args(remote,
                 local_branch='',
                 remote_branch='',
@@ -17,6 +17,7 @@ DIFFTOOL = 'diff.tool'
 DISPLAY_UNTRACKED = 'gui.displayuntracked'
 EDITOR = 'gui.editor'
 FONTDIFF = 'cola.fontdiff'
+GREP_THREADS = 'cola.grepthreads'
 HISTORY_BROWSER = 'gui.historybrowser'
 LINEBREAK = 'cola.linebreak'
 MERGE_DIFFSTAT = 'merge.diffstat'
@@ -79,6 +80,10 @@ def default_history_browser():
     return default
 
 
+def grep_threads():
+    return gitcfg.current().get(GREP_THREADS, 0)
+
+
 def history_browser():
     default = default_history_browser()
     return gitcfg.current().get(HISTORY_BROWSER, default)
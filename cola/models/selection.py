@@ -52,13 +52,17 @@ def union(s):
     return list(sorted(set(s.staged + s.unmerged + s.modified + s.untracked)))
 
 
+def index(items):
+    """Return a dict mapping each item to its position in a list"""
+    return dict((item, idx) for idx, item in enumerate(items))
+
+
 def _filter(a, b):
-    b_set = set(b)
-    a_copy = list(a)
-    last = len(a_copy) - 1
-    for idx, i in enumerate(reversed(a)):
-        if i not in b_set:
-            a.pop(last - idx)
+    """Remove the items of "a" that are not in "b", in place"""
+    if not a:
+        return
+    b_set = b if isinstance(b, (set, frozenset, dict)) else set(b)
+    a[:] = [i for i in a if i in b_set]
 
 
 class SelectionModel(Observable):
@@ -0,0 +1,99 @@
+"""Persist the last-known status of each repository between sessions
+
+The snapshot is painted as soon as git-cola starts so that the file lists
+and branches are visible before the first refresh finishes.  The model is
+marked as stale until the live refresh replaces it.
+"""
+from __future__ import division, absolute_import, unicode_literals
+import hashlib
+
+from .. import core
+from .. import git
+from .. import gitcmds
+from .. import resources
+from ..settings import read_json
+from ..settings import write_json
+
+
+#: Bumped whenever the layout of the snapshot changes
+VERSION = 1
+
+# Model attributes that are saved as lists
+LISTS = ('staged', 'modified', 'unmerged', 'untracked', 'upstream_changed',
+         'local_branches', 'remote_branches', 'tags', 'remotes')
+
+# Model attributes that are saved as lists and restored as sets
+SETS = ('staged_deleted', 'unstaged_deleted', 'submodules')
+
+# Model attributes that are saved as-is
+VALUES = ('currentbranch', 'is_merging', 'is_rebasing')
+
+
+def path(worktree):
+    """Return the path to the snapshot for a worktree"""
+    key = hashlib.sha1(core.encode(worktree)).hexdigest()
+    return resources.config_home('snapshots', key + '.json')
+
+
+def capture(model, git=git):
+    """Return a snapshot of the model's status"""
+    values = {
+        'version': VERSION,
+        'worktree': git.worktree(),
+        'head': gitcmds.head_oid(),
+        'index': gitcmds.index_stat(),
+    }
+    for name in LISTS + VALUES:
+        values[name] = getattr(model, name)
+    for name in SETS:
+        values[name] = sorted(getattr(model, name))
+    return values
+
+
+def save(model, filename=None, git=git):
+    """Save the model's status, and return the snapshot"""
+    values = capture(model, git=git)
+    if filename is None:
+        filename = path(values['worktree'])
+    write_json(values, filename)
+    return values
+
+
+def load(filename=None, git=git):
+    """Return the saved snapshot for the current worktree, or None
+
+    Snapshots taken at another HEAD, or before the index was last
+    rewritten, are ignored; their staged files would be misleading.
+
+    """
+    worktree = git.worktree()
+    if not worktree:
+        return None
+    if filename is None:
+        filename = path(worktree)
+    if not core.exists(filename):
+        return None
+    values = read_json(filename)
+    if (values.get('version') != VERSION or
+            values.get('worktree') != worktree):
+        return None
+    if values.get('head') != gitcmds.head_oid():
+        return None
+    # The index stat is saved as a JSON list
+    index = gitcmds.index_stat()
+    if index is not None:
+        index = list(index)
+    if values.get('index') != index:
+        return None
+    return values
+
+
+def apply(model, values):
+    """Restore a snapshot into the model without running git"""
+    for name in LISTS:
+        setattr(model, name, list(values.get(name) or []))
+    for name in SETS:
+        setattr(model, name, set(values.get(name) or []))
+    model.currentbranch = values.get('currentbranch') or ''
+    model.is_merging = bool(values.get('is_merging'))
+    model.is_rebasing = bool(values.get('is_rebasing'))
@@ -0,0 +1,303 @@
+"""A virtualized Qt item model for very large lists of changed paths"""
+from __future__ import division, absolute_import, unicode_literals
+import array
+import bisect
+import os
+
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy.QtCore import Qt
+
+from .. import icons
+from ..i18n import N_
+from . import prefs
+
+
+# Item categories, in the same order as the status tree widget
+STAGED = 0
+UNMERGED = 1
+MODIFIED = 2
+UNTRACKED = 3
+END = 4
+
+#: Directories with at least this many entries within a category are
+#: collapsed into a single aggregated row that expands on demand.
+AGGREGATE_THRESHOLD = 1000
+
+
+class Category(object):
+    """The paths of one status category in a compact representation
+
+    "rows" holds one entry per visible row.  Non-negative values index
+    into "paths" and negative values refer to "aggregates", which are
+    (prefix, start, end) slices of "paths".
+
+    """
+    __slots__ = ('paths', 'deleted', 'rows', 'row_starts', 'aggregates')
+
+    def __init__(self, paths=None, deleted=None,
+                 threshold=AGGREGATE_THRESHOLD):
+        if paths is None:
+            paths = []
+        if not is_sorted(paths):
+            paths = sorted(paths)
+        self.paths = paths
+        self.deleted = deleted or set()
+        self.rows = array.array(str('l'))
+        self.row_starts = array.array(str('l'))
+        self.aggregates = []
+        self._group(threshold)
+
+    def _group(self, threshold):
+        paths = self.paths
+        count = len(paths)
+        idx = 0
+        while idx < count:
+            path = paths[idx]
+            slash = path.find('/')
+            if slash < 0:
+                end = idx + 1
+            else:
+                # "0" sorts right after "/" so this finds the end of the
+                # range of paths inside the top-level directory.
+                end = bisect.bisect_left(paths, path[:slash] + '0', idx)
+            if end - idx >= threshold:
+                prefix = common_dirname(paths[idx], paths[end - 1])
+                self.aggregates.append((prefix, idx, end))
+                self.rows.append(-len(self.aggregates))
+                self.row_starts.append(idx)
+            else:
+                self.rows.extend(range(idx, end))
+                self.row_starts.extend(range(idx, end))
+            idx = end
+
+    def __len__(self):
+        return len(self.rows)
+
+    def aggregate(self, row):
+        """Return the (prefix, start, end) aggregate for a row, or None"""
+        value = self.rows[row]
+        if value >= 0:
+            return None
+        return self.aggregates[-value - 1]
+
+    def paths_for_row(self, row):
+        """Return the paths represented by a row"""
+        value = self.rows[row]
+        if value >= 0:
+            return [self.paths[value]]
+        prefix, start, end = self.aggregates[-value - 1]
+        return self.paths[start:end]
+
+    def find(self, path):
+        """Return (row, child row or None) for a path, or None"""
+        idx = bisect.bisect_left(self.paths, path)
+        if idx >= len(self.paths) or self.paths[idx] != path:
+            return None
+        row = bisect.bisect_right(self.row_starts, idx) - 1
+        value = self.rows[row]
+        if value >= 0:
+            return (row, None)
+        prefix, start, end = self.aggregates[-value - 1]
+        return (row, idx - start)
+
+
+class StatusModel(QtCore.QAbstractItemModel):
+    """Presents the status categories without creating per-path items
+
+    Labels and icons are computed in data() only for the rows that the
+    view asks for.  Internal ids encode the parent of each index:
+    0 for categories, category + 1 for their rows, and
+    ((aggregate row + 1) << 3 | category + 1) for rows inside aggregates.
+
+    """
+
+    def __init__(self, parent=None):
+        QtCore.QAbstractItemModel.__init__(self, parent)
+        self.categories = [Category() for _ in range(END)]
+        self.headers = [
+            (N_('Staged'), icons.ok()),
+            (N_('Unmerged'), icons.compare()),
+            (N_('Modified'), icons.compare()),
+            (N_('Untracked'), icons.question()),
+        ]
+
+    def set_contents(self, staged, unmerged, modified, untracked,
+                     staged_deleted=None, unstaged_deleted=None,
+                     threshold=AGGREGATE_THRESHOLD):
+        self.beginResetModel()
+        self.categories = [
+            Category(staged, staged_deleted, threshold=threshold),
+            Category(unmerged, threshold=threshold),
+            Category(modified, unstaged_deleted, threshold=threshold),
+            Category(untracked, threshold=threshold),
+        ]
+        self.endResetModel()
+
+    def total(self):
+        """Return the number of paths in all categories"""
+        return sum(len(category.paths) for category in self.categories)
+
+    # Index helpers
+
+    def category_index(self, category):
+        return self.createIndex(category, 0, 0)
+
+    def path_index(self, category, path):
+        """Return the QModelIndex for a path, or an invalid index"""
+        found = self.categories[category].find(path)
+        if found is None:
+            return QtCore.QModelIndex()
+        row, child_row = found
+        if child_row is None:
+            return self.createIndex(row, 0, category + 1)
+        internal_id = ((row + 1) << 3) | (category + 1)
+        return self.createIndex(child_row, 0, internal_id)
+
+    def decode(self, index):
+        """Return (category, row, child row) for an index
+
+        "row" is None for category headers and "child row" is None
+        unless the index is inside an aggregate.
+
+        """
+        internal_id = index.internalId()
+        if internal_id == 0:
+            return (index.row(), None, None)
+        category = (internal_id & 7) - 1
+        aggregate_row = internal_id >> 3
+        if aggregate_row:
+            return (category, aggregate_row - 1, index.row())
+        return (category, index.row(), None)
+
+    def paths(self, index):
+        """Return (category, paths) for the paths represented by an index"""
+        category, row, child_row = self.decode(index)
+        if row is None:
+            return (category, [])
+        cat = self.categories[category]
+        if child_row is None:
+            return (category, cat.paths_for_row(row))
+        prefix, start, end = cat.aggregate(row)
+        return (category, [cat.paths[start + child_row]])
+
+    # QAbstractItemModel implementation
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if column != 0 or row < 0:
+            return QtCore.QModelIndex()
+        if not parent.isValid():
+            if row >= END:
+                return QtCore.QModelIndex()
+            return self.createIndex(row, 0, 0)
+        category, parent_row, child_row = self.decode(parent)
+        if child_row is not None:
+            return QtCore.QModelIndex()
+        if parent_row is None:
+            if row >= len(self.categories[category]):
+                return QtCore.QModelIndex()
+            return self.createIndex(row, 0, category + 1)
+        internal_id = ((parent_row + 1) << 3) | (category + 1)
+        return self.createIndex(row, 0, internal_id)
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        category, row, child_row = self.decode(index)
+        if row is None:
+            return QtCore.QModelIndex()
+        if child_row is None:
+            return self.createIndex(category, 0, 0)
+        return self.createIndex(row, 0, category + 1)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return END
+        if parent.column() != 0:
+            return 0
+        category, row, child_row = self.decode(parent)
+        if child_row is not None:
+            return 0
+        cat = self.categories[category]
+        if row is None:
+            return len(cat)
+        aggregate = cat.aggregate(row)
+        if aggregate is None:
+            return 0
+        prefix, start, end = aggregate
+        return end - start
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        category, row, child_row = self.decode(index)
+        if row is None:
+            return self._header_data(category, role)
+
+        cat = self.categories[category]
+        if child_row is None:
+            aggregate = cat.aggregate(row)
+            if aggregate is not None:
+                return self._aggregate_data(aggregate, role)
+            path = cat.paths[cat.rows[row]]
+        else:
+            prefix, start, end = cat.aggregate(row)
+            path = cat.paths[start + child_row]
+
+        if role == Qt.DisplayRole:
+            return path
+        if role == Qt.DecorationRole:
+            icon_name = icons.status(path, path in cat.deleted,
+                                     category == STAGED,
+                                     category == UNTRACKED)
+            return icons.from_name(icons.name_from_basename(icon_name))
+        return None
+
+    def _header_data(self, category, role):
+        text, icon = self.headers[category]
+        if role == Qt.DisplayRole:
+            return text
+        if role == Qt.DecorationRole:
+            return icon
+        if role == Qt.FontRole:
+            font = QtGui.QFont()
+            if prefs.bold_headers():
+                font.setBold(True)
+            else:
+                font.setItalic(True)
+            return font
+        return None
+
+    def _aggregate_data(self, aggregate, role):
+        prefix, start, end = aggregate
+        if role == Qt.DisplayRole:
+            return (N_('%(path)s (%(count)s files)') %
+                    dict(path=prefix, count='{:,}'.format(end - start)))
+        if role == Qt.DecorationRole:
+            return icons.directory()
+        return None
+
+
+def is_sorted(items):
+    """Return True when a list is in ascending order"""
+    return all(a <= b for a, b in zip(items, items[1:]))
+
+
+def common_dirname(first, last):
+    """Return the deepest directory, with a trailing "/", holding both paths
+
+    The paths must come from a sorted list, so that every path between
+    them shares the same directory.
+
+    """
+    prefix = os.path.commonprefix([first, last])
+    slash = prefix.rfind('/')
+    return prefix[:slash + 1]
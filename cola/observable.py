@@ -2,12 +2,36 @@
 """This module provides the Observable class"""
 from __future__ import division, absolute_import, unicode_literals
 
+import threading
+from contextlib import contextmanager
+
+
+class _Transactions(threading.local):
+    """The transaction state of an Observable, separate for each thread"""
+
+    def __init__(self):
+        self.depth = 0
+        self.pending = {}
+        self.order = []
+        self.delivered = set()
+
 
 class Observable(object):
     """Handles subject/observer notifications."""
+
+    #: Messages that are delivered right away during a transaction, e.g.
+    #: "about to change" messages that observers must see before a change.
+    #: They are still delivered only once per transaction.
+    immediate_messages = ()
+
     def __init__(self):
         self.notification_enabled = True
         self.observers = {}
+        # The number of times that each message has been delivered
+        self.notification_counts = {}
+        # A transaction only defers the notifications sent by its own
+        # thread, e.g. worker threads are not held back by the GUI thread.
+        self._transactions = _Transactions()
 
     def add_observer(self, message, observer):
         """Add an observer for a specific message."""
@@ -24,7 +48,63 @@ class Observable(object):
         """Pythonic signals and slots."""
         if not self.notification_enabled:
             return
+        transactions = self._transactions
+        if transactions.depth:
+            if message in self.immediate_messages:
+                if message in transactions.delivered:
+                    return
+                transactions.delivered.add(message)
+            else:
+                # Deliver once, with the most recent arguments, on commit()
+                if message not in transactions.pending:
+                    transactions.order.append(message)
+                transactions.pending[message] = (args, opts)
+                return
+        self._deliver(message, args, opts)
+
+    def _deliver(self, message, args, opts):
+        counts = self.notification_counts
+        counts[message] = counts.get(message, 0) + 1
         # observers can remove themselves during their callback so grab a copy
         observers = set(self.observers.get(message, set()))
         for method in observers:
             method(*args, **opts)
+
+    def begin(self):
+        """Defer notifications until the matching commit()
+
+        Transactions nest; notifications are delivered when the outermost
+        transaction is committed.  Only the notifications sent by the
+        calling thread are deferred.
+
+        """
+        self._transactions.depth += 1
+
+    def commit(self):
+        """Deliver the notifications that were deferred since begin()
+
+        Duplicate messages are delivered once, in the order in which they
+        were first sent.
+
+        """
+        transactions = self._transactions
+        transactions.depth -= 1
+        if transactions.depth:
+            return
+        pending = transactions.pending
+        order = transactions.order
+        transactions.pending = {}
+        transactions.order = []
+        transactions.delivered = set()
+        for message in order:
+            args, opts = pending[message]
+            self._deliver(message, args, opts)
+
+    @contextmanager
+    def transaction(self):
+        """Context manager that wraps begin() and commit()"""
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.commit()
@@ -0,0 +1,356 @@
+"""Schedules model refreshes so that overlapping requests are merged
+
+Refreshes are requested by the filesystem monitor, by commands such as
+Refresh and Rescan, at startup and when the window gains focus.  The
+scheduler merges the requests that arrive while a refresh is pending or
+running, so that the model is refreshed at most once per burst.
+"""
+from __future__ import division, absolute_import, unicode_literals
+import threading
+import time
+
+from qtpy import QtCore
+from qtpy.QtCore import Qt
+from qtpy.QtCore import Signal
+
+from . import core
+from . import fsmonitor
+from . import git
+from . import utils
+from .decorators import memoize
+from .i18n import N_
+from .interaction import Interaction
+from .models import main
+from .models.main import MainModel
+
+
+# Request priorities; lower values run first
+USER = 0  # e.g. the "Refresh" action
+BACKGROUND = 1  # e.g. the filesystem monitor
+
+
+@memoize
+def current():
+    """Return the refresh scheduler singleton"""
+    return RefreshScheduler()
+
+
+class Request(object):
+    """The pending refreshes, merged into one
+
+    `scopes` is a set of MainModel.scope_* values and `paths` limits the
+    refresh of the file lists to specific paths.  Paths are dropped once
+    the file lists are refreshed in full.  `signals` counts the filesystem
+    monitor signals that the request answers; the monitor holds back
+    further signals until each of them is reported as finished.
+
+    """
+    __slots__ = ('scopes', 'paths', 'update_index', 'priority',
+                 'signals', 'count', 'time')
+
+    def __init__(self, scopes=(), paths=None, update_index=False,
+                 priority=BACKGROUND, signals=0):
+        self.scopes = set(scopes)
+        if self.scopes & MainModel.scopes_files:
+            paths = None
+        self.paths = set(paths or ())
+        self.update_index = update_index
+        self.priority = priority
+        self.signals = signals
+        self.count = 1
+        self.time = time.time()
+
+    def merge(self, other, signals=True):
+        """Merge another request into this one
+
+        The other request's monitor signals are taken over unless
+        `signals` is False, e.g. when they are reported by the other
+        request once its own refresh finishes.
+
+        """
+        self.scopes.update(other.scopes)
+        if self.scopes & MainModel.scopes_files:
+            self.paths.clear()
+        else:
+            self.paths.update(other.paths)
+        self.update_index = self.update_index or other.update_index
+        self.priority = min(self.priority, other.priority)
+        if signals:
+            self.signals += other.signals
+        self.count += other.count
+        self.time = min(self.time, other.time)
+
+    def covers(self, other):
+        """Return True when running this request makes `other` redundant"""
+        if other.update_index and not self.update_index:
+            return False
+        if not other.scopes <= self.scopes:
+            return False
+        if self.scopes & MainModel.scopes_files:
+            return True
+        return other.paths <= self.paths
+
+    def is_user(self):
+        return self.priority == USER
+
+
+class RefreshScheduler(QtCore.QObject):
+    """Runs one model refresh at a time and merges the requests in between
+
+    User requests run on the next pass through the event loop.
+    Background requests wait briefly so that bursts are merged.  A running
+    refresh is cancelled when a new request supersedes it, either because
+    the new request covers all of its work or because the new request
+    comes from the user and the running one does not.  The cancelled work
+    is merged into the new request, so nothing is lost.  The new request
+    waits until the cancelled worker stops so that their git commands,
+    e.g. "update-index --refresh", do not race for the index lock.
+
+    The git queries run in a worker thread.  Their results are applied to
+    the model on the main thread.
+
+    """
+    #: Delay before background requests run, in milliseconds
+    BACKGROUND_DELAY = 100
+
+    # Emitted by the worker thread once the git queries finish
+    _queried = Signal(object)
+
+    def __init__(self, model=None, monitor=None, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self._model = model
+        self._monitor = monitor
+        self._thread = None
+        self.pending = None
+        self.running = None  # (request, cancel event)
+        # Metrics
+        self.completed = 0
+        self.cancelled = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._dispatch)
+        self._queried.connect(self._finished, type=Qt.QueuedConnection)
+
+    def model(self):
+        if self._model is None:
+            self._model = main.model()
+        return self._model
+
+    def monitor(self):
+        if self._monitor is None:
+            self._monitor = fsmonitor.current()
+        return self._monitor
+
+    def request(self, scopes=None, paths=None, update_index=False,
+                priority=BACKGROUND, monitor=False):
+        """Request a refresh of `scopes` and `paths`
+
+        Everything is refreshed when neither are specified.  `monitor` is
+        True when the request answers a filesystem monitor signal.
+        Monitor requests skip the file lists when the index changed only
+        because cola wrote it.
+
+        """
+        if scopes is None and not paths:
+            scopes = MainModel.scopes_all
+        if (monitor and scopes and MainModel.scope_index in scopes and
+                self.model().index_is_fresh()):
+            # The index was rewritten by cola itself, e.g. by staging, and
+            # the model was updated right after the write.
+            scopes = set(scopes)
+            scopes.discard(MainModel.scope_index)
+            if not scopes and not paths:
+                self.monitor().refresh_finished(0.0)
+                return
+        request = Request(scopes=scopes or (), paths=paths,
+                          update_index=update_index, priority=priority,
+                          signals=int(bool(monitor)))
+        if self.pending is None:
+            self.pending = request
+        else:
+            self.pending.merge(request)
+        self._supersede()
+        self._schedule()
+
+    def refresh(self, update_index=True, priority=USER):
+        """Request a refresh of the entire model"""
+        self.request(update_index=update_index, priority=priority)
+
+    def queue_depth(self):
+        """Return the number of requests that have not been applied yet"""
+        depth = 0
+        if self.pending is not None:
+            depth += self.pending.count
+        running = self._running_request()
+        if running is not None:
+            depth += running.count
+        return depth
+
+    def latency(self):
+        """Return the age of the oldest unapplied request, in seconds
+
+        The time between the request and the refreshed model is reported
+        by "last_latency" and "max_latency" once a refresh is applied.
+
+        """
+        times = []
+        if self.pending is not None:
+            times.append(self.pending.time)
+        running = self._running_request()
+        if running is not None:
+            times.append(running.time)
+        if not times:
+            return 0.0
+        return time.time() - min(times)
+
+    def flush(self):
+        """Run the pending refresh synchronously, e.g. without an event loop"""
+        self._timer.stop()
+        if self.running is not None:
+            request, cancel = self.running
+            if not cancel.is_set():
+                cancel.set()
+                self._merge_pending(request)
+                self.cancelled += 1
+            # The worker's result may never be delivered without an event
+            # loop, so it is waited for and reported here.
+            if self._thread is not None:
+                self._thread.join()
+            self.running = None
+            self._report(request, 0.0)
+        request = self.pending
+        if request is None:
+            return
+        self.pending = None
+        cancel = threading.Event()
+        self.running = (request, cancel)
+        self._finished(self._query(request, cancel))
+
+    def _running_request(self):
+        """Return the running request unless it was superseded"""
+        if self.running is None:
+            return None
+        request, cancel = self.running
+        if cancel.is_set():
+            # Its work was merged into the pending request
+            return None
+        return request
+
+    def _merge_pending(self, request):
+        """Carry the work of an unfinished request over to the pending one
+
+        Its monitor signals stay with it and are reported by _finished().
+
+        """
+        if self.pending is None:
+            self.pending = request
+        else:
+            self.pending.merge(request, signals=False)
+
+    def _supersede(self):
+        request = self._running_request()
+        if request is None:
+            return
+        pending = self.pending
+        if pending.priority < request.priority or pending.covers(request):
+            # The worker stops soon; _finished() then runs the pending
+            # request.
+            self.running[1].set()
+            self._merge_pending(request)
+            self.cancelled += 1
+
+    def _schedule(self):
+        if self.running is not None or self.pending is None:
+            # _finished() schedules the pending request
+            return
+        if self.pending.is_user():
+            self._timer.start(0)
+        elif not self._timer.isActive():
+            # Restarting the timer for every request could starve a
+            # refresh while events keep arriving, so it is left running.
+            self._timer.start(self.BACKGROUND_DELAY)
+
+    def _dispatch(self):
+        if self.running is not None or self.pending is None:
+            return
+        request = self.pending
+        self.pending = None
+        cancel = threading.Event()
+        self.running = (request, cancel)
+
+        thread = threading.Thread(target=self._run, args=(request, cancel))
+        thread.daemon = True
+        self._thread = thread
+        thread.start()
+
+    def _run(self, request, cancel):
+        self._queried.emit(self._query(request, cancel))
+
+    def _query(self, request, cancel):
+        model = self.model()
+        generation = model.generation
+        start = time.time()
+        update = error = None
+        try:
+            update = model.query_scopes(
+                    request.scopes, paths=request.paths,
+                    update_index=request.update_index, cancel=cancel)
+        except Exception as e:
+            error = e
+        return (request, cancel, update, error, start, generation)
+
+    def _finished(self, result):
+        request, cancel, update, error, start, generation = result
+        if self.running is not None and self.running[1] is cancel:
+            self.running = None
+        # Reported however the request ended so that the monitor does not
+        # hold back its notifications
+        self._report(request, time.time() - start)
+        if cancel.is_set():
+            # Superseded; its work was merged into a newer request
+            self._schedule()
+            return
+
+        if update is not None and generation != self.model().generation:
+            # The model was updated directly while the queries ran, so
+            # these results may be older than what it already shows.
+            self._merge_pending(request)
+            self.cancelled += 1
+        elif error is not None:
+            msg, details = utils.format_exception(error)
+            Interaction.critical(N_('Error'), message=msg, details=details)
+        elif update is not None:
+            self.model().apply_update(update)
+            self._record(request, time.time() - start)
+
+        self._schedule()
+
+    def _record(self, request, elapsed):
+        latency = time.time() - request.time
+        self.completed += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        if git.GIT_COLA_TRACE:
+            core.stderr('refresh: %d request(s) in %.3fs, '
+                        '%.3fs latency, %d queued' %
+                        (request.count, elapsed, latency, self.queue_depth()))
+
+        # New tracked directories or ref directories need to be watched
+        if request.scopes - set((MainModel.scope_state,
+                                 MainModel.scope_config)):
+            self.monitor().refresh()
+
+    def _report(self, request, elapsed):
+        """Report the monitor signals answered by a request as finished
+
+        The monitor paces its notifications by how long refreshes take.
+        Each signal is reported once, even when the request is reported
+        again.
+
+        """
+        if request.signals:
+            self.monitor().refresh_finished(elapsed, count=request.signals)
+            request.signals = 0
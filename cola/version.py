@@ -26,6 +26,8 @@ _versions = {
     # git check-ignore was introduced in 1.8.2, but did not follow the same
     # rules as git add and git status until 1.8.5
     'check-ignore': '1.8.5',
+    # git add and git reset learned --pathspec-from-file in 2.25.0
+    'pathspec-from-file': '2.25.0',
 }
 
 
@@ -1,4 +1,5 @@
 from __future__ import division, absolute_import, unicode_literals
+import threading
 
 from qtpy.QtCore import Qt
 from qtpy.QtCore import Signal
@@ -17,6 +18,7 @@ from ..interaction import Interaction
 from ..models import browse
 from ..models import main
 from ..compat import ustr
+from ..decorators import memoize
 from .. import cmds
 from .. import core
 from .. import gitcmds
@@ -42,16 +44,73 @@ def worktree_browser(parent=None, update=True, settings=None, show=False):
     return view
 
 
-def save_path(path, model):
-    """Choose an output filename based on the selected path"""
+def save_path(path, model, parent=None, runtask=None, finish=None):
+    """Choose an output filename and save the blob in the background
+
+    `finish` is called with the SaveBlobTask once the blob is saved, and
+    defaults to reporting the outcome with blob_saved().
+    Returns False when no filename was chosen.
+
+    """
     filename = qtutils.save_as(model.filename)
-    if filename:
-        model.filename = filename
-        cmds.do(SaveBlob, model)
-        result = True
-    else:
-        result = False
-    return result
+    if not filename:
+        return False
+    model.filename = filename
+    if runtask is None:
+        runtask = save_runtask()
+    if finish is None:
+        finish = blob_saved
+    task = SaveBlobTask(model, parent)
+    progress = standard.ProgressDialog(N_('Save'),
+                                       N_('Saving "%s"') % path, parent)
+    progress.setAutoReset(False)
+    progress.setAutoClose(False)
+    progress.setCancelButtonText(N_('Cancel'))
+    progress.canceled.connect(task.cancel.set)
+    task.channel.progress.connect(
+            lambda written, total: update_progress(progress, written, total),
+            type=Qt.QueuedConnection)
+    runtask.start(task, progress=progress, finish=finish)
+    return True
+
+
+@memoize
+def save_runtask():
+    """Return the RunTask that saves blobs for callers without their own"""
+    return qtutils.RunTask()
+
+
+def blob_saved(task):
+    """Report the outcome of a SaveBlobTask and return its status
+
+    This runs on the GUI thread since logging updates the log widget.
+
+    """
+    cmd = task.cmd
+    model = cmd.model
+    msg = (N_('Saved "%(filename)s" from "%(ref)s" to "%(destination)s"') %
+           dict(filename=model.relpath,
+                ref=model.ref,
+                destination=model.filename))
+    Interaction.log_status(cmd.status, msg, cmd.err)
+    if cmd.status == 0:
+        Interaction.information(
+                N_('File Saved'),
+                N_('File saved to "%s"') % model.filename)
+    elif not task.cancel.is_set():
+        Interaction.critical(N_('Error'),
+                             message=N_('Unable to save "%s"') %
+                             model.relpath,
+                             details=cmd.err)
+    return cmd.status
+
+
+def update_progress(progress, written, total):
+    """Show the fraction of the blob that has been saved"""
+    if not total:
+        return
+    progress.setRange(0, 1000)
+    progress.setValue(min(1000, written * 1000 // total))
 
 
 class Browser(standard.Widget):
@@ -212,14 +271,11 @@ class RepoTreeView(standard.TreeView):
             return
         path = item.path
 
+        # populate() also looks up the new child entries
         model = self.model()
         model.populate(item)
         model.update_entry(path)
 
-        for row in range(item.rowCount()):
-            path = item.child(row, 0).path
-            model.update_entry(path)
-
         item.cached = True
 
     def index_collapsed(self, index):
@@ -323,12 +379,14 @@ class RepoTreeView(standard.TreeView):
         return super(RepoTreeView, self).event(ev)
 
     def apply_data(self, data):
-        entry = self.model().get(data[0])
-        if entry:
-            entry[1].set_status(data[1])
-            entry[2].setText(data[2])
-            entry[3].setText(data[3])
-            entry[4].setText(data[4])
+        model = self.model()
+        for path, status, message, author, date in data:
+            entry = model.get(path)
+            if entry:
+                entry[1].set_status(status)
+                entry[2].setText(message)
+                entry[3].setText(author)
+                entry[4].setText(date)
 
     def update_actions(self):
         """Enable/disable actions."""
@@ -519,28 +577,56 @@ class BrowseModel(object):
 
 
 class SaveBlob(BaseCommand):
+    """Save a blob from `model.ref` to `model.filename`
+
+    The blob is streamed to the file in chunks, see gitcmds.export_blob().
 
-    def __init__(self, model):
+    """
+
+    def __init__(self, model, progress=None, cancel=None):
         BaseCommand.__init__(self)
         self.model = model
+        self.progress = progress
+        self.cancel = cancel
+        self.status = None
+        self.err = ''
 
     def do(self):
         model = self.model
-        cmd = ['git', 'show', '%s:%s' % (model.ref, model.relpath)]
-        with core.xopen(model.filename, 'wb') as fp:
-            proc = core.start_command(cmd, stdout=fp)
-            out, err = proc.communicate()
-
-        status = proc.returncode
-        msg = (N_('Saved "%(filename)s" from "%(ref)s" to "%(destination)s"') %
-               dict(filename=model.relpath,
-                    ref=model.ref,
-                    destination=model.filename))
-        Interaction.log_status(status, msg, '')
+        obj = '%s:%s' % (model.ref, model.relpath)
+        status, out, err = gitcmds.export_blob(obj, model.filename,
+                                               progress=self.progress,
+                                               cancel=self.cancel)
+        self.status = status
+        self.err = err
+        return status
 
-        Interaction.information(
-                N_('File Saved'),
-                N_('File saved to "%s"') % model.filename)
+
+class SaveBlobChannel(qtutils.Channel):
+    #: Emitted with (bytes written, total bytes) while a blob is saved
+    progress = Signal(object, object)
+
+
+class SaveBlobTask(qtutils.Task):
+    """Runs SaveBlob in the background and reports its progress"""
+
+    def __init__(self, model, parent):
+        qtutils.Task.__init__(self, parent)
+        self.channel = SaveBlobChannel()
+        self.cancel = threading.Event()
+        self.cmd = SaveBlob(model, progress=self.channel.progress.emit,
+                            cancel=self.cancel)
+
+    def task(self):
+        try:
+            return self.cmd.do()
+        except Exception as e:
+            # The progress dialog stays up until the task finishes, so
+            # errors are reported by the finish handler instead.
+            _, details = utils.format_exception(e)
+            self.cmd.status = 1
+            self.cmd.err = details
+            return self.cmd.status
 
 
 class BrowseDialog(QtWidgets.QDialog):
@@ -602,6 +688,7 @@ class BrowseDialog(QtWidgets.QDialog):
 
         # updated for use by commands
         self.model = model
+        self.runtask = qtutils.RunTask(parent=self)
 
         # widgets
         self.tree = GitTreeWidget(parent=self)
@@ -651,8 +738,15 @@ class BrowseDialog(QtWidgets.QDialog):
     def save_path(self, path):
         """Choose an output filename based on the selected path"""
         self.path_chosen(path, close=False)
-        if save_path(path, self.model):
+        if save_path(path, self.model, self, self.runtask, self.blob_saved):
+            self.save.setEnabled(False)
+
+    def blob_saved(self, task):
+        """Close the dialog once the blob is saved"""
+        if blob_saved(task) == 0:
             self.accept()
+        else:
+            self.selection_changed()
 
     def save_blob(self):
         """Save the currently selected file"""
@@ -789,6 +883,7 @@ class GitFileTreeModel(QtGui.QStandardItemModel):
 
 
 class GitTreeModel(GitFileTreeModel):
+    """Presents the tree of a ref, reading each directory as it is expanded"""
 
     def __init__(self, ref, parent):
         GitFileTreeModel.__init__(self, parent)
@@ -796,27 +891,51 @@ class GitTreeModel(GitFileTreeModel):
         self._initialize()
 
     def _initialize(self):
-        """Iterate over git-ls-tree and create GitTreeItems."""
-        status, out, err = git.ls_tree('--full-tree', '-r', '-t', '-z',
-                                       self.ref)
+        """Create GitTreeItems for the top-level tree"""
+        status, out, err = git.rev_parse(self.ref + '^{tree}', _readonly=True)
         if status != 0:
             Interaction.log_status(status, out, err)
             return
+        self._populate(self.invisibleRootItem(), '', out.strip())
 
-        if not out:
+    def _populate(self, parent, dirname, oid):
+        """Add the entries of the tree `oid`, directories first"""
+        entries = gitcmds.tree_entries(oid)
+        if entries is None:
             return
+        dirs = []
+        files = []
+        for mode, objtype, entry_oid, name in entries:
+            path = dirname + name
+            if objtype == 'tree':
+                dirs.append(GitTreeItem(path, True, oid=entry_oid))
+            elif objtype == 'blob':
+                files.append(GitTreeItem(path, False))
+        for item in dirs + files:
+            parent.appendRow(item)
+
+    def _unloaded_dir(self, index):
+        if not index.isValid():
+            return None
+        item = self.itemFromIndex(index)
+        if item is None or not item.is_dir or item.loaded:
+            return None
+        return item
 
-        for line in out[:-1].split('\0'):
-            # .....6 ...4 ......................................40
-            # 040000 tree c127cde9a0c644a3a8fef449a244f47d5272dfa6	relative
-            # 100644 blob 139e42bf4acaa4927ec9be1ec55a252b97d3f1e2	relative/path
-            objtype = line[7]
-            relpath = line[6 + 1 + 4 + 1 + 40 + 1:]
-            if objtype == 't':
-                parent = self.dir_entries[utils.dirname(relpath)]
-                self.add_directory(parent, relpath)
-            elif objtype == 'b':
-                self.add_file(relpath)
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if self._unloaded_dir(parent) is not None:
+            return True
+        return GitFileTreeModel.hasChildren(self, parent)
+
+    def canFetchMore(self, parent):
+        return self._unloaded_dir(parent) is not None
+
+    def fetchMore(self, parent):
+        item = self._unloaded_dir(parent)
+        if item is None:
+            return
+        item.loaded = True
+        self._populate(item, item.path + '/', item.oid)
 
 
 class GitTreeItem(QtGui.QStandardItem):
@@ -828,10 +947,13 @@ class GitTreeItem(QtGui.QStandardItem):
     Each GitRepoItem manages a different cell in the tree view.
 
     """
-    def __init__(self, path, is_dir):
+    def __init__(self, path, is_dir, oid=None):
         QtGui.QStandardItem.__init__(self)
         self.is_dir = is_dir
         self.path = path
+        # Directories with a tree oid are read when they are expanded
+        self.oid = oid
+        self.loaded = oid is None
         self.setEditable(False)
         self.setDragEnabled(False)
         self.setText(utils.basename(path))
@@ -1,5 +1,9 @@
 from __future__ import division, absolute_import, unicode_literals
+import itertools
+import operator
 import re
+import threading
+import weakref
 
 from qtpy import QtCore
 from qtpy import QtGui
@@ -8,10 +12,12 @@ from qtpy.QtCore import Qt
 from qtpy.QtCore import Signal
 
 from .. import core
+from .. import fuzzy
 from .. import gitcmds
 from .. import icons
 from .. import qtutils
 from .. import utils
+from ..decorators import memoize
 from ..models import main
 from . import defs
 from . import text
@@ -242,25 +248,25 @@ class CompletionLineEdit(text.HintedLineEdit):
 
 
 class GatherCompletionsThread(QtCore.QThread):
+    """Gathers the matches for the model's query in the background
 
+    The gather is abandoned once the model's `cancel` event is set.  The
+    model starts a new gather for the latest query when this one finishes.
+
+    """
     items_gathered = Signal(object)
 
     def __init__(self, model):
         QtCore.QThread.__init__(self)
         self.model = model
         self.case_sensitive = False
+        self.serial = 0
 
     def run(self):
-        text = None
-        # Loop when the matched text changes between the start and end time.
-        # This happens when gather_matches() takes too long and the
-        # model's match_text changes in-between.
-        while text != self.model.match_text:
-            text = self.model.match_text
-            items = self.model.gather_matches(self.case_sensitive)
-
-        if text is not None:
-            self.items_gathered.emit(items)
+        model = self.model
+        items = model.gather_matches(self.case_sensitive)
+        if not model.cancel.is_set():
+            self.items_gathered.emit((self.serial, items))
 
 
 class HighlightDelegate(QtWidgets.QStyledItemDelegate):
@@ -344,15 +350,30 @@ class CompletionModel(QtGui.QStandardItemModel):
     items_gathered = Signal(object)
     model_updated = Signal()
 
+    #: Keystrokes that arrive within this many milliseconds are gathered once
+    DEBOUNCE_DELAY = 100
+
     def __init__(self, parent):
         QtGui.QStandardItemModel.__init__(self, parent)
         self.match_text = ''
         self.full_text = ''
         self.case_sensitive = False
+        # Incremented whenever the query changes; stale results are dropped
+        self.serial = 0
+        # Set to abandon the gather that is running
+        self.cancel = threading.Event()
+        # Narrowing state for each shared CompletionIndex
+        self._histories = weakref.WeakKeyDictionary()
 
         self.update_thread = GatherCompletionsThread(self)
-        self.update_thread.items_gathered.connect(self.apply_matches,
+        self.update_thread.items_gathered.connect(self._items_gathered,
                                                   type=Qt.QueuedConnection)
+        self.update_thread.finished.connect(self._gather_finished,
+                                            type=Qt.QueuedConnection)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._gather)
 
     def update(self):
         case_sensitive = self.update_thread.case_sensitive
@@ -365,9 +386,39 @@ class CompletionModel(QtGui.QStandardItemModel):
 
     def update_matches(self, case_sensitive):
         self.case_sensitive = case_sensitive
-        self.update_thread.case_sensitive = case_sensitive
-        if not self.update_thread.isRunning():
-            self.update_thread.start()
+        self.serial += 1
+        # The running gather is for an older query
+        self.cancel.set()
+        self._timer.start(self.DEBOUNCE_DELAY)
+
+    def _gather(self):
+        thread = self.update_thread
+        if thread.isRunning():
+            # _gather_finished() starts the next gather
+            return
+        self.cancel.clear()
+        thread.case_sensitive = self.case_sensitive
+        thread.serial = self.serial
+        thread.start()
+
+    def _gather_finished(self):
+        thread = self.update_thread
+        if thread.serial != self.serial and not self._timer.isActive():
+            self._gather()
+
+    def _items_gathered(self, result):
+        serial, items = result
+        if serial == self.serial:
+            self.apply_matches(items)
+
+    def filter_index(self, index, case_sensitive):
+        """Filter a shared CompletionIndex by the current match text"""
+        try:
+            history = self._histories[index]
+        except KeyError:
+            history = self._histories[index] = {}
+        return index.filter(self.match_text, case_sensitive,
+                            history=history, cancel=self.cancel)
 
     def gather_matches(self, case_sensitive):
         return ((), (), set())
@@ -401,6 +452,10 @@ class CompletionModel(QtGui.QStandardItemModel):
         self.updated.emit()
 
 
+#: The number of paths that are completed by fuzzy matching
+FUZZY_LIMIT = 100
+
+
 def _identity(x):
     return x
 
@@ -409,34 +464,202 @@ def _lower(x):
     return x.lower()
 
 
-def filter_matches(match_text, candidates, case_sensitive,
-                   sort_key=lambda x: x):
-    """Filter candidates and return the matches"""
+class CompletionIndex(object):
+    """Match keys and sort order precomputed for a snapshot of candidates
 
-    if case_sensitive:
-        case_transform = _identity
-    else:
-        case_transform = _lower
+    The candidates are lowercased and sorted once per case sensitivity.
+    Filtering a sorted list keeps it sorted, so matches are never sorted
+    again.  The matches for the recent queries are kept so that a query
+    that contains one of them, e.g. after typing another character, only
+    filters the earlier matches.
 
-    if match_text:
-        match_text = case_transform(match_text)
-        matches = [r for r in candidates if match_text in case_transform(r)]
-    else:
-        matches = list(candidates)
+    """
+    #: The number of narrowed match lists that are kept
+    MAX_HISTORY = 32
 
-    matches.sort(key=lambda x: sort_key(case_transform(x)))
-    return matches
+    #: The number of candidates that are scanned between checks for
+    #: cancellation
+    CHUNK_SIZE = 65536
 
+    def __init__(self, candidates, sort_key=_identity, dirs=None):
+        self.candidates = list(candidates)
+        self.sort_key = sort_key
+        self.dirs = dirs or set()
+        self._entries = {}
+        self._history = {}
+        self._lock = threading.Lock()
 
-def filter_path_matches(match_text, file_list, case_sensitive):
-    """Return matching completions from a list of candidate files"""
+    def entries(self, case_sensitive):
+        """Return the match keys and the candidates, in sort order"""
+        with self._lock:
+            try:
+                return self._entries[case_sensitive]
+            except KeyError:
+                pass
+            if case_sensitive:
+                case_transform = _identity
+            else:
+                case_transform = _lower
+            sort_key = self.sort_key
+            pairs = [(case_transform(c), c) for c in self.candidates]
+            pairs.sort(key=lambda pair: sort_key(pair[0]))
+            entries = ([key for key, c in pairs], [c for key, c in pairs])
+            self._entries[case_sensitive] = entries
+            return entries
+
+    def filter(self, match_text, case_sensitive, history=None, cancel=None):
+        """Return the candidates that contain match_text, in sort order
+
+        `history` is a dict that holds the recent matches of one consumer.
+        Consumers that share an index pass their own so that they do not
+        discard each other's matches.  An empty list is returned once the
+        optional `cancel` event is set.
 
+        """
+        keys, values = self.entries(case_sensitive)
+        if not case_sensitive:
+            match_text = match_text.lower()
+        if history is None:
+            history = self._history
+        # (query, match keys, candidates) for recent queries, where each
+        # query contains the query before it
+        history = history.setdefault(case_sensitive, [])
+        while history and history[-1][0] not in match_text:
+            history.pop()
+        if history:
+            query, keys, values = history[-1]
+            if query == match_text:
+                return list(values)
+        if match_text:
+            # map() and compress() keep the scan out of the interpreter loop
+            repeat = itertools.repeat(match_text)
+            mask = []
+            for start in range(0, len(keys), self.CHUNK_SIZE):
+                if cancel is not None and cancel.is_set():
+                    return []
+                chunk = keys[start:start + self.CHUNK_SIZE]
+                mask.extend(map(operator.contains, chunk, repeat))
+            keys = list(itertools.compress(keys, mask))
+            values = list(itertools.compress(values, mask))
+            history.append((match_text, keys, values))
+            if len(history) > self.MAX_HISTORY:
+                history.pop(0)
+        return list(values)
+
+
+def path_index(file_list):
+    """Return a CompletionIndex for files and their parent directories"""
     files = set(file_list)
     files_and_dirs = utils.add_parents(files)
     dirs = files_and_dirs.difference(files)
+    return CompletionIndex(files_and_dirs, dirs=dirs)
+
+
+def extend_fuzzy_matches(paths, matcher, match_text, cancel=None,
+                         limit=FUZZY_LIMIT):
+    """Append the best fuzzy matches that are not already in paths
+
+    Fuzzy matches are only searched when there are fewer than `limit`
+    paths, so short queries that already match plenty are not ranked.
+
+    """
+    if not match_text or len(paths) >= limit:
+        return paths
+    seen = set(paths)
+    for path in matcher.ranked(match_text, limit=limit, cancel=cancel):
+        if path not in seen:
+            paths.append(path)
+    return paths
+
+
+def filter_matches(match_text, candidates, case_sensitive,
+                   sort_key=lambda x: x):
+    """Filter candidates and return the matches"""
+    index = CompletionIndex(candidates, sort_key=sort_key)
+    return index.filter(match_text, case_sensitive)
+
+
+def filter_path_matches(match_text, file_list, case_sensitive):
+    """Return matching completions from a list of candidate files"""
+    index = path_index(file_list)
+    paths = index.filter(match_text, case_sensitive)
+    return (paths, index.dirs)
+
+
+@memoize
+def provider():
+    """Return the CompletionProvider singleton"""
+    return CompletionProvider()
+
 
-    paths = filter_matches(match_text, files_and_dirs, case_sensitive)
-    return (paths, dirs)
+class CompletionProvider(object):
+    """Shares the completion indexes between all of the completion models
+
+    The indexes are built on first use, so every open line edit shares one
+    copy of the refs and of the tracked files.  Each index is only built
+    again when the data that it was built from changes, e.g. refreshing
+    the file lists does not rebuild the indexes of the refs.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._indexes = {}  # name -> (key, index)
+
+    def index(self, name, factory, key=None):
+        """Return the index called `name`, building it with factory()
+
+        `key` identifies the data that the index is built from.  The index
+        is built again when the key differs from the one it was built with.
+
+        """
+        # The lock is held while building so that concurrent gathers
+        # do not build the same index twice.  It is reentrant because
+        # indexes are built from other indexes.
+        with self._lock:
+            try:
+                index_key, index = self._indexes[name]
+            except KeyError:
+                pass
+            else:
+                if index_key == key:
+                    return index
+            index = factory()
+            self._indexes[name] = (key, index)
+        return index
+
+    @staticmethod
+    def tracked_key():
+        """Return the key of the tracked files
+
+        "git ls-files" lists the index, so the tracked files only change
+        when the index is rewritten.
+
+        """
+        return gitcmds.index_stat()
+
+    def tracked_files(self):
+        """Return the list of tracked files"""
+        return self.index('tracked-files', gitcmds.tracked_files,
+                          key=self.tracked_key())
+
+    def tracked_paths(self):
+        """Return the index of the tracked files and their directories"""
+        key = self.tracked_key()
+        return self.index('tracked',
+                          lambda: path_index(self.tracked_files()), key=key)
+
+    def tracked_matcher(self):
+        """Return the fuzzy.Matcher for the tracked files"""
+        key = self.tracked_key()
+        return self.index('tracked-fuzzy',
+                          lambda: fuzzy.Matcher(self.tracked_files()),
+                          key=key)
+
+    def reset(self):
+        """Drop the indexes so that they are built again"""
+        with self._lock:
+            self._indexes = {}
 
 
 class Completer(QtWidgets.QCompleter):
@@ -462,15 +685,32 @@ class Completer(QtWidgets.QCompleter):
 
 class GitCompletionModel(CompletionModel):
 
+    #: The name of the shared index of matches()
+    index_name = 'none'
+    #: The main model attributes that matches() is built from
+    index_sources = ()
+
     def __init__(self, parent):
         CompletionModel.__init__(self, parent)
         self.main_model = model = main.model()
         msg = model.message_updated
         model.add_observer(msg, self.emit_model_updated)
 
+    def index_key(self):
+        """Return the key of the shared index, see CompletionProvider"""
+        model = self.main_model
+        return tuple(tuple(getattr(model, name))
+                     for name in self.index_sources)
+
+    def ref_index(self):
+        """Return the shared CompletionIndex for matches()"""
+        return provider().index(
+                self.index_name,
+                lambda: CompletionIndex(self.matches(), sort_key=ref_sort_key),
+                key=self.index_key())
+
     def gather_matches(self, case_sensitive):
-        refs = filter_matches(self.match_text, self.matches(), case_sensitive,
-                              sort_key=ref_sort_key)
+        refs = self.filter_index(self.ref_index(), case_sensitive)
         return (refs, (), set())
 
     def emit_model_updated(self):
@@ -489,6 +729,9 @@ class GitCompletionModel(CompletionModel):
 class GitRefCompletionModel(GitCompletionModel):
     """Completer for branches and tags"""
 
+    index_name = 'refs'
+    index_sources = ('local_branches', 'remote_branches', 'tags')
+
     def __init__(self, parent):
         GitCompletionModel.__init__(self, parent)
 
@@ -500,6 +743,9 @@ class GitRefCompletionModel(GitCompletionModel):
 class GitPotentialBranchCompletionModel(GitCompletionModel):
     """Completer for branches, tags, and potential branches"""
 
+    index_name = 'potential-branches'
+    index_sources = ('local_branches', 'remote_branches', 'tags', 'remotes')
+
     def __init__(self, parent):
         GitCompletionModel.__init__(self, parent)
 
@@ -531,6 +777,9 @@ class GitPotentialBranchCompletionModel(GitCompletionModel):
 class GitBranchCompletionModel(GitCompletionModel):
     """Completer for remote branches"""
 
+    index_name = 'branches'
+    index_sources = ('local_branches',)
+
     def __init__(self, parent):
         GitCompletionModel.__init__(self, parent)
 
@@ -542,6 +791,9 @@ class GitBranchCompletionModel(GitCompletionModel):
 class GitRemoteBranchCompletionModel(GitCompletionModel):
     """Completer for remote branches"""
 
+    index_name = 'remote-branches'
+    index_sources = ('remote_branches',)
+
     def __init__(self, parent):
         GitCompletionModel.__init__(self, parent)
 
@@ -559,16 +811,33 @@ class GitPathCompletionModel(GitCompletionModel):
     def candidate_paths(self):
         return []
 
+    def path_index(self):
+        """Return the shared CompletionIndex for candidate_paths()"""
+        return provider().index(
+                self.index_name, lambda: path_index(self.candidate_paths()),
+                key=self.index_key())
+
+    def fuzzy_matcher(self):
+        """Return the shared fuzzy.Matcher for candidate_paths()"""
+        return provider().index(
+                self.index_name + '-fuzzy',
+                lambda: fuzzy.Matcher(self.candidate_paths()),
+                key=self.index_key())
+
     def gather_matches(self, case_sensitive):
-        paths, dirs = filter_path_matches(self.match_text,
-                                          self.candidate_paths(),
-                                          case_sensitive)
-        return ((), paths, dirs)
+        index = self.path_index()
+        paths = self.filter_index(index, case_sensitive)
+        extend_fuzzy_matches(paths, self.fuzzy_matcher(), self.match_text,
+                             cancel=self.cancel)
+        return ((), paths, index.dirs)
 
 
 class GitStatusFilterCompletionModel(GitPathCompletionModel):
     """Completer for modified files and folders for status filtering"""
 
+    index_name = 'status'
+    index_sources = ('staged', 'unmerged', 'modified', 'untracked')
+
     def __init__(self, parent):
         GitPathCompletionModel.__init__(self, parent)
 
@@ -583,20 +852,12 @@ class GitTrackedCompletionModel(GitPathCompletionModel):
 
     def __init__(self, parent):
         GitPathCompletionModel.__init__(self, parent)
-        self.model_updated.connect(self.gather_paths, type=Qt.QueuedConnection)
-        self._paths = []
 
-    def gather_paths(self):
-        self._paths = gitcmds.tracked_files()
+    def path_index(self):
+        return provider().tracked_paths()
 
-    def gather_matches(self, case_sensitive):
-        if not self._paths:
-            self.gather_paths()
-
-        refs = []
-        paths, dirs = filter_path_matches(self.match_text, self._paths,
-                                          case_sensitive)
-        return (refs, paths, dirs)
+    def fuzzy_matcher(self):
+        return provider().tracked_matcher()
 
 
 class GitLogCompletionModel(GitRefCompletionModel):
@@ -604,19 +865,14 @@ class GitLogCompletionModel(GitRefCompletionModel):
 
     def __init__(self, parent):
         GitRefCompletionModel.__init__(self, parent)
-        self.model_updated.connect(self.gather_paths, type=Qt.QueuedConnection)
-        self._paths = []
-
-    def gather_paths(self):
-        self._paths = gitcmds.tracked_files()
 
     def gather_matches(self, case_sensitive):
-        if not self._paths:
-            self.gather_paths()
-        refs = filter_matches(self.match_text, self.matches(), case_sensitive,
-                              sort_key=ref_sort_key)
-        paths, dirs = filter_path_matches(self.match_text, self._paths,
-                                          case_sensitive)
+        index = provider().tracked_paths()
+        refs = self.filter_index(self.ref_index(), case_sensitive)
+        paths = self.filter_index(index, case_sensitive)
+        extend_fuzzy_matches(paths, provider().tracked_matcher(),
+                             self.match_text, cancel=self.cancel)
+        dirs = index.dirs
         has_doubledash = (self.match_text == '--' or
                           self.full_text.startswith('-- ') or
                           ' -- ' in self.full_text)
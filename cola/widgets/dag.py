@@ -689,7 +689,7 @@ class GitDAG(standard.MainWindow):
         """Save the selected file from the filelist widget"""
         oid = self.treewidget.selected_oid()
         model = browse.BrowseModel(oid, filename=filename)
-        browse.save_path(filename, model)
+        browse.save_path(filename, model, parent=self)
 
 
 class ReaderThread(QtCore.QThread):
@@ -1,6 +1,8 @@
 """File finder widgets"""
 from __future__ import division, absolute_import, unicode_literals
 import os
+import threading
+import time
 
 from qtpy import QtCore
 from qtpy import QtWidgets
@@ -14,8 +16,8 @@ from .. import core
 from .. import gitcmds
 from .. import hotkeys
 from .. import icons
-from .. import utils
 from .. import qtutils
+from .. import utils
 from . import completion
 from . import defs
 from . import filetree
@@ -56,9 +58,18 @@ def add_wildcards(arg):
     return arg
 
 
+def is_glob(query):
+    """Does the query use wildcards, e.g. "*.py"?"""
+    return any(char in query for char in '*?[')
+
+
 def show_help():
     """Show the help page"""
     help_text = N_("""
+Queries are matched fuzzily, e.g. "bazctl" finds
+"src/foo/bar/BazController.java".  Queries with wildcards,
+e.g. "*.py" or "src/*/foo.c", are matched as git pathspecs.
+
 Keyboard Shortcuts
 ------------------
 J, Down     = Move Down
@@ -76,25 +87,50 @@ and the results.
 
 
 class FindFilesThread(QtCore.QThread):
-    """Finds files asynchronously"""
+    """Finds files asynchronously
+
+    The tracked files are ranked against the query by a fuzzy.Matcher.
+    The best matches so far are emitted while the files are searched.
+    Queries with wildcards are passed to "git ls-files" as pathspecs.
+
+    """
 
     result = Signal(object)
 
+    #: The number of matches that are shown
+    LIMIT = 1000
+
+    #: The minimum number of seconds between intermediate results
+    RESULT_INTERVAL = 0.1
+
     def __init__(self, parent):
         QtCore.QThread.__init__(self, parent)
         self.query = None
+        # The query that was searched by the last run()
+        self.searched = None
+        # Set to abandon the search that is running
+        self.cancel = threading.Event()
 
     def run(self):
-        query = self.query
-        if query is None:
-            args = []
-        else:
+        query = self.searched = self.query
+        if query and is_glob(query):
             args = [add_wildcards(arg) for arg in utils.shell_split(query)]
-        filenames = gitcmds.tracked_files(*args)
-        if query == self.query:
+            filenames = gitcmds.tracked_files(*args)
+            if not self.cancel.is_set():
+                self.result.emit(filenames)
+            return
+        matcher = completion.provider().tracked_matcher()
+        emitted = time.time()
+        filenames = None
+        for filenames in matcher.iter_ranked(query or '', limit=self.LIMIT,
+                                             cancel=self.cancel):
+            now = time.time()
+            if now - emitted >= self.RESULT_INTERVAL:
+                emitted = now
+                self.result.emit(filenames)
+                filenames = None
+        if filenames is not None and not self.cancel.is_set():
             self.result.emit(filenames)
-        else:
-            self.run()
 
 
 class Finder(standard.Dialog):
@@ -152,6 +188,8 @@ class Finder(standard.Dialog):
 
         thread = self.worker_thread = FindFilesThread(self)
         thread.result.connect(self.process_result, type=Qt.QueuedConnection)
+        thread.finished.connect(self.search_finished,
+                                type=Qt.QueuedConnection)
 
         self.input_txt.textChanged.connect(lambda s: self.search())
         self.input_txt.activated.connect(self.focus_tree)
@@ -171,7 +209,7 @@ class Finder(standard.Dialog):
 
         qtutils.connect_button(self.edit_button, self.edit)
         qtutils.connect_button(self.open_default_button, self.open_default)
-        qtutils.connect_button(self.refresh_button, self.search)
+        qtutils.connect_button(self.refresh_button, self.refresh)
         qtutils.connect_button(self.help_button, show_help)
         qtutils.connect_button(self.close_button, self.close)
         qtutils.add_close_action(self)
@@ -188,9 +226,28 @@ class Finder(standard.Dialog):
     def search(self):
         self.button_group.setEnabled(False)
         self.refresh_button.setEnabled(False)
-        query = self.input_txt.value()
-        self.worker_thread.query = query
-        self.worker_thread.start()
+        thread = self.worker_thread
+        thread.query = self.input_txt.value()
+        if thread.isRunning():
+            # search_finished() searches for the new query
+            thread.cancel.set()
+        else:
+            thread.cancel.clear()
+            thread.start()
+
+    def search_finished(self):
+        thread = self.worker_thread
+        stale = thread.cancel.is_set() or thread.searched != thread.query
+        if stale and not thread.isRunning():
+            thread.cancel.clear()
+            thread.start()
+        else:
+            self.refresh_button.setEnabled(True)
+
+    def refresh(self):
+        """Read the tracked files again and repeat the search"""
+        completion.provider().reset()
+        self.search()
 
     def search_for(self, txt):
         self.input_txt.set_value(txt)
@@ -198,7 +255,6 @@ class Finder(standard.Dialog):
 
     def process_result(self, filenames):
         self.tree.set_filenames(filenames, select=True)
-        self.refresh_button.setEnabled(True)
 
     def edit(self):
         paths = self.tree.selected_filenames()
@@ -1,13 +1,19 @@
 from __future__ import division, absolute_import, unicode_literals
+import collections
+import mmap
+import threading
+import time
 
 from qtpy import QtCore
+from qtpy import QtGui
 from qtpy import QtWidgets
 from qtpy.QtCore import Qt
 from qtpy.QtCore import Signal
 
 from ..cmds import do
-from ..git import git
+from ..decorators import memoize
 from ..i18n import N_
+from ..models import prefs
 from ..qtutils import diff_font
 from ..utils import Group
 from .. import cmds
@@ -57,29 +63,116 @@ def goto_grep(line):
 
 
 class GrepThread(QtCore.QThread):
-    """Gather `git grep` results in a background thread"""
+    """Stream `git grep` results from a background thread
 
-    result = Signal(object, object, object)
+    Result lines are emitted in batches as git produces them.  Reading
+    pauses once `limit` lines have been read, and resumes when more() is
+    called.  cancel() kills the running `git grep`.  Every signal carries
+    the `serial` of the search so that stale results can be ignored.
+
+    """
+    lines = Signal(object, object)  # serial, lines
+    paused = Signal(object, object)  # serial, line count
+    result = Signal(object, object, object)  # serial, status, err
+
+    #: The number of lines that are read before pausing for "Load More"
+    LIMIT = 1000
+
+    #: Lines are emitted when this many have been read...
+    BATCH_SIZE = 200
+    #: ...or when this many seconds have passed since the last batch
+    BATCH_INTERVAL = 0.1
 
     def __init__(self, parent):
         QtCore.QThread.__init__(self, parent)
         self.query = None
         self.shell = False
         self.regexp_mode = '--basic-regexp'
+        self.threads = 0
+        self.serial = 0
+        # The serial of the search that was run by the last run()
+        self.searched = None
+        self._proc = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._more = threading.Event()
+
+    def command(self):
+        """Return the `git grep` command line for the query"""
+        if self.shell:
+            args = utils.shell_split(self.query)
+        else:
+            args = [self.query]
+        cmd = ['git', 'grep', self.regexp_mode, '-n']
+        if self.threads:
+            cmd.append('--threads=%d' % self.threads)
+        cmd.extend(args)
+        return cmd
+
+    def start(self):
+        self._cancel.clear()
+        self._more.clear()
+        QtCore.QThread.start(self)
+
+    def cancel(self):
+        """Stop the running search and kill `git grep`"""
+        self._cancel.set()
+        self._more.set()
+        with self._lock:
+            proc = self._proc
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def more(self):
+        """Resume reading after the thread has paused"""
+        self._more.set()
 
     def run(self):
+        serial = self.searched = self.serial
         if self.query is None:
             return
-        query = self.query
-        if self.shell:
-            args = utils.shell_split(query)
-        else:
-            args = [query]
-        status, out, err = git.grep(self.regexp_mode, n=True, *args)
-        if query == self.query:
-            self.result.emit(status, out, err)
-        else:
-            self.run()
+        proc = core.start_command(self.command())
+        with self._lock:
+            self._proc = proc
+        if self._cancel.is_set():
+            self.cancel()
+
+        limit = self.LIMIT
+        count = 0
+        batch = []
+        emitted = time.time()
+        for line in iter(proc.stdout.readline, b''):
+            batch.append(core.decode(line).rstrip('\n'))
+            count += 1
+            now = time.time()
+            if (len(batch) >= self.BATCH_SIZE or
+                    now - emitted >= self.BATCH_INTERVAL or count == limit):
+                self.lines.emit(serial, batch)
+                batch = []
+                emitted = now
+            if count == limit:
+                self.paused.emit(serial, count)
+                self._more.wait()
+                self._more.clear()
+                limit += self.LIMIT
+            if self._cancel.is_set():
+                break
+
+        if self._cancel.is_set():
+            self.cancel()
+        elif batch:
+            self.lines.emit(serial, batch)
+        out, err = proc.communicate()
+        with self._lock:
+            self._proc = None
+        if not self._cancel.is_set():
+            self.result.emit(serial, proc.returncode, core.decode(err))
 
 
 class Grep(Dialog):
@@ -87,7 +180,10 @@ class Grep(Dialog):
 
     def __init__(self, parent=None):
         Dialog.__init__(self, parent)
-        self.grep_result = ''
+        self.serial = 0
+        self.line_count = 0
+        # The scrollbar and cursor to restore after refreshing
+        self.restore_position = None
 
         self.setWindowTitle(N_('Search'))
         if parent is not None:
@@ -134,6 +230,12 @@ class Grep(Dialog):
         self.refresh_button = qtutils.refresh_button()
         qtutils.button_action(self.refresh_button, self.refresh_action)
 
+        self.more_button = qtutils.create_button(
+                text=N_('Load More'), tooltip=N_('Show more results'))
+        self.more_button.hide()
+
+        self.status_label = QtWidgets.QLabel()
+
         text = N_('Shell arguments')
         tooltip = N_('Parse arguments using a shell.\n'
                      'Queries with spaces will require "double quotes".')
@@ -154,6 +256,7 @@ class Grep(Dialog):
         self.bottom_layout = qtutils.hbox(defs.no_margin, defs.button_spacing,
                                           self.edit_button, self.refresh_button,
                                           self.shell_checkbox, qtutils.STRETCH,
+                                          self.status_label, self.more_button,
                                           self.close_button)
 
         self.splitter = qtutils.splitter(Qt.Vertical,
@@ -166,7 +269,11 @@ class Grep(Dialog):
         self.setLayout(self.mainlayout)
 
         thread = self.worker_thread = GrepThread(self)
+        thread.lines.connect(self.process_lines, type=Qt.QueuedConnection)
+        thread.paused.connect(self.process_paused, type=Qt.QueuedConnection)
         thread.result.connect(self.process_result, type=Qt.QueuedConnection)
+        thread.finished.connect(self.search_finished,
+                                type=Qt.QueuedConnection)
 
         self.input_txt.textChanged.connect(lambda s: self.search())
         self.regexp_combo.currentIndexChanged.connect(lambda x: self.search())
@@ -178,6 +285,7 @@ class Grep(Dialog):
         qtutils.add_action(self, 'Focus Input', self.focus_input, hotkeys.FOCUS)
 
         qtutils.connect_toggle(self.shell_checkbox, lambda x: self.search())
+        qtutils.connect_button(self.more_button, self.load_more)
         qtutils.connect_button(self.close_button, self.close)
         qtutils.add_close_action(self)
 
@@ -203,19 +311,50 @@ class Grep(Dialog):
         return self.regexp_combo.itemData(idx, Qt.UserRole)
 
     def search(self):
-        """Initiate a search by starting the GrepThread"""
+        """Initiate a search by starting the GrepThread
+
+        A running search is cancelled and replaced by the new one.
+
+        """
         self.edit_group.setEnabled(False)
         self.refresh_group.setEnabled(False)
+        self.more_button.hide()
+        self.status_label.clear()
 
         query = self.input_txt.value()
+        if self.restore_position is None and self.line_count:
+            self.restore_position = (self.text_scroll(), self.text_offset())
+        self.serial += 1
+        self.line_count = 0
+        self.result_txt.set_value('')
+
+        thread = self.worker_thread
+        if thread.isRunning():
+            # search_finished() starts the new search
+            thread.cancel()
         if len(query) < 2:
-            self.result_txt.clear()
             self.preview_txt.clear()
+            self.restore_position = None
             return
-        self.worker_thread.query = query
-        self.worker_thread.shell = self.shell_checkbox.isChecked()
-        self.worker_thread.regexp_mode = self.regexp_mode()
-        self.worker_thread.start()
+        thread.query = query
+        thread.shell = self.shell_checkbox.isChecked()
+        thread.regexp_mode = self.regexp_mode()
+        thread.threads = prefs.grep_threads()
+        thread.serial = self.serial
+        if not thread.isRunning():
+            thread.start()
+
+    def search_finished(self):
+        """Start the latest search once a cancelled search has stopped"""
+        thread = self.worker_thread
+        stale = thread.searched != self.serial or thread.is_cancelled()
+        if stale and thread.serial == self.serial and not thread.isRunning():
+            thread.start()
+
+    def load_more(self):
+        """Read the next batch of results"""
+        self.more_button.hide()
+        self.worker_thread.more()
 
     def search_for(self, txt):
         """Set the initial value of the input text"""
@@ -244,27 +383,40 @@ class Grep(Dialog):
         cursor.setPosition(offset)
         self.result_txt.setTextCursor(cursor)
 
-    def process_result(self, status, out, err):
-        """Apply the results from grep to the widgets"""
-        if status == 0:
-            value = out + err
-        elif out + err:
-            value = 'git grep: ' + out + err
-        else:
-            value = ''
-
-        # save scrollbar and text cursor
-        scroll = self.text_scroll()
-        offset = min(len(value), self.text_offset())
-
-        self.grep_result = value
-        self.result_txt.set_value(value)
-        # restore
-        self.set_text_scroll(scroll)
-        self.set_text_offset(offset)
+    def process_lines(self, serial, lines):
+        """Append a batch of grep results to the results window"""
+        if serial != self.serial:
+            return
+        self.result_txt.append_lines(lines)
+        self.line_count += len(lines)
+        self.edit_group.setEnabled(True)
+
+        position = self.restore_position
+        if position is not None:
+            scroll, offset = position
+            if offset < self.result_txt.document().characterCount():
+                self.restore_position = None
+                self.set_text_scroll(scroll)
+                self.set_text_offset(offset)
+
+    def process_paused(self, serial, count):
+        """Offer to load more results once the result limit is reached"""
+        if serial != self.serial:
+            return
+        self.status_label.setText(N_('Showing %d results') % count)
+        self.more_button.show()
+        self.refresh_group.setEnabled(True)
 
-        enabled = status == 0
-        self.edit_group.setEnabled(enabled)
+    def process_result(self, serial, status, err):
+        """Finish a search once git grep exits"""
+        if serial != self.serial:
+            return
+        if status != 0 and err:
+            self.result_txt.append_lines(['git grep: ' + err.rstrip()])
+        self.restore_position = None
+        self.status_label.clear()
+        self.more_button.hide()
+        self.edit_group.setEnabled(bool(self.line_count))
         self.refresh_group.setEnabled(True)
 
     def update_preview(self):
@@ -278,6 +430,14 @@ class Grep(Dialog):
         """Launch an editor on the currently selected line"""
         goto_grep(self.result_txt.selected_line()),
 
+    def done(self, result):
+        """Stop the running search when the dialog is closed"""
+        # Results and restarts for the cancelled search are ignored
+        self.serial += 1
+        if self.worker_thread.isRunning():
+            self.worker_thread.cancel()
+        return super(Grep, self).done(result)
+
     def export_state(self):
         """Export persistent settings"""
         state = super(Grep, self).export_state()
@@ -312,9 +472,122 @@ class GrepTextView(VimHintedPlainTextEdit):
     def edit(self):
         goto_grep(self.selected_line())
 
+    def append_lines(self, lines):
+        """Append lines without replacing the current text"""
+        self.appendPlainText('\n'.join(lines))
+
+    def selected_line(self):
+        """Return the line under the cursor without copying the text"""
+        return self.textCursor().block().text()
+
+
+class PreviewFile(object):
+    """A memory-mapped file with a lazily built table of line offsets
+
+    Lines are located by scanning the file for newlines only as far as
+    the requested lines, so previewing the top of a large file does not
+    read the rest of it.
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stat = self.stat_key(filename)
+        self.size = self.stat[1]
+        if not self.size:
+            # Empty files cannot be mapped
+            self.data = b''
+        elif utils.is_win32():
+            # Editors cannot save files that are mapped on Windows
+            with core.xopen(filename, 'rb') as fp:
+                self.data = fp.read()
+        else:
+            with core.xopen(filename, 'rb') as fp:
+                self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = [0]  # The offset of the start of each line
+        self._complete = not self.size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stat_key(filename):
+        """Return the (mtime, size) that identifies a version of a file"""
+        st = core.stat(filename)
+        return (st.st_mtime, st.st_size)
+
+    def is_current(self):
+        """Is the file unchanged since it was mapped?"""
+        try:
+            return self.stat_key(self.filename) == self.stat
+        except OSError:
+            return False
+
+    def _index(self, line_count):
+        """Find the offsets of the first `line_count` lines"""
+        with self._lock:
+            offsets = self._offsets
+            data = self.data
+            size = self.size
+            while not self._complete and len(offsets) <= line_count:
+                end = data.find(b'\n', offsets[-1])
+                if end < 0 or end + 1 >= size:
+                    self._complete = True
+                else:
+                    offsets.append(end + 1)
+            return min(line_count, len(offsets))
+
+    def line_count(self):
+        """Return the number of lines, indexing the whole file"""
+        return self._index(self.size + 1)
+
+    def lines(self, start, end):
+        """Return the text of lines [start, end), and the actual end"""
+        end = self._index(end)
+        start = min(start, end)
+        if start == end:
+            return ('', end)
+        offsets = self._offsets
+        first = offsets[start]
+        if end < len(offsets):
+            last = offsets[end] - 1
+        else:
+            last = self.size
+        content = core.decode(self.data[first:last], errors='ignore')
+        if content.endswith('\n'):
+            content = content[:-1]
+        return (content, end)
+
+
+class PreviewCache(object):
+    """Recently previewed files, dropped when they are modified"""
+
+    #: The number of files that are kept mapped
+    MAX_FILES = 16
+
+    def __init__(self):
+        self._files = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Return the PreviewFile for `filename`"""
+        with self._lock:
+            preview = self._files.pop(filename, None)
+        if preview is None or not preview.is_current():
+            preview = PreviewFile(filename)
+        with self._lock:
+            self._files[filename] = preview
+            while len(self._files) > self.MAX_FILES:
+                self._files.popitem(last=False)
+        return preview
+
+
+@memoize
+def preview_cache():
+    """Return the PreviewCache singleton"""
+    return PreviewCache()
+
 
 class PreviewTask(qtutils.Task):
-    """Asynchronous task for loading file content"""
+    """Asynchronous task for loading the lines around a match"""
 
     def __init__(self, parent, filename, line_number):
         qtutils.Task.__init__(self, parent)
@@ -322,59 +595,135 @@ class PreviewTask(qtutils.Task):
         self.content = ''
         self.filename = filename
         self.line_number = line_number
+        self.preview_file = None
+        self.start = self.end = 0
 
     def task(self):
         try:
-            self.content = core.read(self.filename, errors='ignore')
-        except IOError:
-            pass
+            line = max(0, int(self.line_number) - 1)
+        except ValueError:
+            line = 0
+        try:
+            self.preview_file = preview_cache().get(self.filename)
+        except (IOError, OSError, ValueError):
+            return (self.filename, self.content, self.line_number)
+        window = PreviewTextView.WINDOW
+        self.start = max(0, line - window)
+        self.content, self.end = self.preview_file.lines(self.start,
+                                                         line + window)
+        self.start = min(self.start, self.end)
         return (self.filename, self.content, self.line_number)
 
 
 class PreviewTextView(VimTextBrowser):
-    """Preview window for file contents"""
+    """Preview window for file contents
+
+    Only a window of lines around the match is shown.  More lines are
+    loaded when the view is scrolled to either end of the window.
+
+    """
+
+    #: The number of lines that are shown above and below the match, and
+    #: that are loaded when the view is scrolled to the edge of the window
+    WINDOW = 200
 
     def __init__(self, parent):
         VimTextBrowser.__init__(self, parent)
         self.filename = None
         self.content = None
+        self.preview_file = None
+        # The lines [start, end) of the file are shown
+        self.start = self.end = 0
+        # Set while the view scrolls itself
+        self._scrolling = False
         self.runtask = qtutils.RunTask(parent=self)
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
 
     def preview(self, filename, line_number):
         """Preview the a file at the specified line number"""
-
-        if filename != self.filename:
+        try:
+            line = int(line_number) - 1
+        except ValueError:
+            line = -1
+        preview_file = self.preview_file
+        if (filename == self.filename and preview_file is not None and
+                self.start <= line < self.end and preview_file.is_current()):
+            self.scroll_to_line(line_number)
+        else:
             request = PreviewTask(self, filename, line_number)
             self.runtask.start(request, finish=self.show_preview)
-        else:
-            self.scroll_to_line(line_number)
 
     def clear(self):
         self.filename = ''
         self.content = ''
+        self.preview_file = None
+        self.start = self.end = 0
+        self.numbers.set_first_line(0)
         super(VimTextBrowser, self).clear()
 
     def show_preview(self, task):
         """Show the results of the asynchronous file read"""
-
-        filename = task.filename
-        content = task.content
-        line_number = task.line_number
-
-        if filename != self.filename:
-            self.filename = filename
-            self.content = content
-            self.set_value(content)
-
-        self.scroll_to_line(line_number)
+        self.filename = task.filename
+        self.content = task.content
+        self.preview_file = task.preview_file
+        self.start = task.start
+        self.end = task.end
+        self.numbers.set_first_line(self.start)
+        self._scrolling = True
+        try:
+            self.set_value(self.content, block=True)
+        finally:
+            self._scrolling = False
+        self.scroll_to_line(task.line_number)
+
+    def scrolled(self, value):
+        """Load more lines when the view reaches an edge of the window"""
+        preview_file = self.preview_file
+        if preview_file is None or self._scrolling:
+            return
+        self._scrolling = True
+        try:
+            scrollbar = self.verticalScrollBar()
+            if value == scrollbar.minimum() and self.start > 0:
+                self._load_before(preview_file, scrollbar, value)
+            elif value == scrollbar.maximum():
+                self._load_after(preview_file)
+        finally:
+            self._scrolling = False
+
+    def _load_before(self, preview_file, scrollbar, value):
+        start = max(0, self.start - self.WINDOW)
+        content, end = preview_file.lines(start, self.start)
+        count = self.start - start
+        cursor = QtGui.QTextCursor(self.document())
+        cursor.insertText(content + '\n')
+        self.start = start
+        self.numbers.set_first_line(start)
+        self.numbers.set_highlighted(self.numbers.highlight_line + count)
+        # QPlainTextEdit scrolls by lines
+        scrollbar.setValue(value + count)
+
+    def _load_after(self, preview_file):
+        content, end = preview_file.lines(self.end, self.end + self.WINDOW)
+        if end > self.end:
+            cursor = QtGui.QTextCursor(self.document())
+            cursor.movePosition(QtGui.QTextCursor.End)
+            cursor.insertText('\n' + content)
+            self.end = end
 
     def scroll_to_line(self, line_number):
         """Scroll to the specified line number"""
         try:
-            line_num = int(line_number) - 1
+            line_num = int(line_number) - 1 - self.start
         except ValueError:
             return
+        self._scrolling = True
+        try:
+            self._scroll_to_line(line_num)
+        finally:
+            self._scrolling = False
 
+    def _scroll_to_line(self, line_num):
         self.numbers.set_highlighted(line_num)
         cursor = self.textCursor()
         cursor.setPosition(0)
@@ -545,6 +545,7 @@ class MainView(standard.MainWindow):
         """Save state in the settings manager."""
         commit_msg = self.commitmsgeditor.commit_message(raw=True)
         self.model.save_commitmsg(msg=commit_msg)
+        self.model.save_snapshot()
         standard.MainWindow.closeEvent(self, event)
 
     def build_recent_menu(self):
@@ -634,6 +635,10 @@ class MainView(standard.MainWindow):
                       'Resolve conflicts and commit changes.')
             alerts.append(N_('Merging'))
 
+        if self.model.stale:
+            # Showing the snapshot saved by the previous session
+            alerts.append(N_('Refreshing'))
+
         if self.mode == self.model.mode_amend:
             alerts.append(N_('Amending'))
             self.commit_amend_action.setChecked(True)
@@ -1,5 +1,5 @@
 from __future__ import division, absolute_import, unicode_literals
-import itertools
+import bisect
 
 from qtpy.QtCore import Qt
 from qtpy.QtCore import Signal
@@ -10,6 +10,7 @@ from ..i18n import N_
 from ..models import main
 from ..models import prefs
 from ..models import selection
+from ..models import status as status_model
 from ..widgets import gitignore
 from .. import cmds
 from .. import core
@@ -22,6 +23,10 @@ from . import completion
 from . import defs
 
 
+#: Change sets with more paths than this are shown by StatusTreeView
+VIRTUAL_VIEW_THRESHOLD = 10000
+
+
 class StatusWidget(QtWidgets.QWidget):
     """
     Provides a git-status-like repository widget.
@@ -30,6 +35,7 @@ class StatusWidget(QtWidgets.QWidget):
     Qt signals.
 
     """
+    updated = Signal()
 
     def __init__(self, titlebar, parent=None):
         QtWidgets.QWidget.__init__(self, parent)
@@ -42,9 +48,14 @@ class StatusWidget(QtWidgets.QWidget):
         self.filter_widget.hide()
         self.tree = StatusTreeWidget()
         self.setFocusProxy(self.tree)
+        # Very large change sets are shown by a virtualized view instead
+        self.view = StatusTreeView()
+        self.view.hide()
+        self.virtual = False
 
         self.main_layout = qtutils.vbox(defs.no_margin, defs.no_spacing,
-                                        self.filter_widget, self.tree)
+                                        self.filter_widget, self.tree,
+                                        self.view)
         self.setLayout(self.main_layout)
 
         self.toggle_action = qtutils.add_action(self, tooltip,
@@ -54,13 +65,37 @@ class StatusWidget(QtWidgets.QWidget):
         titlebar.add_corner_widget(self.filter_button)
         qtutils.connect_button(self.filter_button, self.toggle_filter)
 
+        self.m = main.model()
+        self.updated.connect(self.update_view, type=Qt.QueuedConnection)
+        self.m.add_observer(self.m.message_updated, self.updated.emit)
+
+    def active_tree(self):
+        """Return the tree that is currently showing the status"""
+        if self.virtual:
+            return self.view
+        return self.tree
+
+    def update_view(self):
+        """Switch between the tree widget and the virtualized view"""
+        virtual = use_virtual_view(self.m)
+        if virtual == self.virtual:
+            return
+        self.virtual = virtual
+        active = self.active_tree()
+        has_focus = self.tree.hasFocus() or self.view.hasFocus()
+        self.tree.setVisible(not virtual)
+        self.view.setVisible(virtual)
+        self.setFocusProxy(active)
+        if has_focus:
+            active.setFocus(True)
+
     def toggle_filter(self):
         shown = not self.filter_widget.isVisible()
         self.filter_widget.setVisible(shown)
         if shown:
             self.filter_widget.setFocus(True)
         else:
-            self.tree.setFocus(True)
+            self.active_tree().setFocus(True)
 
     def set_initial_size(self):
         self.setMaximumWidth(222)
@@ -70,7 +105,7 @@ class StatusWidget(QtWidgets.QWidget):
         self.setMaximumWidth(2 ** 13)
 
     def refresh(self):
-        self.tree.show_selection()
+        self.active_tree().show_selection()
 
     def set_filter(self, txt):
         self.filter_widget.setVisible(True)
@@ -78,10 +113,10 @@ class StatusWidget(QtWidgets.QWidget):
         self.filter_widget.apply_filter()
 
     def move_up(self):
-        self.tree.move_up()
+        self.active_tree().move_up()
 
     def move_down(self):
-        self.tree.move_down()
+        self.active_tree().move_down()
 
 
 class StatusTreeWidget(QtWidgets.QTreeWidget):
@@ -123,13 +158,15 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
         self.add_toplevel_item(N_('Untracked'), question, hide=True)
 
         # Used to restore the selection
-        self.old_vscroll = None
-        self.old_hscroll = None
         self.old_selection = None
         self.old_contents = None
         self.old_current_item = None
         self.expanded_items = set()
 
+        # The paths shown in each category, used to update rows in place
+        self.subtree_paths = [[] for _ in range(self.idx_end)]
+        self.subtree_deleted = [set() for _ in range(self.idx_end)]
+
         self.process_selection_action = qtutils.add_action(
             self, cmds.StageOrUnstage.name(),
             cmds.run(cmds.StageOrUnstage), hotkeys.STAGE_SELECTION)
@@ -232,6 +269,12 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
             item.setHidden(True)
 
     def restore_selection(self):
+        """Refresh the diff and select neighbors of removed items
+
+        Rows are updated in place, so items that still exist keep their
+        selection and the current item.
+
+        """
         if not self.old_selection or not self.old_contents:
             return
         old_c = self.old_contents
@@ -239,8 +282,12 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
         new_c = self.contents()
 
         def mkselect(lst, widget_getter):
+            indexes = {}
+
             def select(item, current=False):
-                idx = lst.index(item)
+                if not indexes:
+                    indexes.update(selection.index(lst))
+                idx = indexes[item]
                 item = widget_getter(idx)
                 if current:
                     self.setCurrentItem(item)
@@ -266,40 +313,19 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
              select_untracked),
         ]
 
-        # Restore the current item
+        # Refresh the diff for the current item
         if self.old_current_item:
             category, idx = self.old_current_item
             if category == self.idx_header:
-                item = self.invisibleRootItem().child(idx)
-                if item is not None:
-                    self.blockSignals(True)
-                    self.setCurrentItem(item)
-                    item.setSelected(True)
-                    self.blockSignals(False)
-                    self.show_selection()
+                self.show_selection()
                 return
-            # Reselect the current item
-            selection_info = saved_selection[category]
-            new = selection_info[0]
-            old = selection_info[1]
-            reselect = selection_info[3]
+            new, old, sel, reselect = saved_selection[category]
             try:
                 item = old[idx]
-            except:
-                return
-            if item in new:
-                reselect(item, current=True)
-
-        # Restore selection
-        # When reselecting we only care that the items are selected;
-        # we do not need to rerun the callbacks which were triggered
-        # above.  Block signals to skip the callbacks.
-        self.blockSignals(True)
-        for (new, old, sel, reselect) in saved_selection:
-            for item in sel:
-                if item in new:
-                    reselect(item, current=False)
-        self.blockSignals(False)
+            except IndexError:
+                item = None
+            if item is not None and item in new:
+                self.show_selection()
 
         for (new, old, sel, reselect) in saved_selection:
             # When modified is staged, select the next modified item
@@ -309,28 +335,20 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
             if len(new) >= len(old):
                 # The list did not shrink so it is not one of these cases.
                 continue
+            if not new:
+                # Nothing is left to select in this list.
+                continue
+            old_indexes = selection.index(old)
             for item in sel:
                 # The item still exists so ignore it
-                if item in new or item not in old:
+                if item in new or item not in old_indexes:
                     continue
                 # The item no longer exists in this list so search for
                 # its nearest neighbors and select them instead.
-                idx = old.index(item)
-                for j in itertools.chain(old[idx+1:], reversed(old[:idx])):
-                    if j in new:
-                        reselect(j, current=True)
-                        return
-
-    def restore_scrollbars(self):
-        vscroll = self.verticalScrollBar()
-        if vscroll and self.old_vscroll is not None:
-            vscroll.setValue(self.old_vscroll)
-            self.old_vscroll = None
-
-        hscroll = self.horizontalScrollBar()
-        if hscroll and self.old_hscroll is not None:
-            hscroll.setValue(self.old_hscroll)
-            self.old_hscroll = None
+                neighbor = nearest_neighbor(old, old_indexes[item], new)
+                if neighbor is not None:
+                    reselect(neighbor, current=True)
+                    return
 
     def staged_item(self, itemidx):
         return self._subtree_item(self.idx_staged, itemidx)
@@ -368,18 +386,8 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
         return parent.child(itemidx)
 
     def _about_to_update(self):
-        self.save_scrollbars()
         self.save_selection()
 
-    def save_scrollbars(self):
-        vscroll = self.verticalScrollBar()
-        if vscroll:
-            self.old_vscroll = vscroll.value()
-
-        hscroll = self.horizontalScrollBar()
-        if hscroll:
-            self.old_hscroll = hscroll.value()
-
     def current_item(self):
         s = self.selected_indexes()
         if not s:
@@ -401,6 +409,12 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
         self.old_current_item = self.current_item()
 
     def refresh(self):
+        if use_virtual_view(self.m):
+            # StatusTreeView shows the contents instead
+            for idx in range(self.idx_end):
+                self._set_subtree([], idx)
+            self.old_selection = None
+            return
         self.set_staged(self.m.staged)
         self.set_modified(self.m.modified)
         self.set_unmerged(self.m.unmerged)
@@ -408,7 +422,6 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
         self.update_column_widths()
         self.update_actions()
         self.restore_selection()
-        self.restore_scrollbars()
 
     def update_actions(self, selected=None):
         if selected is None:
@@ -438,26 +451,135 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
                      staged=False,
                      untracked=False,
                      deleted_set=None):
-        """Add a list of items to a treewidget item."""
+        """Update a treewidget item's children to match a list of items
+
+        Only the rows that changed are inserted or removed, so the
+        selection and scroll position of the remaining rows are kept.
+
+        """
         self.blockSignals(True)
         parent = self.topLevelItem(idx)
         hide = not bool(items)
         parent.setHidden(hide)
 
+        if deleted_set is None:
+            deleted_set = set()
+        else:
+            deleted_set = set(deleted_set)
+
+        def create_item(path):
+            return qtutils.create_treeitem(path,
+                                           staged=staged,
+                                           deleted=path in deleted_set,
+                                           untracked=untracked)
+
+        old_items = self.subtree_paths[idx]
+        edits = diff_paths(old_items, items)
+        if edits is None:
+            self._rebuild_subtree(parent, items, create_item)
+        else:
+            removed, inserted = edits
+            if removed:
+                self._remove_children(parent, removed)
+            for row, paths in inserted:
+                parent.insertChildren(row, [create_item(x) for x in paths])
+            # Update the icons of rows whose "deleted" state changed
+            changed = self.subtree_deleted[idx] ^ deleted_set
+            if changed:
+                new_items = set(items)
+                kept = set(x for x in changed if x in new_items)
+                kept.difference_update(x for _, paths in inserted
+                                       for x in paths)
+                if kept:
+                    for row, path in enumerate(items):
+                        if path in kept:
+                            self._replace_child(parent, row,
+                                                create_item(path))
+
+        self.subtree_paths[idx] = list(items)
+        self.subtree_deleted[idx] = deleted_set
+        self.expand_items(idx, items)
+        self.blockSignals(False)
+
+    def _remove_children(self, parent, rows):
+        """Remove rows, given in descending order, from a category
+
+        Qt's selection model updates every selection range on each
+        removal, so selected rows are deselected first and the survivors
+        are reselected afterwards as a few contiguous ranges.
+
+        """
+        selection_model = self.selectionModel()
+        parent_index = self.indexFromItem(parent)
+        selected = [index.row() for index in selection_model.selectedRows()
+                    if index.parent() == parent_index]
+        if selected:
+            selection_model.select(
+                QtCore.QItemSelection(self.model().index(0, 0, parent_index),
+                                      self.model().index(
+                                          parent.childCount() - 1, 0,
+                                          parent_index)),
+                QtCore.QItemSelectionModel.Deselect)
+
+        for row in rows:
+            parent.takeChild(row)
+
+        if not selected:
+            return
+        # Map the selected rows to their positions after the removals
+        removed = set(rows)
+        ascending = sorted(rows)
+        new_rows = []
+        for row in sorted(selected):
+            if row not in removed:
+                new_rows.append(row - bisect.bisect_left(ascending, row))
+        item_selection = QtCore.QItemSelection()
+        start = end = None
+        for row in new_rows + [None]:
+            if row is not None and end is not None and row == end + 1:
+                end = row
+                continue
+            if start is not None:
+                item_selection.select(
+                    self.model().index(start, 0, parent_index),
+                    self.model().index(end, 0, parent_index))
+            start = end = row
+        selection_model.select(item_selection,
+                               QtCore.QItemSelectionModel.Select)
+
+    def _rebuild_subtree(self, parent, items, create_item):
+        """Replace all children while keeping the selected paths selected"""
+        current = self.currentItem()
+        if current is not None and current.parent() is parent:
+            current_path = current.path
+        else:
+            current_path = None
+        selected = set(item.path for item in qtutils.tree_selection_items(
+            parent))
+
         # sip v4.14.7 and below leak memory in parent.takeChildren()
         # so we use this backwards-compatible construct instead
         while parent.takeChild(0) is not None:
             pass
 
-        for item in items:
-            deleted = (deleted_set is not None and item in deleted_set)
-            treeitem = qtutils.create_treeitem(item,
-                                               staged=staged,
-                                               deleted=deleted,
-                                               untracked=untracked)
+        for path in items:
+            treeitem = create_item(path)
             parent.addChild(treeitem)
-        self.expand_items(idx, items)
-        self.blockSignals(False)
+            if path == current_path:
+                self.setCurrentItem(treeitem)
+            if path in selected:
+                treeitem.setSelected(True)
+
+    def _replace_child(self, parent, row, treeitem):
+        """Replace a child item and carry over its selection state"""
+        old_item = parent.child(row)
+        current = self.currentItem() is old_item
+        selected = old_item.isSelected()
+        parent.takeChild(row)
+        parent.insertChild(row, treeitem)
+        if current:
+            self.setCurrentItem(treeitem)
+        treeitem.setSelected(selected)
 
     def update_column_widths(self):
         self.resizeColumnToContents(0)
@@ -795,39 +917,29 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
 
         selected_indexes = self.selected_indexes()
         if not selected_indexes:
-            if self.m.amending():
-                cmds.do(cmds.SetDiffText, '')
-            else:
-                cmds.do(cmds.ResetMode)
+            show_nothing(self.m)
             return
         category, idx = selected_indexes[0]
         # A header item e.g. 'Staged', 'Modified', etc.
         if category == self.idx_header:
-            cls = {
-                self.idx_staged: cmds.DiffStagedSummary,
-                self.idx_modified: cmds.Diffstat,
-                # TODO implement UnmergedSummary
-                # self.idx_unmerged: cmds.UnmergedSummary,
-                self.idx_untracked: cmds.UntrackedSummary,
-            }.get(idx, cmds.Diffstat)
-            cmds.do(cls)
+            show_summary(idx)
         # A staged file
         elif category == self.idx_staged:
             item = self.staged_items()[0]
-            cmds.do(cmds.DiffStaged, item.path, deleted=item.deleted)
+            show_path(category, item.path, item.deleted)
 
         # A modified file
         elif category == self.idx_modified:
             item = self.modified_items()[0]
-            cmds.do(cmds.Diff, item.path, deleted=item.deleted)
+            show_path(category, item.path, item.deleted)
 
         elif category == self.idx_unmerged:
             item = self.unmerged_items()[0]
-            cmds.do(cmds.Diff, item.path)
+            show_path(category, item.path, False)
 
         elif category == self.idx_untracked:
             item = self.unstaged_items()[0]
-            cmds.do(cmds.ShowUntracked, item.path)
+            show_path(category, item.path, False)
 
     def move_up(self):
         idx = self.selected_idx()
@@ -899,6 +1011,244 @@ class StatusTreeWidget(QtWidgets.QTreeWidget):
                 selection.union(selection.selection_model()))
 
 
+class StatusTreeView(QtWidgets.QTreeView):
+    """A virtualized status view for very large change sets
+
+    The rows come from models.status.StatusModel, which does not create
+    per-path objects and collapses large directories into aggregated rows.
+
+    """
+    updated = Signal()
+
+    def __init__(self, parent=None):
+        QtWidgets.QTreeView.__init__(self, parent)
+
+        self.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.setHeaderHidden(True)
+        self.setAllColumnsShowFocus(True)
+        self.setSortingEnabled(False)
+        self.setUniformRowHeights(True)
+        self.setAutoScroll(False)
+
+        self.m = main.model()
+        self.status_model = status_model.StatusModel(self)
+        self.setModel(self.status_model)
+        self.expanded_categories = set()
+
+        self.process_selection_action = qtutils.add_action(
+            self, cmds.StageOrUnstage.name(),
+            cmds.run(cmds.StageOrUnstage), hotkeys.STAGE_SELECTION)
+
+        self.up_action = qtutils.add_action(
+            self, N_('Move Up'), self.move_up,
+            hotkeys.MOVE_UP, hotkeys.MOVE_UP_SECONDARY)
+
+        self.down_action = qtutils.add_action(
+            self, N_('Move Down'), self.move_down,
+            hotkeys.MOVE_DOWN, hotkeys.MOVE_DOWN_SECONDARY)
+
+        self.copy_path_action = qtutils.add_action(
+            self, N_('Copy Path to Clipboard'), self.copy_path, hotkeys.COPY)
+        self.copy_path_action.setIcon(icons.copy())
+
+        self.copy_relpath_action = qtutils.add_action(
+            self, N_('Copy Relative Path to Clipboard'),
+            self.copy_relpath, hotkeys.CUT)
+        self.copy_relpath_action.setIcon(icons.copy())
+
+        self.updated.connect(self.refresh, type=Qt.QueuedConnection)
+        self.m.add_observer(self.m.message_updated, self.updated.emit)
+
+        self.selectionModel().selectionChanged.connect(
+            lambda selected, deselected: self.show_selection())
+        self.doubleClicked.connect(
+            lambda index: cmds.do(cmds.StageOrUnstage))
+
+    def refresh(self):
+        model = self.status_model
+        if not use_virtual_view(self.m):
+            if model.total():
+                model.set_contents([], [], [], [])
+            return
+
+        current = self._current_path()
+        selected = self.selection()
+        expanded = self._expanded_aggregates()
+
+        model.set_contents(self.m.staged, self.m.unmerged,
+                           self.m.modified, self.m.untracked,
+                           staged_deleted=self.m.staged_deleted,
+                           unstaged_deleted=self.m.unstaged_deleted)
+
+        root = QtCore.QModelIndex()
+        for idx, category in enumerate(model.categories):
+            self.setRowHidden(idx, root, not len(category))
+            # Expand each category once, like StatusTreeWidget
+            index = model.category_index(idx)
+            if len(category) and idx not in self.expanded_categories:
+                self.expanded_categories.add(idx)
+                self.expand(index)
+            elif idx in expanded:
+                self.expand(index)
+            for prefix in expanded.get(idx, ()):
+                for row, aggregate in self._aggregate_rows(idx):
+                    if aggregate[0] == prefix:
+                        self.expand(model.index(row, 0, index))
+
+        self._restore_selection(current, selected)
+
+    def _aggregate_rows(self, idx):
+        category = self.status_model.categories[idx]
+        for row, value in enumerate(category.rows):
+            if value < 0:
+                yield row, category.aggregates[-value - 1]
+
+    def _expanded_aggregates(self):
+        """Return {category: [aggregate prefix]} for expanded rows"""
+        model = self.status_model
+        result = {}
+        for idx in range(status_model.END):
+            index = model.category_index(idx)
+            if not self.isExpanded(index):
+                continue
+            prefixes = result.setdefault(idx, [])
+            for row, aggregate in self._aggregate_rows(idx):
+                if self.isExpanded(model.index(row, 0, index)):
+                    prefixes.append(aggregate[0])
+        return result
+
+    def _current_path(self):
+        index = self.currentIndex()
+        if not index.isValid():
+            return None
+        category, paths = self.status_model.paths(index)
+        if len(paths) != 1:
+            return None
+        return (category, paths[0])
+
+    def _restore_selection(self, current, selected):
+        """Reselect the paths that still exist"""
+        model = self.status_model
+        # Select contiguous runs of rows as ranges; "select all" over a
+        # huge change set would otherwise create one range per path.
+        rows = []
+        for idx, paths in enumerate(selected):
+            for path in paths:
+                index = model.path_index(idx, path)
+                if index.isValid():
+                    rows.append((index.internalId(), index.row()))
+        rows.sort()
+        item_selection = QtCore.QItemSelection()
+        start = end = None
+        for internal_id, row in rows + [(None, None)]:
+            if (start is not None and internal_id == start[0] and
+                    row == end + 1):
+                end = row
+                continue
+            if start is not None:
+                parent = model.parent(model.createIndex(start[1], 0,
+                                                        start[0]))
+                item_selection.select(model.index(start[1], 0, parent),
+                                      model.index(end, 0, parent))
+            start = (internal_id, row)
+            end = row
+        selection_model = self.selectionModel()
+        selection_model.blockSignals(True)
+        if current is not None:
+            index = model.path_index(*current)
+            if index.isValid():
+                selection_model.setCurrentIndex(
+                    index, QtCore.QItemSelectionModel.NoUpdate)
+        selection_model.select(item_selection,
+                               QtCore.QItemSelectionModel.ClearAndSelect)
+        selection_model.blockSignals(False)
+        self.viewport().update()
+        self.show_selection()
+
+    def selection(self):
+        """Return the selected paths as a selection.State"""
+        model = self.status_model
+        result = [[] for _ in range(status_model.END)]
+        for selection_range in self.selectionModel().selection():
+            parent = selection_range.parent()
+            for row in range(selection_range.top(),
+                             selection_range.bottom() + 1):
+                category, paths = model.paths(model.index(row, 0, parent))
+                result[category].extend(paths)
+        # An aggregated row and its children can both be selected
+        for idx, paths in enumerate(result):
+            result[idx] = sorted(set(paths))
+        return selection.State(*result)
+
+    def show_selection(self):
+        """Show the selected item"""
+        selection.selection_model().set_selection(self.selection())
+        index = self.currentIndex()
+        if not index.isValid() or not self.selectionModel().isSelected(index):
+            ranges = self.selectionModel().selection()
+            if not ranges:
+                show_nothing(self.m)
+                return
+            index = self.status_model.index(ranges[0].top(), 0,
+                                            ranges[0].parent())
+        model = self.status_model
+        category, row, child_row = model.decode(index)
+        category, paths = model.paths(index)
+        aggregated = (row is not None and child_row is None and
+                      model.categories[category].aggregate(row) is not None)
+        if row is None or aggregated:
+            show_summary(category)
+        else:
+            path = paths[0]
+            show_path(category, path,
+                      path in model.categories[category].deleted)
+
+    def move_up(self):
+        self._move(self.indexAbove)
+
+    def move_down(self):
+        self._move(self.indexBelow)
+
+    def _move(self, sibling):
+        index = self.currentIndex()
+        if index.isValid():
+            index = sibling(index)
+        else:
+            index = self.status_model.index(0, 0)
+        if not index.isValid():
+            return
+        self.selectionModel().setCurrentIndex(
+            index, QtCore.QItemSelectionModel.ClearAndSelect)
+        self.scrollTo(index)
+
+    def copy_path(self, absolute=True):
+        """Copy a selected path to the clipboard"""
+        filename = selection.selection_model().filename()
+        qtutils.copy_path(filename, absolute=absolute)
+
+    def copy_relpath(self):
+        """Copy a selected relative path to the clipboard"""
+        self.copy_path(absolute=False)
+
+    def contextMenuEvent(self, event):
+        """Create a context menu for staging the selection"""
+        s = self.selection()
+        menu = qtutils.create_menu('Status', self)
+        if s.staged:
+            action = menu.addAction(icons.remove(), N_('Unstage Selected'),
+                                    cmds.run(cmds.Unstage, s.staged))
+            action.setShortcut(hotkeys.STAGE_SELECTION)
+        elif s.unmerged or s.modified or s.untracked:
+            paths = s.unmerged + s.modified + s.untracked
+            action = menu.addAction(icons.add(), N_('Stage Selected'),
+                                    cmds.run(cmds.Stage, paths))
+            action.setShortcut(hotkeys.STAGE_SELECTION)
+        menu.addSeparator()
+        menu.addAction(self.copy_path_action)
+        menu.addAction(self.copy_relpath_action)
+        menu.exec_(self.mapToGlobal(event.pos()))
+
+
 class StatusFilterWidget(QtWidgets.QWidget):
 
     def __init__(self, parent=None):
@@ -927,3 +1277,95 @@ class StatusFilterWidget(QtWidgets.QWidget):
         self._filter = text
         paths = utils.shell_split(text)
         self.main_model.update_path_filter(paths)
+
+
+def show_nothing(model):
+    """Clear the diff when nothing is selected"""
+    if model.amending():
+        cmds.do(cmds.SetDiffText, '')
+    else:
+        cmds.do(cmds.ResetMode)
+
+
+def show_summary(category):
+    """Show the summary for a category header, e.g. 'Staged'"""
+    cls = {
+        StatusTreeWidget.idx_staged: cmds.DiffStagedSummary,
+        StatusTreeWidget.idx_modified: cmds.Diffstat,
+        # TODO implement UnmergedSummary
+        # StatusTreeWidget.idx_unmerged: cmds.UnmergedSummary,
+        StatusTreeWidget.idx_untracked: cmds.UntrackedSummary,
+    }.get(category, cmds.Diffstat)
+    cmds.do(cls)
+
+
+def show_path(category, path, deleted):
+    """Show the diff for a path in a category"""
+    if category == StatusTreeWidget.idx_staged:
+        cmds.do(cmds.DiffStaged, path, deleted=deleted)
+    elif category == StatusTreeWidget.idx_modified:
+        cmds.do(cmds.Diff, path, deleted=deleted)
+    elif category == StatusTreeWidget.idx_unmerged:
+        cmds.do(cmds.Diff, path)
+    elif category == StatusTreeWidget.idx_untracked:
+        cmds.do(cmds.ShowUntracked, path)
+
+
+def use_virtual_view(model):
+    """Return True when the change set is too large for StatusTreeWidget"""
+    total = (len(model.staged) + len(model.unmerged) +
+             len(model.modified) + len(model.untracked))
+    return total > VIRTUAL_VIEW_THRESHOLD
+
+
+def nearest_neighbor(items, idx, candidates):
+    """Return the item nearest to items[idx] that is in "candidates"
+
+    Later items are preferred, so the selection moves down the list.
+    Returns None when none of the other items are candidates.
+
+    """
+    count = len(items)
+    row = idx + 1
+    while row < count:
+        if items[row] in candidates:
+            return items[row]
+        row += 1
+    row = idx - 1
+    while row >= 0:
+        if items[row] in candidates:
+            return items[row]
+        row -= 1
+    return None
+
+
+def diff_paths(old, new):
+    """Return the row edits that turn the "old" list into the "new" list
+
+    Returns a (removed, inserted) tuple.  "removed" lists the rows of "old"
+    to remove, in descending order.  "inserted" lists (row, paths) runs to
+    insert, in ascending order, after the removals have been applied.
+    Returns None when the paths common to both lists are ordered differently.
+
+    """
+    new_set = set(new)
+    old_set = set(old)
+    removed = [row for row in range(len(old) - 1, -1, -1)
+               if old[row] not in new_set]
+    kept = [path for path in old if path in new_set]
+
+    inserted = []
+    run = None
+    kept_idx = 0
+    for row, path in enumerate(new):
+        if path in old_set:
+            if kept[kept_idx] != path:
+                return None
+            kept_idx += 1
+            run = None
+        elif run is None:
+            run = [path]
+            inserted.append((row, run))
+        else:
+            run.append(path)
+    return removed, inserted
@@ -736,16 +736,25 @@ class LineNumbers(TextDecorator):
     def __init__(self, parent):
         TextDecorator.__init__(self, parent)
         self.highlight_line = -1
+        # The line number of the first block, for partial documents
+        self.first_line = 0
 
     def width_hint(self):
         document = self.editor.document()
-        digits = int(math.log(max(1, document.blockCount()), 10))
+        last_line = document.blockCount() + self.first_line
+        digits = int(math.log(max(1, last_line), 10))
         return defs.margin + self.fontMetrics().width('0') * (digits + 2)
 
     def set_highlighted(self, line_number):
         """Set the line to highlight"""
         self.highlight_line = line_number
 
+    def set_first_line(self, first_line):
+        """Number the lines from `first_line` + 1"""
+        self.first_line = first_line
+        self.refresh_size()
+        self.update()
+
     def paintEvent(self, event):
         """Paint the line number"""
         QPalette = QtGui.QPalette
@@ -781,7 +790,7 @@ class LineNumbers(TextDecorator):
                 painter.fillRect(rect.x(), rect.y(),
                                  width, rect.height(), window)
 
-            number = '%s' % (block_number + 1)
+            number = '%s' % (block_number + self.first_line + 1)
             painter.drawText(rect.x(), rect.y(),
                              self.width() - (defs.margin * 2),
                              rect.height(),
@@ -0,0 +1,54 @@
+"""Benchmark completing refs and paths while a query is typed
+
+Usage: python -m test.benchmarks.completion [total-paths] [total-refs]
+
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from cola.widgets import completion
+
+
+def timed(label, func, *args):
+    start = time.time()
+    result = func(*args)
+    print('%-44s %.3fs' % (label, time.time() - start))
+    return result
+
+
+def type_query(query, ref_index, path_index):
+    slowest = 0.0
+    for end in range(1, len(query) + 1):
+        text = query[:end]
+        start = time.time()
+        ref_index.filter(text, False)
+        path_index.filter(text, False)
+        slowest = max(slowest, time.time() - start)
+    print('%-44s %.3fs' % ('slowest keystroke', slowest))
+
+
+def main_benchmark(total_paths, total_refs):
+    paths = ['dir%03d/sub%02d/file%06d.txt' % (i % 300, i % 17, i)
+             for i in range(total_paths)]
+    refs = ['origin/topic/branch%05d' % i for i in range(total_refs)]
+
+    ref_index = timed('index %d refs' % total_refs,
+                      completion.CompletionIndex, refs,
+                      completion.ref_sort_key)
+    path_index = timed('index %d paths' % total_paths,
+                       completion.path_index, paths)
+    timed('sort keys', lambda: (ref_index.entries(False),
+                                path_index.entries(False)))
+    timed('type "dir042/sub03/file"', type_query,
+          'dir042/sub03/file', ref_index, path_index)
+    timed('one-shot filter_path_matches("d")',
+          completion.filter_path_matches, 'd', paths, False)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    total_paths = args[0] if args else 300000
+    total_refs = args[1] if len(args) > 1 else 20000
+    main_benchmark(total_paths, total_refs)
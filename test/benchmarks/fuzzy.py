@@ -0,0 +1,51 @@
+"""Benchmark fuzzy ranking of a large list of paths
+
+Usage: python -m test.benchmarks.fuzzy [total-paths]
+
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from cola import fuzzy
+
+
+def timed(label, func, *args):
+    start = time.time()
+    result = func(*args)
+    print('%-44s %.3fs' % (label, time.time() - start))
+    return result
+
+
+def make_paths(total):
+    words = ('Controller', 'Model', 'View', 'util', 'test', 'core', 'io')
+    return ['src/pkg%03d/mod%02d/%s%s%06d.java' %
+            (i % 500, i % 37, words[i % 7], words[(i // 7) % 7], i)
+            for i in range(total)]
+
+
+def type_query(matcher, query):
+    first = full = 0.0
+    for end in range(1, len(query) + 1):
+        start = time.time()
+        for idx, results in enumerate(matcher.iter_ranked(query[:end])):
+            if idx == 0:
+                first = max(first, time.time() - start)
+        full = max(full, time.time() - start)
+    print('%-44s %.3fs' % ('slowest keystroke, first results', first))
+    print('%-44s %.3fs' % ('slowest keystroke, final results', full))
+
+
+def main_benchmark(total):
+    paths = make_paths(total)
+    matcher = timed('index %d paths' % total, fuzzy.Matcher, paths)
+    for query in ('viewctl', 'p042m1vc', 'utilio12345'):
+        timed('rank "%s"' % query, fuzzy.Matcher(paths).ranked, query)
+    timed('type "pkg042utiltest"', type_query, matcher, 'pkg042utiltest')
+    results = matcher.ranked('p042m1vc', 5)
+    print('\n'.join(results))
+
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,81 @@
+"""Benchmark selecting every path and refreshing the status afterwards
+
+Usage: python -m test.benchmarks.select_all [total-paths]
+
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from qtpy import QtWidgets
+
+from cola import icons
+from cola import qtutils
+from cola.models import main
+from cola.models import selection
+from cola.widgets import status
+
+
+def timed(label, func, *args):
+    start = time.time()
+    func(*args)
+    print('%-44s %.3fs' % (label, time.time() - start))
+
+
+def set_contents(model, modified, untracked):
+    model.staged = []
+    model.unmerged = []
+    model.modified = modified
+    model.untracked = untracked
+
+
+def update_tree(tree, model, modified, untracked):
+    tree.save_selection()
+    set_contents(model, modified, untracked)
+    tree.refresh()
+
+
+def update_view(view, model, modified, untracked):
+    set_contents(model, modified, untracked)
+    view.refresh()
+
+
+def main_benchmark(total):
+    app = QtWidgets.QApplication(sys.argv)
+    qtutils.install()
+    icons.install([])
+    model = main.model()
+    half = total // 2
+    paths = sorted('dir%03d/file%06d.txt' % (i % 100, i)
+                   for i in range(total))
+
+    sel = selection.SelectionModel()
+    state = selection.State([], [], [], list(paths))
+    set_contents(model, [], paths)
+    sel.set_selection(state)
+    model.untracked = paths[::2]
+    timed('SelectionModel.update(), %d selected' % total, sel.update, model)
+
+    # The tree widget normally hands off to the virtualized view
+    status.VIRTUAL_VIEW_THRESHOLD = total * 2
+    tree = status.StatusTreeWidget()
+    update_tree(tree, model, [], paths)
+    tree.selectAll()
+    timed('tree: select all, remove half', update_tree,
+          tree, model, [], paths[::2])
+    tree.selectAll()
+    timed('tree: select all, remove all', update_tree,
+          tree, model, [], [])
+
+    status.VIRTUAL_VIEW_THRESHOLD = 0
+    view = status.StatusTreeView()
+    update_view(view, model, [], paths)
+    view.selectAll()
+    timed('view: select all, remove half', update_view,
+          view, model, [], paths[:half])
+    app.quit()
+
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
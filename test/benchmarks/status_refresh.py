@@ -0,0 +1,63 @@
+"""Benchmark StatusTreeWidget.refresh() against the number of changed paths
+
+Usage: python -m test.benchmarks.status_refresh [total-paths]
+
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import time
+
+from qtpy import QtWidgets
+
+from cola import icons
+from cola import qtutils
+from cola.models import main
+from cola.widgets import status
+
+
+def changed_paths(paths, count):
+    """Replace every n-th path so that "count" paths change"""
+    if not count:
+        return list(paths)
+    step = max(1, len(paths) // count)
+    result = list(paths)
+    for idx in range(0, len(result), step)[:count]:
+        result[idx] = result[idx] + '.new'
+    return sorted(result)
+
+
+def refresh(tree, model, untracked):
+    model.untracked = untracked
+    start = time.time()
+    tree.refresh()
+    return time.time() - start
+
+
+def main_benchmark(total):
+    app = QtWidgets.QApplication(sys.argv)
+    qtutils.install()
+    icons.install([])
+    model = main.model()
+    model.staged = []
+    model.unmerged = []
+    model.modified = []
+    tree = status.StatusTreeWidget()
+
+    paths = ['dir%03d/file%06d.txt' % (i % 100, i) for i in range(total)]
+    paths.sort()
+    print('initial refresh of %d paths: %.3fs'
+          % (total, refresh(tree, model, paths)))
+
+    for count in (0, 1, 10, 100, 1000, 10000):
+        if count > total:
+            break
+        new_paths = changed_paths(paths, count)
+        elapsed = refresh(tree, model, new_paths)
+        print('%6d changed paths: %.3fs' % (count, elapsed))
+        refresh(tree, model, paths)
+    app.quit()
+
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
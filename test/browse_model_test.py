@@ -1,8 +1,11 @@
 """Covers interfaces used by the classic view."""
 from __future__ import absolute_import, division, unicode_literals
 
+import os
+
 from cola import core
 from cola import gitcmds
+from cola.models import browse
 from cola.models.main import MainModel
 
 from test import helper
@@ -55,3 +58,113 @@ class ClassicModelTestCase(helper.GitRepositoryTestCase):
 
         self.assertTrue('foo/bar/baz' in self.model.untracked)
         self.assertTrue('foo/bar/baz' not in self.model.staged)
+
+
+class StatusIndexTestCase(helper.GitRepositoryTestCase):
+    """Tests the browser's path to status mapping."""
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        self.model = MainModel(cwd=core.getcwd())
+        self.index = browse.StatusIndex(model=self.model)
+
+    def text(self, path):
+        return self.index.status(path)[1]
+
+    def test_status(self):
+        """Test the status of paths and their parent directories."""
+        core.makedirs('foo/bar')
+        self.touch('foo/bar/baz', 'foo/qux')
+        self.git('add', 'foo/bar/baz')
+        self.write_file('A', 'change')
+        self.git('add', 'A')
+        self.write_file('A', 'change again')
+        self.model.update_status()
+
+        self.assertEqual(self.text('A'), 'Partially Staged')
+        self.assertEqual(self.text('B'), '')
+        self.assertEqual(self.text('foo/bar/baz'), 'Staged')
+        self.assertEqual(self.text('foo/bar'), 'Staged')
+        self.assertEqual(self.text('foo/qux'), '?')
+        # Staged beats untracked for the shared parent directory
+        self.assertEqual(self.text('foo'), 'Staged')
+
+    def test_rebuilt_after_update(self):
+        """Test that the mapping is rebuilt when the model is updated."""
+        self.model.update_status()
+        self.assertEqual(self.text('A'), '')
+        self.write_file('A', 'change')
+        self.assertEqual(self.text('A'), '')
+        self.model.update_status()
+        self.assertEqual(self.text('A'), 'Modified')
+
+    def test_rebuilt_after_concurrent_build(self):
+        """Test that a mapping built during an update is not kept."""
+        self.model.update_status()
+        apply_scopes = self.model._apply_scopes
+
+        def build_and_apply_scopes(*args):
+            # A worker thread builds the mapping while the lists change
+            self.index.statuses()
+            apply_scopes(*args)
+
+        self.model._apply_scopes = build_and_apply_scopes
+        self.write_file('A', 'change')
+        self.model.update_status()
+        self.assertEqual(self.text('A'), 'Modified')
+
+
+class ListdirOverlayTestCase(helper.GitRepositoryTestCase):
+    """Tests the paths that the browser shows alongside the tree."""
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        self.model = MainModel(cwd=core.getcwd())
+        core.makedirs('dir')
+        self.touch('C', 'dir/D', 'E')
+        self.git('add', 'E')
+
+    def test_overlay(self):
+        """Test that the untracked and staged paths come from the model."""
+        self.model.update_status()
+        overlay = browse.listdir_overlay(self.model)
+        self.assertEqual(sorted(overlay), ['C', 'E', 'dir/D'])
+        gitcmds.set_listdir_overlay(overlay)
+        self.assertEqual(gitcmds.listdir('./'),
+                         (['dir'], ['A', 'B', 'C', 'E']))
+
+    def test_overlay_without_untracked(self):
+        """Test that hidden untracked files are still browsable."""
+        self.git('config', 'gui.displayuntracked', 'false')
+        self.model.update_status()
+        self.assertEqual(self.model.untracked, [])
+        self.assertEqual(browse.listdir_overlay(self.model), None)
+        gitcmds.set_listdir_overlay(browse.listdir_overlay(self.model))
+        self.assertEqual(gitcmds.listdir('./'), (['dir'], ['A', 'B', 'C']))
+
+
+class LastCommitsTestCase(helper.GitRepositoryTestCase):
+    """Tests the browser's cache of the last commit of each entry."""
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        os.mkdir('dir')
+        self.write_file(os.path.join('dir', 'C'), 'C')
+        self.git('add', 'dir')
+        self.git('commit', '-m', 'add dir')
+        self.last_commits = browse.LastCommits()
+
+    def test_get_root(self):
+        """Test the entries at the root of the repository."""
+        self.touch('untracked')
+        commits = self.last_commits.get('', ['A', 'dir', 'untracked'])
+        self.assertEqual(sorted(commits), ['A', 'dir'])
+        self.assertEqual(commits['A'][1], 'initial commit')
+        self.assertEqual(commits['dir'][1], 'add dir')
+
+    def test_get_subdirectory(self):
+        """Test the entries of a subdirectory."""
+        self.touch(os.path.join('dir', 'untracked'))
+        commits = self.last_commits.get('dir', ['dir/C', 'dir/untracked'])
+        self.assertEqual(sorted(commits), ['dir/C'])
+        self.assertEqual(commits['dir/C'][1], 'add dir')
@@ -0,0 +1,329 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import os
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+
+from cola import fsmonitor
+
+from test import helper
+
+
+class Thread(object):
+    ready = True
+    complete = True
+    pending = False
+
+    def has_pending_changes(self):
+        return self.pending
+
+
+class MonitorChangesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = fsmonitor._Monitor(None)
+        self.monitor._thread = Thread()
+
+    def test_changes_since(self):
+        """Test that changes are reported since a generation."""
+        generation, paths = self.monitor.changes_since(None)
+        self.assertEqual(paths, None)
+
+        self.monitor.record_changes(set(['a']))
+        self.monitor.record_changes(set(['b']))
+        next_generation, paths = self.monitor.changes_since(generation)
+        self.assertEqual(paths, set(['a', 'b']))
+        self.assertEqual(self.monitor.changes_since(next_generation),
+                         (next_generation, set()))
+
+    def test_unknown_changes(self):
+        """Test that overflows and forgotten changes are unknown."""
+        generation, paths = self.monitor.changes_since(None)
+        self.monitor.record_changes(None)
+        self.assertEqual(self.monitor.changes_since(generation)[1], None)
+
+        generation = self.monitor.generation
+        paths = set(str(i) for i in range(fsmonitor._Monitor.MAX_CHANGES))
+        self.monitor.record_changes(paths)
+        self.assertEqual(self.monitor.changes_since(generation)[1], paths)
+        self.monitor.record_changes(set(['a']))
+        self.assertEqual(self.monitor.changes_since(generation)[1], None)
+
+    def test_incomplete_monitor(self):
+        """Test that changes are unknown without complete coverage."""
+        generation, paths = self.monitor.changes_since(None)
+        self.monitor._thread.complete = False
+        self.assertEqual(self.monitor.changes_since(generation)[1], None)
+
+    def test_pending_changes(self):
+        """Test that changes are unknown while some wait to be reported."""
+        generation, paths = self.monitor.changes_since(None)
+        self.monitor._thread.pending = True
+        self.assertEqual(self.monitor.changes_since(generation)[1], None)
+        self.monitor._thread.pending = False
+        self.assertEqual(self.monitor.changes_since(generation)[1], set())
+
+
+class BaseThreadTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        self.monitor = fsmonitor._Monitor(None)
+        self.thread = fsmonitor._BaseThread(self.monitor)
+        self.emitted = []
+        self.monitor.files_changed.connect(
+                lambda: self.emitted.append('files'))
+        self.monitor.paths_changed.connect(self.emitted.append)
+        self.monitor.git_dir_changed.connect(self.emitted.append)
+
+    def delay(self):
+        """Return the seconds from the last event to the notification"""
+        thread = self.thread
+        return thread._notify_time() - thread._last_event_time
+
+    def test_has_pending_changes(self):
+        """Test that unreported worktree changes are pending."""
+        thread = self.thread
+        self.assertFalse(thread.has_pending_changes())
+        thread._git_dir_paths.add('index')
+        self.assertFalse(thread.has_pending_changes())
+        thread._file_paths.add('A')
+        self.assertTrue(thread.has_pending_changes())
+        thread.notify()
+        self.assertFalse(thread.has_pending_changes())
+
+    def test_single_change_delay(self):
+        """Test that isolated changes are reported after a short delay."""
+        self.thread._record_events(1)
+        min_delay = fsmonitor._BaseThread._MIN_DELAY / 1000.0
+        self.assertTrue(min_delay <= self.delay() < min_delay * 1.1)
+
+    def test_event_storm_delay(self):
+        """Test that the delay grows with the event rate, up to a bound."""
+        thread = self.thread
+        now = time.time()
+        thread._first_event_time = now - 1.0
+        thread._last_event_time = now
+        thread._event_count = 100
+        max_delay = fsmonitor._BaseThread._MAX_DELAY / 1000.0
+        min_delay = fsmonitor._BaseThread._MIN_DELAY / 1000.0
+        self.assertTrue(min_delay < self.delay() < max_delay)
+
+        thread._event_count = 1000000
+        self.assertAlmostEqual(self.delay(), max_delay, places=3)
+
+    def test_max_latency(self):
+        """Test that notifications are not postponed forever."""
+        thread = self.thread
+        now = time.time()
+        max_latency = fsmonitor._BaseThread._MAX_LATENCY / 1000.0
+        thread._first_event_time = now - max_latency + 0.5
+        thread._last_event_time = now
+        thread._event_count = 1000000
+        self.assertAlmostEqual(thread._notify_time(),
+                               thread._first_event_time + max_latency,
+                               places=3)
+
+    def test_refresh_duration_delay(self):
+        """Test that the GUI is left alone after an expensive refresh."""
+        thread = self.thread
+        thread._record_events(1)
+        thread._refresh_end_time = time.time()
+        thread._refresh_duration = 3.0
+        self.assertAlmostEqual(thread._notify_time(),
+                               thread._refresh_end_time + 3.0, places=3)
+
+    def test_in_flight(self):
+        """Test that notifications wait for the refreshes they trigger."""
+        thread = self.thread
+        thread._file_paths.add(os.path.join(thread._worktree or '', 'A'))
+        thread._emit([(self.monitor.files_changed, ()),
+                      (self.monitor.git_dir_changed, (set(['index']),))])
+        self.assertEqual(self.emitted, ['files', set(['index'])])
+        self.assertTrue(thread._in_flight())
+        self.assertFalse(thread._notify_due(quiet=False))
+
+        thread.refresh_finished(0.5)
+        self.assertTrue(thread._in_flight())
+        thread.refresh_finished(0.25)
+        self.assertFalse(thread._in_flight())
+        self.assertEqual(thread._refresh_duration, 0.75)
+
+    def test_in_flight_merged(self):
+        """Test that signals answered by one refresh are reported at once."""
+        thread = self.thread
+        thread._emit([(self.monitor.files_changed, ()),
+                      (self.monitor.git_dir_changed, (set(['index']),))])
+        self.monitor._thread = thread
+        self.monitor.refresh_finished(0.5, count=2)
+        self.assertFalse(thread._in_flight())
+        self.assertEqual(thread._refresh_duration, 0.5)
+
+    def test_in_flight_timeout(self):
+        """Test that lost refresh reports stop holding notifications."""
+        thread = self.thread
+        thread._emit([(self.monitor.files_changed, ())])
+        self.assertTrue(thread._in_flight())
+        timeout = fsmonitor._BaseThread._IN_FLIGHT_TIMEOUT / 1000.0
+        thread._in_flight_since -= timeout + 1.0
+        self.assertFalse(thread._in_flight())
+
+
+class PollThreadTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        os.mkdir('dir')
+        self.write_file(os.path.join('dir', 'C'), 'C')
+        self.git('add', 'dir')
+        self.git('commit', '-m', 'add dir')
+        self.thread = fsmonitor._PollThread(fsmonitor._Monitor(None))
+        self.thread._pool = ThreadPool(1)
+        self.thread._refresh()
+
+    def tearDown(self):
+        self.thread._pool.close()
+        self.thread._pool.join()
+        helper.GitRepositoryTestCase.tearDown(self)
+
+    def scan(self):
+        """Scan for changes and return the changed worktree paths"""
+        thread = self.thread
+        thread._scan()
+        prefix = thread._worktree + os.sep
+        paths = set(path[len(prefix):].replace(os.sep, '/')
+                    for path in thread._file_paths)
+        thread._file_paths = set()
+        return paths
+
+    def test_snapshot(self):
+        """Test that the tracked directories are scanned."""
+        thread = self.thread
+        self.assertTrue(thread._worktree in thread._worktree_snapshot)
+        self.assertTrue(os.path.join(thread._worktree, 'dir') in
+                        thread._worktree_snapshot)
+        self.assertEqual(self.scan(), set())
+
+    def test_add_modify_delete(self):
+        """Test that added, modified and deleted files are detected."""
+        self.write_file('new', 'new')
+        self.write_file('A', 'modified')
+        os.remove(os.path.join('dir', 'C'))
+        self.assertEqual(self.scan(), set(['new', 'A', 'dir/C']))
+        self.assertEqual(self.scan(), set())
+
+    def test_git_dir_changes(self):
+        """Test that changes inside .git are reported relative to it."""
+        self.git('branch', 'topic')
+        self.thread._scan()
+        self.assertTrue('refs/heads/topic' in self.thread._git_dir_paths)
+
+    def test_adapt_interval(self):
+        """Test that the interval backs off while idle and is bounded."""
+        thread = self.thread
+        min_interval = fsmonitor._PollThread._MIN_INTERVAL
+        max_interval = fsmonitor._PollThread._MAX_INTERVAL
+        thread._adapt_interval(0.0, False)
+        self.assertTrue(thread._interval > min_interval)
+        for i in range(20):
+            thread._adapt_interval(0.0, False)
+        self.assertEqual(thread._interval, max_interval)
+        thread._adapt_interval(0.0, True)
+        self.assertEqual(thread._interval, min_interval)
+        # Expensive scans are spaced out
+        thread._adapt_interval(1.0, True)
+        self.assertEqual(thread._interval,
+                         1.0 * fsmonitor._PollThread._COST_FACTOR)
+
+
+@unittest.skipIf(fsmonitor.AVAILABLE != 'inotify', 'requires inotify')
+class InotifyThreadTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        for name in ('a', 'b', 'c'):
+            os.mkdir(name)
+            self.touch(os.path.join(name, 'file'))
+        self.git('add', '.')
+        self.git('commit', '-m', 'add directories')
+        thread = self.thread = fsmonitor._InotifyThread(
+                fsmonitor._Monitor(None))
+        thread._use_check_ignore = False
+        thread._inotify_fd = fsmonitor.inotify.init()
+
+    def tearDown(self):
+        os.close(self.thread._inotify_fd)
+        helper.GitRepositoryTestCase.tearDown(self)
+
+    def path(self, name):
+        return os.path.join(self.thread._worktree, name)
+
+    def watched(self):
+        return set(self.thread._worktree_path_to_wd_map)
+
+    def test_refresh_watches_tracked_dirs(self):
+        """Test that every tracked directory is watched."""
+        thread = self.thread
+        thread._watch_budget = None
+        thread._refresh()
+        self.assertEqual(self.watched(),
+                         set([thread._worktree, self.path('a'),
+                              self.path('b'), self.path('c')]))
+        self.assertTrue(thread.complete)
+
+    def test_refresh_within_budget(self):
+        """Test that the watch limit is respected, shallow paths first."""
+        thread = self.thread
+        os.makedirs(os.path.join('a', 'deep'))
+        self.touch(os.path.join('a', 'deep', 'file'))
+        self.git('add', '.')
+        self.git('commit', '-m', 'add a deep directory')
+        thread._watch_budget = None
+        thread._refresh()
+        git_dir_watches = len(thread._git_dir_path_to_wd_map)
+        for path in list(self.watched()):
+            thread._remove_watch(path, thread._worktree_wd_to_path_map,
+                                 thread._worktree_path_to_wd_map)
+
+        thread._watch_budget = git_dir_watches + 4
+        thread._refresh()
+        self.assertEqual(thread.watch_count(), thread._watch_budget)
+        self.assertFalse(self.path(os.path.join('a', 'deep')) in
+                         self.watched())
+        self.assertFalse(thread.complete)
+
+    def test_evict_least_active(self):
+        """Test that new directories replace the least active watches."""
+        thread = self.thread
+        thread._watch_budget = None
+        thread._refresh()
+        thread._activity[self.path('a')] = 5
+        thread._activity[self.path('b')] = 1
+        thread._activity[self.path('c')] = 3
+        thread._watch_budget = thread.watch_count()
+
+        os.mkdir('d')
+        thread._new_dirs = set([self.path('d')])
+        thread._watch_new_dirs()
+        self.assertEqual(self.watched(),
+                         set([thread._worktree, self.path('a'),
+                              self.path('c'), self.path('d')]))
+        self.assertEqual(thread.watch_count(), thread._watch_budget)
+        self.assertFalse(thread.complete)
+
+    def test_watch_new_subdirectories(self):
+        """Test that directories created inside new ones are watched."""
+        thread = self.thread
+        thread._watch_budget = None
+        thread._refresh()
+        os.makedirs(os.path.join('d', 'e'))
+        thread._new_dirs = set([self.path('d')])
+        thread._watch_new_dirs()
+        self.assertTrue(self.path('d') in self.watched())
+        self.assertTrue(self.path(os.path.join('d', 'e')) in self.watched())
+        self.assertTrue(thread.complete)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import threading
+import unittest
+
+from cola import fuzzy
+
+
+class FuzzyTestCase(unittest.TestCase):
+
+    def test_score_subsequence(self):
+        """Test that only subsequences match, ignoring case."""
+        path = 'src/foo/bar/BazController.java'
+        self.assertTrue(fuzzy.score('bazctl', path) is not None)
+        self.assertTrue(fuzzy.score('BAZCTL', path) is not None)
+        self.assertTrue(fuzzy.score('ctlbaz', path) is None)
+        self.assertTrue(fuzzy.score('baz java', path) is not None)
+        self.assertTrue(fuzzy.score('baz python', path) is None)
+
+    def test_score_bonuses(self):
+        """Test that segment starts and camel-case humps score higher."""
+        self.assertTrue(fuzzy.score('fb', 'foo/bar') >
+                        fuzzy.score('fb', 'xfxxbx'))
+        self.assertTrue(fuzzy.score('bc', 'BazController') >
+                        fuzzy.score('bc', 'bazcontroller'))
+        self.assertTrue(fuzzy.score('abc', 'abc') >
+                        fuzzy.score('abc', 'axbxc'))
+
+    def test_lowercase_keeps_positions(self):
+        """Test that positions in lowercased text match the original."""
+        path = '\u0130dir/Foo.txt'
+        self.assertEqual(len(fuzzy.lowercase(path)), len(path))
+        self.assertEqual(fuzzy.lowercase('Foo/Bar'), 'foo/bar')
+        self.assertEqual(fuzzy.score('foo', path),
+                         fuzzy.score('foo', 'Xdir/Foo.txt'))
+        self.assertEqual(fuzzy.Matcher([path]).ranked('txt'), [path])
+
+    def test_ranked(self):
+        """Test that the best matches come first."""
+        paths = ['src/foo/bar/baz.c',
+                 'src/foo/bar/BazController.java',
+                 'src/foo/bar/Basic.java',
+                 'README']
+        matcher = fuzzy.Matcher(paths)
+        self.assertEqual(matcher.ranked('bazctl'),
+                         ['src/foo/bar/BazController.java'])
+        self.assertEqual(matcher.ranked('baz', limit=2),
+                         ['src/foo/bar/baz.c',
+                          'src/foo/bar/BazController.java'])
+        self.assertEqual(matcher.ranked('zzz'), [])
+        self.assertEqual(matcher.ranked(''), paths)
+
+    def test_ranked_narrows(self):
+        """Test that longer queries only search the previous matches."""
+        matcher = fuzzy.Matcher(['abc', 'abd', 'xyz'])
+        self.assertEqual(matcher.ranked('a'), ['abc', 'abd'])
+        self.assertEqual(matcher._last[1], [0, 1])
+        self.assertEqual(matcher.ranked('ac'), ['abc'])
+        self.assertEqual(matcher.ranked('x'), ['xyz'])
+
+    def test_iter_ranked(self):
+        """Test that results are yielded for each chunk of paths."""
+        paths = ['dir/file%03d.txt' % i for i in range(10)]
+        matcher = fuzzy.Matcher(paths)
+        chunk_size = fuzzy.CHUNK_SIZE
+        fuzzy.CHUNK_SIZE = 4
+        try:
+            results = list(matcher.iter_ranked('file', limit=3))
+        finally:
+            fuzzy.CHUNK_SIZE = chunk_size
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[-1], paths[:3])
+
+    def test_iter_ranked_cancel(self):
+        """Test that a cancelled search yields nothing."""
+        matcher = fuzzy.Matcher(['abc'])
+        cancel = threading.Event()
+        cancel.set()
+        self.assertEqual(list(matcher.iter_ranked('a', cancel=cancel)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
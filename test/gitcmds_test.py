@@ -1,8 +1,14 @@
 from __future__ import absolute_import, division, unicode_literals
 
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
 import unittest
 
+from cola import core
+from cola import git
 from cola import gitcmds
 from cola import gitcfg
 
@@ -122,6 +128,135 @@ class GitCmdsTestCase(helper.GitRepositoryTestCase):
                          ['origin/a', 'origin/b', 'origin/c', 'origin/master'])
         self.assertEqual(tags, ['d', 'e', 'f'])
 
+    def test_unstage_paths(self):
+        """Test unstaging paths, including ones with spaces."""
+        self.touch('C D')
+        self.git('add', 'C D')
+        self.write_file('A', 'change')
+        self.git('add', 'A')
+        gitcmds.unstage_paths(['A', 'C D'])
+        staged, unmerged, deleted, submodules = gitcmds.diff_index('HEAD')
+        self.assertEqual(staged, [])
+
+    def test_untrack_paths(self):
+        """Test untracking paths, including ones with spaces."""
+        self.touch('C D')
+        self.git('add', 'C D')
+        self.git('commit', '-m', 'add C D')
+        gitcmds.untrack_paths(['A', 'C D'])
+        self.assertEqual(gitcmds.tracked_files(), ['B'])
+
+    def test_listdir(self):
+        """Test listing tracked and untracked directory entries."""
+        core.makedirs('dir/sub')
+        self.touch('dir/sub/C', 'dir/D', 'E')
+        self.git('add', 'dir/sub/C')
+        self.git('commit', '-m', 'add dir')
+        self.assertEqual(gitcmds.listdir('./'), (['dir'], ['A', 'B', 'E']))
+        self.assertEqual(gitcmds.listdir('dir/'), (['dir/sub'], ['dir/D']))
+        self.assertEqual(gitcmds.listdir('dir/sub/'), ([], ['dir/sub/C']))
+
+    def test_listdir_overlay(self):
+        """Test that listdir() uses the overlay and follows HEAD."""
+        gitcmds.set_listdir_overlay(['new/F', 'G'])
+        self.assertEqual(gitcmds.listdir('./'), (['new'], ['A', 'B', 'G']))
+        self.assertEqual(gitcmds.listdir('new'), ([], ['new/F']))
+
+        self.touch('H')
+        self.git('add', 'H')
+        self.git('commit', '-m', 'add H')
+        gitcmds.set_listdir_overlay([])
+        self.assertEqual(gitcmds.listdir('./'), ([], ['A', 'B', 'H']))
+
+    def test_listdir_other_repository(self):
+        """Test that listdir() follows the current repository."""
+        gitcmds.set_listdir_overlay(['G'])
+        self.assertEqual(gitcmds.listdir('./'), ([], ['A', 'B', 'G']))
+
+        worktree = tempfile.mkdtemp('_cola_test')
+        self.addCleanup(shutil.rmtree, worktree,
+                        onerror=helper.remove_readonly)
+        subprocess.check_call(['git', 'init', '-q', worktree])
+        git.current().set_worktree(worktree)
+        self.addCleanup(git.current().set_worktree, core.getcwd())
+        self.assertEqual(gitcmds.listdir('./'), ([], []))
+
+    def test_parse_ls_tree_z(self):
+        """Test parsing "ls-tree -z" records of every object type."""
+        oid = 'c127cde9a0c644a3a8fef449a244f47d5272dfa6'
+        out = ('040000 tree %s\tdir name\0'
+               '100644 blob %s\tfile\twith tab\0'
+               '160000 commit %s\tsubmodule\0' % (oid, oid, oid))
+        self.assertEqual(gitcmds.parse_ls_tree_z(out), [
+            ('040000', 'tree', oid, 'dir name'),
+            ('100644', 'blob', oid, 'file\twith tab'),
+            ('160000', 'commit', oid, 'submodule'),
+        ])
+
+    def test_tree_entries(self):
+        """Test reading the entries of a single tree by oid."""
+        core.makedirs('dir')
+        self.touch('dir/C')
+        self.git('add', 'dir/C')
+        self.git('commit', '-m', 'add dir')
+        entries = gitcmds.tree_entries(gitcmds.tree_oid('HEAD'))
+        self.assertEqual([(objtype, name)
+                          for mode, objtype, oid, name in entries],
+                         [('blob', 'A'), ('blob', 'B'), ('tree', 'dir')])
+        entries = gitcmds.tree_entries(entries[2][2])
+        self.assertEqual([name for mode, objtype, oid, name in entries],
+                         ['C'])
+
+    def test_export_blob(self):
+        """Test streaming a binary blob into a file in chunks."""
+        data = bytes(bytearray(range(256))) * 4
+        with open('bin', 'wb') as fp:
+            fp.write(data)
+        self.git('add', 'bin')
+        self.git('commit', '-m', 'add bin')
+        calls = []
+        status, out, err = gitcmds.export_blob(
+                'HEAD:bin', 'saved', chunk_size=100,
+                progress=lambda written, total: calls.append((written, total)))
+        self.assertEqual(status, 0)
+        with open('saved', 'rb') as fp:
+            self.assertEqual(fp.read(), data)
+        self.assertEqual(len(calls), 11)
+        self.assertEqual(calls[0], (100, 1024))
+        self.assertEqual(calls[-1], (1024, 1024))
+
+    def test_export_blob_cancel(self):
+        """Test that a cancelled export removes the partial file."""
+        cancel = threading.Event()
+        cancel.set()
+        status, out, err = gitcmds.export_blob('HEAD:A', 'saved',
+                                               cancel=cancel)
+        self.assertNotEqual(status, 0)
+        self.assertFalse(os.path.exists('saved'))
+
+        status, out, err = gitcmds.export_blob('HEAD:missing', 'saved')
+        self.assertNotEqual(status, 0)
+        self.assertFalse(os.path.exists('saved'))
+
+    def test_last_commits(self):
+        """Test resolving the last commit of each directory entry."""
+        os.mkdir('dir')
+        self.write_file(os.path.join('dir', 'C D'), 'C')
+        self.git('add', 'dir')
+        self.git('commit', '-m', 'add dir')
+        self.write_file('A', 'change')
+        self.git('commit', '-a', '-m', 'change A')
+
+        commits = gitcmds.last_commits('./', ['A', 'B', 'dir', 'E'])
+        self.assertEqual(sorted(commits), ['A', 'B', 'dir'])
+        self.assertEqual(commits['A'][1], 'change A')
+        self.assertEqual(commits['B'][1], 'initial commit')
+        self.assertEqual(commits['dir'][1], 'add dir')
+        self.assertEqual(commits['A'][2], 'Your Name')
+
+        commits = gitcmds.last_commits('dir/', ['dir/C D'])
+        self.assertEqual(commits['dir/C D'][1], 'add dir')
+
 
 if __name__ == '__main__':
     unittest.main()
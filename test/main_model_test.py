@@ -73,6 +73,251 @@ class MainModelTestCase(helper.GitRepositoryTestCase):
         self.model.update_status()
         self.assertEqual(self.model.tags, ['test'])
 
+    def test_update_paths_status(self):
+        """Test merging pathspec-limited status into the file lists."""
+        self.write_file('A', 'change')
+        self.write_file('C', 'C')
+        self.model.update_status()
+        self.assertEqual(self.model.modified, ['A'])
+        self.assertEqual(self.model.untracked, ['C'])
+
+        self.write_file('B', 'change')
+        self.git('add', 'C')
+        self.write_file('D', 'D')
+        self.model.update_paths_status(['B', 'D'])
+        self.assertEqual(self.model.modified, ['A', 'B'])
+        # 'C' was not queried so it keeps its previous state
+        self.assertEqual(self.model.untracked, ['C', 'D'])
+        self.assertEqual(self.model.staged, [])
+
+        self.model.update_paths_status(['C'])
+        self.assertEqual(self.model.untracked, ['D'])
+        self.assertEqual(self.model.staged, ['C'])
+
+    def test_update_paths_status_removed_directory(self):
+        """Test that stale entries below a changed directory are dropped."""
+        os.mkdir('dir')
+        self.write_file(os.path.join('dir', 'file'), 'file')
+        self.model.update_status()
+        self.assertEqual(self.model.untracked, ['dir/file'])
+
+        os.remove(os.path.join('dir', 'file'))
+        os.rmdir('dir')
+        self.model.update_paths_status(['dir'])
+        self.assertEqual(self.model.untracked, [])
+
+    def test_update_scopes_remote_branches(self):
+        """Test that remote-branch updates leave the file lists alone."""
+        self.write_file('A', 'change')
+        self.git('remote', 'add', 'origin', '.')
+        self.model.update_status()
+        self.assertEqual(self.model.remote_branches, [])
+
+        self.write_file('B', 'change')
+        self.git('fetch', 'origin')
+        self.model.update_scopes([self.model.scope_remote_branches])
+        self.assertEqual(self.model.remote_branches, ['origin/master'])
+        self.assertEqual(self.model.modified, ['A'])
+
+    def test_update_scopes_local_branches_upstream(self):
+        """Test that moving the current branch refreshes upstream changes."""
+        self.write_file('A', 'change')
+        self.git('commit', '-m', 'change A', 'A')
+        self.git('remote', 'add', 'origin', '.')
+        self.git('fetch', 'origin')
+        self.git('branch', '--set-upstream-to=origin/master')
+        self.git('reset', '--hard', 'HEAD^')
+        self.model.update_status()
+        self.assertEqual(self.model.upstream_changed, ['A'])
+
+        self.git('merge', '--ff-only', 'origin/master')
+        self.model.update_scopes([self.model.scope_local_branches,
+                                  self.model.scope_state])
+        self.assertEqual(self.model.upstream_changed, [])
+
+    def test_update_scopes_head(self):
+        """Test that HEAD updates refresh the branch and file lists."""
+        self.model.update_status()
+        self.git('checkout', '-b', 'test')
+        self.write_file('A', 'change')
+        self.model.update_scopes([self.model.scope_head,
+                                  self.model.scope_local_branches])
+        self.assertEqual(self.model.currentbranch, 'test')
+        self.assertEqual(self.model.local_branches, ['master', 'test'])
+        self.assertEqual(self.model.modified, ['A'])
+
+    def test_update_status_applies_queries(self):
+        """Test that update_status() applies every query's result."""
+        self.write_file('A', 'change')
+        self.write_file('C', 'untracked')
+        self.git('add', 'A')
+        self.write_file('B', 'change')
+        self.model.update_status()
+        self.assertEqual(self.model.staged, ['A'])
+        self.assertEqual(self.model.modified, ['B'])
+        self.assertEqual(self.model.untracked, ['C'])
+        self.assertEqual(self.model.currentbranch, 'master')
+        self.assertEqual(self.model.local_branches, ['master'])
+        self.assertFalse(self.model.is_merging)
+
+    def test_stage_paths_refreshes_paths(self):
+        """Test that staging only re-queries the staged paths."""
+        self.write_file('A', 'change')
+        self.model.update_status()
+        self.write_file('B', 'change')
+        self.model.stage_paths(['A'])
+        self.assertEqual(self.model.staged, ['A'])
+        # B was not staged so the targeted update did not look at it
+        self.assertEqual(self.model.modified, [])
+
+    def test_stage_and_unstage_many_paths(self):
+        """Test staging more paths than fit in a single command line."""
+        paths = ['file%04d with spaces' % i for i in range(1000)]
+        self.touch(*paths)
+        self.model.update_status()
+        self.model.stage_paths(paths)
+        self.assertEqual(self.model.staged, sorted(paths))
+        self.assertEqual(self.model.untracked, [])
+
+        self.model.unstage_paths(paths)
+        self.assertEqual(self.model.staged, [])
+        self.assertEqual(self.model.untracked, sorted(paths))
+
+    def test_rename_branch(self):
+        """Test that renaming the current branch updates the branch lists."""
+        self.model.update_status()
+        self.model.rename_branch('master', 'main')
+        self.assertEqual(self.model.local_branches, ['main'])
+        self.assertEqual(self.model.currentbranch, 'main')
+
+    def test_update_paths_status_many_paths(self):
+        """Test that large path lists refresh the full file lists."""
+        self.write_file('A', 'change')
+        paths = ['path%d' % i for i in range(main.MAX_UPDATE_PATHS + 1)]
+        self.model.update_paths_status(paths)
+        self.assertEqual(self.model.modified, ['A'])
+
+    def test_refresh_index(self):
+        """Test that the index is refreshed only when needed."""
+        changes = {'generation': 0, 'paths': None}
+
+        def worktree_changes(generation):
+            return (changes['generation'], changes['paths'])
+
+        self.model.worktree_changes = worktree_changes
+        self.assertEqual(self.model.refresh_index(), 'full')
+
+        changes.update(generation=1, paths=set())
+        self.assertEqual(self.model.refresh_index(), 'skipped')
+
+        self.write_file('A', 'change')
+        changes.update(generation=2, paths=set(['A']))
+        self.assertEqual(self.model.refresh_index(), 'paths')
+
+        # The index was rewritten behind our back
+        self.git('add', 'A')
+        changes.update(generation=3, paths=set())
+        self.assertEqual(self.model.refresh_index(), 'full')
+
+        changes.update(generation=4, paths=None)
+        self.assertEqual(self.model.refresh_index(), 'full')
+
+    def test_refresh_index_after_staging(self):
+        """Test that cola's own index writes keep the index fresh."""
+        changes = {'generation': 0, 'paths': None}
+
+        def worktree_changes(generation):
+            if generation is None:
+                return (changes['generation'], None)
+            if generation == changes['generation']:
+                return (generation, set())
+            return (changes['generation'], changes['paths'])
+
+        self.model.worktree_changes = worktree_changes
+        self.model.update_status()
+        self.assertEqual(self.model.refresh_index(), 'full')
+
+        self.write_file('A', 'change')
+        self.write_file('B', 'change')
+        changes.update(generation=1, paths=set(['A', 'B']))
+        self.model.stage_paths(['A'])
+        # B changed but was not staged
+        self.assertEqual(self.model.refresh_index(), 'paths')
+
+        self.write_file('B', 'change again')
+        changes.update(generation=2, paths=set(['B']))
+        self.model.stage_paths(['B'])
+        self.assertEqual(self.model.refresh_index(), 'skipped')
+
+        self.model.unstage_paths(['A', 'B'])
+        self.assertEqual(self.model.refresh_index(), 'skipped')
+
+    def test_snapshot(self):
+        """Test that a saved snapshot is shown as stale until refreshed."""
+        filename = os.path.join(self.test_path(), 'snapshot.json')
+        self.write_file('A', 'change')
+        self.model.update_status()
+        self.assertTrue(self.model.save_snapshot(filename=filename))
+
+        model = main.MainModel(cwd=core.getcwd())
+        self.assertTrue(model.load_snapshot(filename=filename))
+        self.assertTrue(model.stale)
+        self.assertEqual(model.modified, ['A'])
+        self.assertEqual(model.local_branches, ['master'])
+        self.assertEqual(model.currentbranch, 'master')
+        # A stale model is not saved over the snapshot
+        self.assertEqual(model.save_snapshot(filename=filename), None)
+
+        model.update_status()
+        self.assertFalse(model.stale)
+
+    def test_snapshot_after_index_change(self):
+        """Test that snapshots taken before the index changed are ignored."""
+        filename = os.path.join(self.test_path(), 'snapshot.json')
+        self.model.update_status()
+        self.model.save_snapshot(filename=filename)
+        self.write_file('A', 'change')
+        self.git('add', 'A')
+        model = main.MainModel(cwd=core.getcwd())
+        self.assertFalse(model.load_snapshot(filename=filename))
+        self.assertEqual(model.staged, [])
+
+    def test_snapshot_while_amending(self):
+        """Test that snapshots are neither saved nor shown when amending."""
+        filename = os.path.join(self.test_path(), 'snapshot.json')
+        self.model.update_status()
+        self.model.save_snapshot(filename=filename)
+        model = main.MainModel(cwd=core.getcwd())
+        model.set_mode(model.mode_amend)
+        self.assertFalse(model.load_snapshot(filename=filename))
+        model.update_status()
+        self.assertEqual(model.save_snapshot(filename=filename), None)
+
+    def test_snapshot_at_another_head(self):
+        """Test that snapshots taken at another HEAD are ignored."""
+        filename = os.path.join(self.test_path(), 'snapshot.json')
+        self.model.update_status()
+        self.model.save_snapshot(filename=filename)
+        self.git('commit', '--allow-empty', '-m', 'empty')
+        model = main.MainModel(cwd=core.getcwd())
+        self.assertFalse(model.load_snapshot(filename=filename))
+        self.assertFalse(model.stale)
+
+
+class RunQueriesTestCase(unittest.TestCase):
+
+    def test_run_queries(self):
+        """Test that run_queries() returns each query's result by name."""
+        results = main.run_queries([('a', lambda: 1), ('b', lambda: 'b')])
+        self.assertEqual(results, {'a': 1, 'b': 'b'})
+
+    def test_run_queries_error(self):
+        """Test that errors raised by a query reach the caller."""
+        def fail():
+            raise ValueError('fail')
+        self.assertRaises(ValueError, main.run_queries,
+                          [('a', lambda: 1), ('fail', fail)])
+
 
 class RemoteArgsTestCase(unittest.TestCase):
 
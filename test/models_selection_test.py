@@ -22,6 +22,22 @@ class SelectionTestCase(unittest.TestCase):
         actual = selection.union(t)
         self.assertEqual(expect, actual)
 
+    def test_update_filters_in_place(self):
+        model = selection.SelectionModel()
+        untracked = ['a', 'b', 'c', 'd']
+        model.set_selection(selection.State([], [], [], untracked))
+        t = T()
+        t.staged = []
+        t.unmerged = []
+        t.modified = []
+        t.untracked = ['d', 'b', 'e']
+        model.update(t)
+        self.assertEqual(['b', 'd'], model.untracked)
+        self.assertTrue(model.untracked is untracked)
+
+    def test_index(self):
+        self.assertEqual({'a': 0, 'b': 1}, selection.index(['a', 'b']))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,37 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import unittest
+
+from cola.models import status
+
+
+class CategoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.paths = (['big/a/%d' % i for i in range(5)] +
+                      ['file', 'small/x', 'small/y'])
+        self.category = status.Category(self.paths, threshold=5)
+
+    def test_aggregates_large_directories(self):
+        self.assertEqual([('big/a/', 0, 5)], self.category.aggregates)
+        self.assertEqual(4, len(self.category))
+        self.assertEqual(self.paths[:5], self.category.paths_for_row(0))
+        self.assertEqual(['small/x'], self.category.paths_for_row(2))
+
+    def test_find(self):
+        self.assertEqual((0, 3), self.category.find('big/a/3'))
+        self.assertEqual((1, None), self.category.find('file'))
+        self.assertEqual((3, None), self.category.find('small/y'))
+        self.assertEqual(None, self.category.find('missing'))
+
+    def test_unsorted_paths_are_sorted(self):
+        category = status.Category(['b', 'a'])
+        self.assertEqual(['a', 'b'], category.paths)
+
+    def test_common_dirname(self):
+        self.assertEqual('a/b/', status.common_dirname('a/b/c', 'a/b/d/e'))
+        self.assertEqual('', status.common_dirname('abc', 'abd'))
+
+
+if __name__ == '__main__':
+    unittest.main()
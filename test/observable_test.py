@@ -0,0 +1,79 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import threading
+import unittest
+
+from cola.observable import Observable
+
+
+class Subject(Observable):
+    immediate_messages = ('about_to_change',)
+
+
+class ObservableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.subject = Subject()
+        self.received = []
+        for message in ('about_to_change', 'changed', 'text'):
+            self.subject.add_observer(message, self.observer(message))
+
+    def observer(self, message):
+        def observe(*args):
+            self.received.append((message,) + args)
+        return observe
+
+    def test_notify_observers(self):
+        """Test that notifications are delivered right away by default."""
+        self.subject.notify_observers('changed')
+        self.subject.notify_observers('changed')
+        self.assertEqual(self.received, [('changed',), ('changed',)])
+        self.assertEqual(self.subject.notification_counts, {'changed': 2})
+
+    def test_transaction_coalesces_messages(self):
+        """Test that duplicate messages are delivered once on commit."""
+        with self.subject.transaction():
+            self.subject.notify_observers('text', 'a')
+            self.subject.notify_observers('changed')
+            self.subject.notify_observers('text', 'b')
+            self.assertEqual(self.received, [])
+        self.assertEqual(self.received, [('text', 'b'), ('changed',)])
+        self.assertEqual(self.subject.notification_counts,
+                         {'text': 1, 'changed': 1})
+
+    def test_nested_transactions(self):
+        """Test that nested transactions deliver on the outermost commit."""
+        self.subject.begin()
+        self.subject.begin()
+        self.subject.notify_observers('changed')
+        self.subject.commit()
+        self.assertEqual(self.received, [])
+        self.subject.notify_observers('changed')
+        self.subject.commit()
+        self.assertEqual(self.received, [('changed',)])
+
+    def test_immediate_messages(self):
+        """Test that immediate messages are delivered once, right away."""
+        with self.subject.transaction():
+            self.subject.notify_observers('about_to_change')
+            self.subject.notify_observers('changed')
+            self.subject.notify_observers('about_to_change')
+            self.assertEqual(self.received, [('about_to_change',)])
+        self.assertEqual(self.received,
+                         [('about_to_change',), ('changed',)])
+
+    def test_other_threads(self):
+        """Test that transactions do not defer other threads' messages."""
+        with self.subject.transaction():
+            thread = threading.Thread(
+                    target=self.subject.notify_observers, args=('changed',))
+            thread.start()
+            thread.join()
+            self.assertEqual(self.received, [('changed',)])
+            self.subject.notify_observers('text', 'a')
+            self.assertEqual(self.received, [('changed',)])
+        self.assertEqual(self.received, [('changed',), ('text', 'a')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import threading
+import unittest
+
+from cola import core
+from cola import refresh
+from cola.models import main
+from cola.models.main import MainModel
+
+from test import helper
+
+
+class RequestTestCase(unittest.TestCase):
+
+    def test_merge_scopes_and_paths(self):
+        """Test that merged requests keep the union of their work."""
+        request = refresh.Request(scopes=[MainModel.scope_tags],
+                                  paths=['a'])
+        request.merge(refresh.Request(paths=['b'], update_index=True,
+                                      priority=refresh.USER))
+        self.assertEqual(request.scopes, set([MainModel.scope_tags]))
+        self.assertEqual(request.paths, set(['a', 'b']))
+        self.assertTrue(request.update_index)
+        self.assertTrue(request.is_user())
+        self.assertEqual(request.count, 2)
+
+    def test_merge_drops_paths(self):
+        """Test that paths are dropped once the file lists are refreshed."""
+        request = refresh.Request(paths=['a'])
+        request.merge(refresh.Request(scopes=[MainModel.scope_index]))
+        self.assertEqual(request.paths, set())
+
+    def test_covers(self):
+        full = refresh.Request(scopes=MainModel.scopes_all)
+        paths = refresh.Request(paths=['a'])
+        self.assertTrue(full.covers(paths))
+        self.assertFalse(paths.covers(full))
+
+    def test_covers_update_index(self):
+        """Test that a refresh without update_index leaves stale stat data"""
+        full = refresh.Request(scopes=MainModel.scopes_all)
+        refreshed = refresh.Request(scopes=MainModel.scopes_all,
+                                    update_index=True)
+        self.assertTrue(refreshed.covers(full))
+        self.assertFalse(full.covers(refreshed))
+
+
+class Monitor(object):
+    """Records the refreshes reported to the filesystem monitor"""
+
+    def __init__(self):
+        self.finished = 0
+
+    def refresh_finished(self, elapsed, count=1):
+        self.finished += count
+
+    def refresh(self):
+        pass
+
+
+class RefreshSchedulerTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        self.model = main.MainModel(cwd=core.getcwd())
+        self.monitor = Monitor()
+        self.scheduler = refresh.RefreshScheduler(model=self.model,
+                                                  monitor=self.monitor)
+
+    def test_requests_are_merged(self):
+        """Test that pending requests are merged into a single refresh."""
+        self.write_file('A', 'change')
+        self.scheduler.request(paths=['A'])
+        self.scheduler.request(scopes=[MainModel.scope_local_branches])
+        self.assertEqual(self.scheduler.queue_depth(), 2)
+
+        self.scheduler.flush()
+        self.assertEqual(self.scheduler.queue_depth(), 0)
+        self.assertEqual(self.scheduler.completed, 1)
+        self.assertEqual(self.model.modified, ['A'])
+        self.assertEqual(self.model.local_branches, ['master'])
+
+    def test_merged_monitor_signals(self):
+        """Test that each merged monitor signal is reported as finished."""
+        self.scheduler.request(paths=['A'], monitor=True)
+        self.scheduler.request(scopes=[MainModel.scope_local_branches],
+                               monitor=True)
+        self.scheduler.refresh()
+        self.assertEqual(self.scheduler.pending.signals, 2)
+
+        self.scheduler.flush()
+        self.assertEqual(self.scheduler.completed, 1)
+        self.assertEqual(self.monitor.finished, 2)
+
+    def test_superseded_monitor_signals(self):
+        """Test that superseded requests report their monitor signals."""
+        self.scheduler.request(paths=['A'], monitor=True)
+        request = self.scheduler.pending
+        self.scheduler.pending = None
+        cancel = threading.Event()
+        self.scheduler.running = (request, cancel)
+
+        self.scheduler.refresh()
+        self.assertTrue(cancel.is_set())
+        # The superseded worker is still running, so nothing else may run
+        self.assertEqual(self.scheduler.running, (request, cancel))
+        self.assertEqual(self.scheduler.queue_depth(), 2)
+        self.assertEqual(self.monitor.finished, 0)
+
+        self.scheduler._finished((request, cancel, None, None, 0.0, 0))
+        self.assertEqual(self.scheduler.running, None)
+        self.assertEqual(self.monitor.finished, 1)
+        self.scheduler.flush()
+        self.assertEqual(self.scheduler.completed, 1)
+        self.assertEqual(self.monitor.finished, 1)
+
+    def test_failed_monitor_signals(self):
+        """Test that failed refreshes report their monitor signals."""
+        self.scheduler.request(paths=['A'], monitor=True)
+        request = self.scheduler.pending
+        self.scheduler.pending = None
+        cancel = threading.Event()
+        self.scheduler.running = (request, cancel)
+        error = Exception('git failed')
+        result = (request, cancel, None, error, 0.0, self.model.generation)
+        self.scheduler._finished(result)
+        self.assertEqual(self.scheduler.running, None)
+        self.assertEqual(self.monitor.finished, 1)
+
+    def test_own_index_writes(self):
+        """Test that index events caused by staging skip the full scan."""
+        self.write_file('A', 'change')
+        self.scheduler.refresh()
+        self.scheduler.flush()
+        self.model.stage_paths(['A'])
+        self.assertEqual(self.model.staged, ['A'])
+
+        self.scheduler.request(scopes=[MainModel.scope_index],
+                               update_index=True, monitor=True)
+        self.assertEqual(self.scheduler.pending, None)
+        self.assertEqual(self.monitor.finished, 1)
+
+        # Index writes by other processes are still picked up
+        self.write_file('B', 'change')
+        self.git('add', 'B')
+        self.scheduler.request(scopes=[MainModel.scope_index],
+                               update_index=True, monitor=True)
+        self.scheduler.flush()
+        self.assertEqual(self.model.staged, ['A', 'B'])
+        self.assertEqual(self.monitor.finished, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import os
+import unittest
+
+from cola.widgets import browse
+
+from test import helper
+
+
+class SaveBlobTaskTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        self.finished = []
+
+    def run_task(self, filename):
+        model = browse.BrowseModel('HEAD', filename='A')
+        model.filename = filename
+        task = browse.SaveBlobTask(model, None)
+        task.channel.finished.connect(self.finished.append)
+        task.run()
+        return task
+
+    def test_save(self):
+        """Test that the blob is saved and the task finishes."""
+        self.write_file('A', 'A')
+        self.git('commit', '-a', '-m', 'change A')
+        task = self.run_task('saved')
+        self.assertEqual(self.finished, [task])
+        self.assertEqual(task.result, 0)
+        with open('saved') as f:
+            self.assertEqual(f.read(), 'A')
+
+    def test_save_error(self):
+        """Test that errors finish the task with an error status."""
+        task = self.run_task(os.path.join('missing', 'saved'))
+        self.assertEqual(self.finished, [task])
+        self.assertNotEqual(task.result, 0)
+        self.assertTrue(task.cmd.err)
+        self.assertNotEqual(browse.blob_saved(task), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import threading
+import unittest
+
+from cola import fuzzy
+from cola.widgets import completion
+
+from test import helper
+
+
+class CompletionIndexTestCase(unittest.TestCase):
+
+    def test_filter_matches(self):
+        """Test substring matching in sort order."""
+        refs = ['origin/master', 'master', 'Maint', 'topic']
+        index = completion.CompletionIndex(refs,
+                                           sort_key=completion.ref_sort_key)
+        self.assertEqual(index.filter('ma', False),
+                         ['Maint', 'master', 'origin/master'])
+        self.assertEqual(index.filter('Ma', True), ['Maint'])
+        self.assertEqual(index.filter('', False),
+                         ['Maint', 'topic', 'master', 'origin/master'])
+
+    def test_filter_narrows_previous_matches(self):
+        """Test that longer queries filter the previous matches."""
+        index = completion.CompletionIndex(['abc', 'abd', 'xyz'])
+        self.assertEqual(index.filter('a', False), ['abc', 'abd'])
+        # Only the previous matches are candidates for a longer query
+        index._entries[False] = ([], [])
+        self.assertEqual(index.filter('ab', False), ['abc', 'abd'])
+        self.assertEqual(index.filter('abd', False), ['abd'])
+        # Backspacing returns to the earlier matches
+        self.assertEqual(index.filter('ab', False), ['abc', 'abd'])
+        # Unrelated queries filter all of the candidates again
+        self.assertEqual(index.filter('x', False), [])
+
+    def test_filter_histories(self):
+        """Test that consumers of a shared index keep their own matches."""
+        index = completion.CompletionIndex(['abc', 'abd', 'xyz'])
+        first = {}
+        second = {}
+        self.assertEqual(index.filter('ab', False, history=first),
+                         ['abc', 'abd'])
+        self.assertEqual(index.filter('x', False, history=second), ['xyz'])
+        self.assertEqual([query for query, keys, values in first[False]],
+                         ['ab'])
+        self.assertEqual([query for query, keys, values in second[False]],
+                         ['x'])
+
+    def test_filter_cancel(self):
+        """Test that a cancelled filter returns no matches."""
+        index = completion.CompletionIndex(['abc', 'abd'])
+        cancel = threading.Event()
+        cancel.set()
+        self.assertEqual(index.filter('a', False, cancel=cancel), [])
+        self.assertEqual(index.filter('a', False), ['abc', 'abd'])
+
+    def test_path_index(self):
+        """Test that parent directories are completed too."""
+        index = completion.path_index(['a/b/c.txt', 'a/d.txt', 'e.txt'])
+        self.assertEqual(index.dirs, set(['a', 'a/b']))
+        self.assertEqual(index.filter('a/', False),
+                         ['a/b', 'a/b/c.txt', 'a/d.txt'])
+
+    def test_filter_path_matches(self):
+        """Test the one-shot path filter."""
+        paths, dirs = completion.filter_path_matches('B', ['a/b.txt'], False)
+        self.assertEqual(paths, ['a/b.txt'])
+        self.assertEqual(dirs, set(['a']))
+
+    def test_extend_fuzzy_matches(self):
+        """Test that fuzzy matches follow the substring matches."""
+        matcher = fuzzy.Matcher(['a/bc.txt', 'abc', 'xyz'])
+        paths = completion.extend_fuzzy_matches(['abc'], matcher, 'abc')
+        self.assertEqual(paths, ['abc', 'a/bc.txt'])
+        paths = completion.extend_fuzzy_matches(['abc'], matcher, 'abc',
+                                                limit=1)
+        self.assertEqual(paths, ['abc'])
+
+
+class CompletionProviderTestCase(unittest.TestCase):
+
+    def test_index_is_shared_per_key(self):
+        """Test that indexes are only built again when their data changes."""
+        provider = completion.CompletionProvider()
+        built = []
+
+        def factory():
+            built.append(len(built))
+            return completion.CompletionIndex(['a'])
+
+        key = (('master',), ())
+        index = provider.index('refs', factory, key=key)
+        self.assertTrue(provider.index('refs', factory, key=key) is index)
+        self.assertTrue(provider.index('refs', factory,
+                                       key=(('master',), ())) is index)
+        self.assertEqual(built, [0])
+
+        changed = provider.index('refs', factory, key=(('master',), ('v1',)))
+        self.assertFalse(changed is index)
+        self.assertEqual(built, [0, 1])
+
+        provider.reset()
+        provider.index('refs', factory, key=(('master',), ('v1',)))
+        self.assertEqual(built, [0, 1, 2])
+
+
+class TrackedFilesTestCase(helper.GitRepositoryTestCase):
+
+    def test_tracked_files_follow_the_index(self):
+        """Test that the tracked files are listed again after git add."""
+        provider = completion.CompletionProvider()
+        self.assertEqual(provider.tracked_files(), ['A', 'B'])
+        matcher = provider.tracked_matcher()
+        self.assertTrue(provider.tracked_matcher() is matcher)
+
+        self.touch('C')
+        self.git('add', 'C')
+        self.assertEqual(provider.tracked_files(), ['A', 'B', 'C'])
+        self.assertEqual(provider.tracked_matcher().ranked('c'), ['C'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import os
+import unittest
+
+from cola.widgets import finder
+
+from test import helper
+
+
+class FindFilesThreadTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        os.mkdir('src')
+        self.touch('a.py', os.path.join('src', 'b.py'),
+                   os.path.join('src', 'c'))
+        self.git('add', '.')
+        self.git('commit', '-m', 'add files')
+        self.results = []
+
+    def search(self, query):
+        thread = finder.FindFilesThread(None)
+        thread.result.connect(self.results.append)
+        thread.query = query
+        thread.run()
+        return self.results[-1]
+
+    def test_glob(self):
+        """Test that queries with wildcards are matched as pathspecs."""
+        self.assertEqual(self.search('*.py'), ['a.py', 'src/b.py'])
+        self.assertEqual(self.search('src/*.py'), ['src/b.py'])
+        self.assertEqual(self.search('src/?.py'), ['src/b.py'])
+        self.assertEqual(self.search('[ab].py'), ['a.py', 'src/b.py'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import unittest
+
+from cola.widgets import grep
+
+from test import helper
+
+
+class GrepThreadTestCase(helper.GitRepositoryTestCase):
+
+    def setUp(self):
+        helper.GitRepositoryTestCase.setUp(self)
+        self.thread = grep.GrepThread(None)
+        self.thread.lines.connect(self.append_lines)
+        self.thread.result.connect(self.set_result)
+        self.lines = []
+        self.result = None
+
+    def append_lines(self, serial, lines):
+        self.lines.append(list(lines))
+
+    def set_result(self, serial, status, err):
+        self.result = (serial, status)
+
+    def test_command(self):
+        """Test the git grep command line for a query."""
+        thread = self.thread
+        thread.query = '-i "a b"'
+        self.assertEqual(thread.command(),
+                         ['git', 'grep', '--basic-regexp', '-n', '-i "a b"'])
+        thread.shell = True
+        thread.threads = 4
+        self.assertEqual(thread.command(),
+                         ['git', 'grep', '--basic-regexp', '-n',
+                          '--threads=4', '-i', 'a b'])
+
+    def test_run_streams_batches(self):
+        """Test that results are emitted in batches."""
+        self.write_file('C', ''.join('match %d\n' % i for i in range(5)))
+        self.git('add', 'C')
+        thread = self.thread
+        thread.BATCH_SIZE = 2
+        thread.BATCH_INTERVAL = 60
+        thread.query = 'match'
+        thread.serial = 7
+        thread.run()
+        self.assertEqual(self.lines, [['C:1:match 0', 'C:2:match 1'],
+                                      ['C:3:match 2', 'C:4:match 3'],
+                                      ['C:5:match 4']])
+        self.assertEqual(self.result, (7, 0))
+
+    def test_run_no_matches(self):
+        """Test that a search without results reports git's status."""
+        self.thread.query = 'nomatch'
+        self.thread.run()
+        self.assertEqual(self.lines, [])
+        self.assertEqual(self.result, (0, 1))
+
+
+class PreviewFileTestCase(helper.GitRepositoryTestCase):
+
+    def test_lines(self):
+        """Test reading windows of lines."""
+        self.write_file('C', 'one\ntwo\nthree\n')
+        preview = grep.PreviewFile('C')
+        self.assertEqual(preview.lines(0, 1), ('one', 1))
+        self.assertEqual(preview._offsets, [0, 4])
+        self.assertEqual(preview.lines(1, 10), ('two\nthree', 3))
+        self.assertEqual(preview.lines(5, 10), ('', 3))
+        self.assertEqual(preview.line_count(), 3)
+
+    def test_lines_without_trailing_newline(self):
+        """Test files that do not end in a newline, and empty files."""
+        self.write_file('C', 'one\n\nthree')
+        preview = grep.PreviewFile('C')
+        self.assertEqual(preview.line_count(), 3)
+        self.assertEqual(preview.lines(1, 3), ('\nthree', 3))
+
+        self.write_file('D', '')
+        preview = grep.PreviewFile('D')
+        self.assertEqual(preview.lines(0, 10), ('', 1))
+
+    def test_cache_invalidation(self):
+        """Test that modified files are mapped again."""
+        self.write_file('C', 'one\n')
+        cache = grep.PreviewCache()
+        preview = cache.get('C')
+        self.assertTrue(cache.get('C') is preview)
+
+        self.write_file('C', 'one\ntwo\n')
+        self.assertFalse(preview.is_current())
+        preview = cache.get('C')
+        self.assertEqual(preview.lines(0, 2), ('one\ntwo', 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
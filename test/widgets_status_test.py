@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import unittest
+
+from cola.widgets import status
+
+
+def apply_edits(old, edits):
+    result = list(old)
+    removed, inserted = edits
+    for row in removed:
+        del result[row]
+    for row, paths in inserted:
+        result[row:row] = paths
+    return result
+
+
+class DiffPathsTestCase(unittest.TestCase):
+
+    def test_diff_paths_unchanged(self):
+        old = ['a', 'b', 'c']
+        self.assertEqual(([], []), status.diff_paths(old, list(old)))
+
+    def test_diff_paths_insert_and_remove(self):
+        old = ['a', 'b', 'd', 'e']
+        new = ['a', 'c', 'd', 'f', 'g']
+        edits = status.diff_paths(old, new)
+        self.assertEqual([3, 1], edits[0])
+        self.assertEqual([(1, ['c']), (3, ['f', 'g'])], edits[1])
+        self.assertEqual(new, apply_edits(old, edits))
+
+    def test_diff_paths_from_empty(self):
+        new = ['a', 'b']
+        edits = status.diff_paths([], new)
+        self.assertEqual(([], [(0, ['a', 'b'])]), edits)
+
+    def test_diff_paths_to_empty(self):
+        old = ['a', 'b']
+        self.assertEqual(([1, 0], []), status.diff_paths(old, []))
+
+    def test_diff_paths_reordered(self):
+        self.assertEqual(None, status.diff_paths(['a', 'b'], ['b', 'a']))
+
+
+class NearestNeighborTestCase(unittest.TestCase):
+
+    def test_nearest_neighbor_after(self):
+        items = ['a', 'b', 'c', 'd']
+        self.assertEqual('d', status.nearest_neighbor(items, 1,
+                                                      set(['a', 'd'])))
+
+    def test_nearest_neighbor_before(self):
+        items = ['a', 'b', 'c', 'd']
+        self.assertEqual('b', status.nearest_neighbor(items, 3,
+                                                      set(['a', 'b'])))
+
+    def test_nearest_neighbor_none(self):
+        self.assertEqual(None, status.nearest_neighbor(['a', 'b'], 0,
+                                                       set(['c'])))
+
+
+if __name__ == '__main__':
+    unittest.main()